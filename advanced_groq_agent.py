@@ -3,7 +3,7 @@ import json
 import logging
 import asyncio
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator
 from dotenv import load_dotenv
 
 from livekit import agents
@@ -14,7 +14,15 @@ from livekit.agents.llm.llm import ChatContext, ChatMessage
 from livekit.agents.llm.llm import RoomOutputOptions
 from livekit.agents.llm.llm import AutoSubscribe
 import assemblyai
-import groq
+from llm_gateway import get_llm_gateway
+from response_streaming import stream_llm_sentences, single_sentence
+from barge_in import BargeInController
+from conversation_history import ConversationHistory
+from keyword_engine import get_keyword_engine
+from intent_router import IntentRouter
+from response_cache import get_response_cache
+from prompt_builder import PromptBuilder
+from arithmetic import calculate, format_number
 
 load_dotenv()
 logging.basicConfig(
@@ -32,10 +40,12 @@ class AdvancedGroqAgent(Agent):
             stt=assemblyai.STT(),
         )
         
-        # Inicializar cliente Groq
-        self.groq_client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.conversation_history = []
-        self.max_history = 15
+        # Gateway assíncrono compartilhado (não bloqueia o event loop)
+        self.llm_gateway = get_llm_gateway()
+        # Histórico limitado por tokens; o que sai da janela vira resumo
+        self.conversation_history = ConversationHistory(token_budget=800, summarizer=self.llm_gateway, name="advanced_groq")
+        self.streaming_enabled = os.getenv("GROQ_STREAMING", "true").lower() == "true"
+        self.barge_in = BargeInController("advanced_groq")
         
         # Personalidades disponíveis
         self.personalities = {
@@ -68,15 +78,38 @@ class AdvancedGroqAgent(Agent):
         # Personalidade atual
         self.current_personality = "assistant"
         
-        # Funcionalidades especiais
+        # Um prompt de sistema compilado por personalidade (prefixo estável entre turnos)
+        self.prompts = {
+            key: PromptBuilder(
+                f"""{personality['system_prompt']}
+                
+                Personalidade atual: {personality['name']}
+                Tom: {personality['tone']}
+                Estilo: {personality['style']}
+                
+                Regras:
+                1. Mantenha respostas curtas para conversas em tempo real
+                2. Seja natural e contextual
+                3. Use a personalidade definida consistentemente
+                4. Seja útil e preciso""",
+                name=f"advanced_groq:{key}",
+            )
+            for key, personality in self.personalities.items()
+        }
+        
+        # Funcionalidades especiais (recebem o texto do usuário)
         self.special_functions = {
-            "weather": self.get_weather_info,
-            "time": self.get_time_info,
-            "joke": self.get_joke,
-            "quote": self.get_inspirational_quote,
+            "weather": lambda text: self.get_weather_info(),
+            "time": lambda text: self.get_time_info(),
+            "joke": lambda text: self.get_joke(),
+            "quote": lambda text: self.get_inspirational_quote(),
             "calculator": self.simple_calculation,
             "translator": self.translate_text
         }
+        # Roteador local: funcionalidades especiais e pedidos simples sem chamar o Groq
+        self.router = IntentRouter(handlers=self.special_functions, name="advanced_groq")
+        # Respostas do LLM reaproveitadas quando a mesma pergunta se repete
+        self.response_cache = get_response_cache()
         
         # Métricas da sessão
         self.session_metrics = {
@@ -91,51 +124,15 @@ class AdvancedGroqAgent(Agent):
 
     def update_conversation_history(self, message: str, is_user: bool = True):
         """Atualiza o histórico de conversa"""
-        self.conversation_history.append({
-            "role": "user" if is_user else "assistant",
-            "content": message,
-            "timestamp": datetime.now().isoformat(),
-            "personality": self.current_personality
-        })
-        
-        if len(self.conversation_history) > self.max_history * 2:
-            self.conversation_history = self.conversation_history[-self.max_history * 2:]
+        self.conversation_history.add(
+            "user" if is_user else "assistant",
+            message,
+            personality=self.current_personality
+        )
 
     def detect_personality_change(self, text: str) -> Optional[str]:
         """Detecta se o usuário quer mudar a personalidade"""
-        text_lower = text.lower()
-        
-        personality_triggers = {
-            "teacher": ["professor", "ensinar", "explicar", "educativo", "aula"],
-            "friend": ["amigo", "amigável", "casual", "descontraído", "conversa"],
-            "coach": ["coach", "motivar", "inspirar", "energia", "motivação"],
-            "assistant": ["assistente", "ajudar", "profissional", "formal"]
-        }
-        
-        for personality, triggers in personality_triggers.items():
-            if any(trigger in text_lower for trigger in triggers):
-                return personality
-        
-        return None
-
-    def detect_special_function(self, text: str) -> Optional[str]:
-        """Detecta se o usuário quer usar uma funcionalidade especial"""
-        text_lower = text.lower()
-        
-        function_triggers = {
-            "weather": ["clima", "tempo", "temperatura", "chuva", "sol"],
-            "time": ["horas", "que horas", "que dia", "data", "agora"],
-            "joke": ["piada", "engraçado", "humor", "rir", "divertido"],
-            "quote": ["frase", "inspiração", "motivação", "citação"],
-            "calculator": ["calcular", "conta", "matemática", "soma", "multiplicar"],
-            "translator": ["traduzir", "inglês", "espanhol", "idioma"]
-        }
-        
-        for function, triggers in function_triggers.items():
-            if any(trigger in text_lower for trigger in triggers):
-                return function
-        
-        return None
+        return get_keyword_engine().match(text).first("personality")
 
     async def get_weather_info(self, location: str = "São Paulo") -> str:
         """Simula informações do clima"""
@@ -167,15 +164,11 @@ class AdvancedGroqAgent(Agent):
         return random.choice(quotes)
 
     async def simple_calculation(self, expression: str) -> str:
-        """Realiza cálculos simples"""
-        try:
-            # Remover palavras e manter apenas números e operadores
-            import re
-            clean_expr = re.sub(r'[^\d\+\-\*\/\(\)\.]', '', expression)
-            result = eval(clean_expr)
-            return f"O resultado de {expression} é {result}"
-        except:
+        """Realiza cálculos simples (aceita números por extenso: "doze vezes sete")"""
+        result = calculate(expression)
+        if result is None:
             return "Desculpe, não consegui fazer esse cálculo. Pode ser mais específico?"
+        return f"O resultado é {format_number(result[1])}."
 
     async def translate_text(self, text: str, target_lang: str = "inglês") -> str:
         """Simula tradução de texto"""
@@ -200,69 +193,49 @@ class AdvancedGroqAgent(Agent):
         
         return f"Tradução de '{text}' para {target_lang}: [Tradução simulada]"
 
+    async def handle_local_functions(self, user_message: str) -> Optional[str]:
+        """Aplica mudança de personalidade, executa funcionalidades especiais e consulta o cache"""
+        # Verificar mudança de personalidade
+        new_personality = self.detect_personality_change(user_message)
+        if new_personality and new_personality != self.current_personality:
+            self.current_personality = new_personality
+            self.session_metrics["personality_changes"] += 1
+            logger.info(f"Personalidade alterada para: {new_personality}")
+
+        # Funcionalidades especiais: classificação local com limiar de confiança
+        local_result = await self.router.try_local(user_message)
+        if local_result is not None:
+            self.session_metrics["special_functions_used"] += 1
+            return local_result
+
+        # Pergunta repetida: resposta do cache da personalidade atual, sem ida ao Groq
+        return self.response_cache.get(user_message, self.cache_namespace, self.conversation_history)
+
+    @property
+    def cache_namespace(self) -> str:
+        """Cache separado por personalidade (o mesmo pedido tem respostas diferentes)"""
+        return f"advanced_groq:{self.current_personality}"
+
+    def build_messages(self, user_message: str) -> List[Dict[str, str]]:
+        """Monta as mensagens com a personalidade atual"""
+        return self.prompts[self.current_personality].build(self.conversation_history, user_message)
+
     async def generate_response(self, user_message: str) -> str:
         """Gera resposta usando Groq com personalidade e funcionalidades especiais"""
         try:
-            # Verificar mudança de personalidade
-            new_personality = self.detect_personality_change(user_message)
-            if new_personality and new_personality != self.current_personality:
-                self.current_personality = new_personality
-                self.session_metrics["personality_changes"] += 1
-                logger.info(f"Personalidade alterada para: {new_personality}")
-
-            # Verificar funcionalidade especial
-            special_function = self.detect_special_function(user_message)
-            if special_function and special_function in self.special_functions:
-                self.session_metrics["special_functions_used"] += 1
-                result = await self.special_functions[special_function](user_message)
-                return result
-
-            # Preparar contexto com personalidade atual
-            personality = self.personalities[self.current_personality]
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""{personality['system_prompt']}
-                    
-                    Personalidade atual: {personality['name']}
-                    Tom: {personality['tone']}
-                    Estilo: {personality['style']}
-                    
-                    Regras:
-                    1. Mantenha respostas curtas para conversas em tempo real
-                    2. Seja natural e contextual
-                    3. Use a personalidade definida consistentemente
-                    4. Seja útil e preciso"""
-                }
-            ]
-            
-            # Adicionar histórico recente
-            for msg in self.conversation_history[-8:]:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            # Adicionar mensagem atual
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
+            local_result = await self.handle_local_functions(user_message)
+            if local_result is not None:
+                return local_result
             
             # Chamar Groq
-            response = self.groq_client.chat.completions.create(
+            messages = self.build_messages(user_message)
+            ai_response = await self.llm_gateway.complete(
                 model="llama3-8b-8192",
                 messages=messages,
                 max_tokens=200,
-                temperature=0.7,
-                stream=False
+                temperature=0.7
             )
-            
-            ai_response = response.choices[0].message.content.strip()
-            
-            # Atualizar histórico
-            self.update_conversation_history(user_message, is_user=True)
-            self.update_conversation_history(ai_response, is_user=False)
+            self.response_cache.put(user_message, ai_response, self.cache_namespace, self.conversation_history, messages)
             
             return ai_response
             
@@ -270,6 +243,34 @@ class AdvancedGroqAgent(Agent):
             logger.error(f"Erro ao gerar resposta com Groq: {e}")
             return "Desculpe, tive um problema técnico. Pode repetir?"
 
+    async def generate_response_stream(self, user_message: str) -> AsyncIterator[str]:
+        """Gera resposta em streaming, entregando frase a frase ao TTS"""
+        sentences = []
+        try:
+            local_result = await self.handle_local_functions(user_message)
+            if local_result is not None:
+                yield local_result
+                return
+            
+            messages = self.build_messages(user_message)
+            
+            async for sentence in stream_llm_sentences(
+                self.llm_gateway,
+                model="llama3-8b-8192",
+                messages=messages,
+                max_tokens=200,
+                temperature=0.7
+            ):
+                sentences.append(sentence)
+                yield sentence
+                
+        except Exception as e:
+            logger.error(f"Erro no streaming Groq: {e}")
+            if not sentences:
+                yield "Desculpe, tive um problema técnico. Pode repetir?"
+        else:
+            self.response_cache.put(user_message, " ".join(sentences), self.cache_namespace, self.conversation_history, messages)
+
     def get_session_summary(self) -> Dict[str, Any]:
         """Retorna resumo da sessão"""
         session_duration = datetime.now() - self.session_metrics["session_start"]
@@ -294,11 +295,22 @@ class AdvancedGroqAgent(Agent):
         # Log da transcrição
         logger.info(f"Usuário ({participant_id}): {user_transcript}")
         
-        # Gerar resposta
-        ai_response = await self.generate_response(user_transcript)
+        # Gerar e falar a resposta (em streaming, a primeira frase já é falada aqui);
+        # se o usuário voltar a falar, geração e reprodução são canceladas
+        if self.streaming_enabled:
+            sentences = self.generate_response_stream(user_transcript)
+        else:
+            sentences = single_sentence(self.generate_response(user_transcript))
+        spoken = await self.barge_in.speak(chat_ctx, sentences)
+        ai_response = spoken.text
+        
+        # Histórico só com o que o usuário realmente ouviu
+        self.update_conversation_history(user_transcript, is_user=True)
+        if ai_response:
+            self.update_conversation_history(ai_response, is_user=False)
         
         # Log da resposta
-        logger.info(f"IA ({self.current_personality}): {ai_response}")
+        logger.info(f"IA ({self.current_personality}){' (interrompida)' if spoken.interrupted else ''}: {ai_response}")
         
         # Log estruturado
         log_data = {
@@ -307,14 +319,12 @@ class AdvancedGroqAgent(Agent):
             "user_message": user_transcript,
             "ai_response": ai_response,
             "current_personality": self.current_personality,
+            "interrupted": spoken.interrupted,
             "session_summary": self.get_session_summary()
         }
         
         logger.info(f"Interação avançada processada: {json.dumps(log_data, ensure_ascii=False)}")
         
-        # Enviar resposta para o chat
-        await chat_ctx.respond(ai_response)
-        
         raise StopResponse()
 
 async def entrypoint(ctx: JobContext):
@@ -323,9 +333,11 @@ async def entrypoint(ctx: JobContext):
     
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
     
+    agent = AdvancedGroqAgent()
     session = AgentSession()
+    agent.barge_in.attach(session)
     await session.start(
-        agent=AdvancedGroqAgent(),
+        agent=agent,
         room=ctx.room,
         room_output_options=RoomOutputOptions(
             transcription_enabled=True,
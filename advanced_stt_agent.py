@@ -23,6 +23,7 @@ from livekit.agents.llm.llm import ChatContext, ChatMessage
 from livekit.agents.llm.llm import RoomOutputOptions
 from livekit.agents.llm.llm import AutoSubscribe
 import assemblyai
+from keyword_engine import get_keyword_engine
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -53,23 +54,18 @@ class AdvancedTranscriber(Agent):
             "participants": set()
         }
         
-        # Palavras para moderação (exemplo)
-        self.moderation_words = {
-            "inappropriate": ["palavrao1", "palavrao2"],
-            "spam": ["spam", "promoção", "venda"]
-        }
+        # Palavras de sentimento e moderação ficam no motor de palavras-chave
+        # (conjuntos "sentiment" e "moderation", extensíveis via KEYWORDS_CONFIG)
+        self.keywords = get_keyword_engine()
     
     def analyze_sentiment(self, text: str) -> Dict[str, Any]:
         """
         Análise simples de sentimento baseada em palavras-chave.
         Em produção, você usaria um modelo de ML mais sofisticado.
         """
-        positive_words = ["bom", "ótimo", "excelente", "gosto", "legal", "feliz"]
-        negative_words = ["ruim", "péssimo", "terrível", "não gosto", "triste", "raiva"]
-        
-        text_lower = text.lower()
-        positive_count = sum(1 for word in positive_words if word in text_lower)
-        negative_count = sum(1 for word in negative_words if word in text_lower)
+        matches = self.keywords.match(text)
+        positive_count = matches.count("sentiment", "positive")
+        negative_count = matches.count("sentiment", "negative")
         
         if positive_count > negative_count:
             sentiment = "positive"
@@ -92,16 +88,11 @@ class AdvancedTranscriber(Agent):
         """
         Verifica se o texto contém conteúdo que precisa de moderação.
         """
-        text_lower = text.lower()
-        issues = []
-        
-        for category, words in self.moderation_words.items():
-            found_words = [word for word in words if word in text_lower]
-            if found_words:
-                issues.append({
-                    "category": category,
-                    "words": found_words
-                })
+        # Mesma passada da análise de sentimento (o resultado da frase é reaproveitado)
+        issues = [
+            {"category": category, "words": found_words}
+            for category, found_words in self.keywords.match(text).labels("moderation").items()
+        ]
         
         return {
             "needs_moderation": len(issues) > 0,
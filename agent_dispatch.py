@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Despacho de salas para workers LiveKit de longa duração
+Em vez de abrir um processo por chamada, a API registra a sala no LiveKit
+(CreateAgentDispatch) e um dispatch_worker.py já em execução assume o job,
+rodando muitas sessões JobContext no mesmo processo
+"""
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from livekit import api
+
+logger = logging.getLogger("agent_dispatch")
+
+DISPATCH_AGENT_NAME = os.getenv("AGENT_DISPATCH_NAME", "voice-agent")
+
+# Tipos de agente que o dispatch_worker sabe executar
+DISPATCH_AGENT_TYPES = {"groq", "advanced_groq", "telephony", "sip", "real_sip"}
+
+# sala -> dispatch_id, para cancelar o despacho ao encerrar a chamada
+_room_dispatches: Dict[str, str] = {}
+_lk_api: Optional[api.LiveKitAPI] = None
+
+def is_dispatch_enabled() -> bool:
+    """Modo de despacho ativo (AGENT_DISPATCH_MODE=true)"""
+    return os.getenv("AGENT_DISPATCH_MODE", "false").lower() == "true"
+
+def get_livekit_api() -> api.LiveKitAPI:
+    """Cliente LiveKit compartilhado (evita reabrir a sessão HTTP a cada chamada)"""
+    global _lk_api
+    if _lk_api is None:
+        _lk_api = api.LiveKitAPI(
+            url=os.getenv("LIVEKIT_URL"),
+            api_key=os.getenv("LIVEKIT_API_KEY"),
+            api_secret=os.getenv("LIVEKIT_API_SECRET"),
+        )
+    return _lk_api
+
+async def dispatch_agent(room_name: str, agent_type: str, config: Optional[Dict[str, Any]] = None) -> str:
+    """Registra a sala para ser atendida por um worker de despacho"""
+    if agent_type not in DISPATCH_AGENT_TYPES:
+        raise ValueError(f"Tipo de agente não suportado no despacho: {agent_type}")
+
+    metadata = {
+        "agent_type": agent_type,
+        "config": config or {},
+        "dispatched_at": datetime.now().isoformat(),
+    }
+    dispatch = await get_livekit_api().agent_dispatch.create_dispatch(
+        api.CreateAgentDispatchRequest(
+            agent_name=DISPATCH_AGENT_NAME,
+            room=room_name,
+            metadata=json.dumps(metadata, ensure_ascii=False),
+        )
+    )
+    _room_dispatches[room_name] = dispatch.id
+    logger.info(f"Sala {room_name} despachada para '{DISPATCH_AGENT_NAME}' ({agent_type}), dispatch {dispatch.id}")
+    return dispatch.id
+
+def track_dispatch(room_name: str, dispatch_id: str):
+    """Volta a acompanhar um despacho criado antes do reinício da API"""
+    _room_dispatches[room_name] = dispatch_id
+
+async def cancel_room_dispatch(room_name: str, dispatch_id: Optional[str] = None) -> bool:
+    """Remove o despacho da sala, encerrando a sessão no worker
+
+    dispatch_id vem do registro persistido do agente; sem ele, vale o
+    despacho criado por este processo
+    """
+    known_id = _room_dispatches.pop(room_name, None)
+    dispatch_id = dispatch_id or known_id
+    if dispatch_id is None:
+        return False
+    try:
+        await get_livekit_api().agent_dispatch.delete_dispatch(dispatch_id, room_name)
+        logger.info(f"Despacho {dispatch_id} da sala {room_name} cancelado")
+        return True
+    except Exception as e:
+        logger.warning(f"Erro ao cancelar despacho da sala {room_name}: {e}")
+        return False
+
+def active_dispatches() -> Dict[str, str]:
+    """Salas atualmente despachadas por esta API"""
+    return dict(_room_dispatches)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Pool de workers de agentes pré-aquecidos
+Mantém N interpretadores com livekit, assemblyai e os módulos dos agentes já
+importados. A sala é entregue a um worker ocioso via IPC (Pipe), eliminando
+o custo de subprocess + imports a cada agente. Cada sala é um único job que
+termina quando a sala fecha; só então o worker avisa "finished" e volta a
+ficar ocioso (ou é reciclado após AGENT_POOL_MAX_JOBS)
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import importlib
+import threading
+import multiprocessing
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("agent_worker_pool")
+
+# agent_type -> (módulo, função de entrada)
+AGENT_ENTRYPOINTS = {
+    "groq": ("groq_voice_agent", "entrypoint"),
+    "advanced_groq": ("advanced_groq_agent", "entrypoint"),
+    "telephony": ("telephony_agent", "telephony_entrypoint"),
+}
+
+def _exit_code(exc: SystemExit) -> int:
+    if exc.code is None:
+        return 0
+    return exc.code if isinstance(exc.code, int) else 1
+
+async def _stop_worker_process():
+    """Fim do job: encerra o worker LiveKit deste processo para o run_app retornar"""
+    os.kill(os.getpid(), signal.SIGINT)
+
+def _run_agent_job(module: Any, entrypoint_name: str, room_name: str) -> int:
+    """Executa um único job do agente para a sala (bloqueia até a sala fechar)"""
+    from livekit import agents
+    from livekit.agents import JobContext, JobExecutorType, WorkerOptions
+
+    entrypoint = getattr(module, entrypoint_name)
+
+    async def single_job(ctx: JobContext):
+        # O job encerra quando a sala fecha (ou o agente é desconectado)
+        ctx.add_shutdown_callback(_stop_worker_process)
+        await entrypoint(ctx)
+
+    # connect --room: entra só nessa sala, sem registrar o worker para outros despachos;
+    # job em thread para o callback de encerramento rodar neste processo
+    sys.argv = [f"{module.__name__}.py", "connect", "--room", room_name]
+    try:
+        agents.cli.run_app(WorkerOptions(entrypoint_fnc=single_job, job_executor_type=JobExecutorType.THREAD))
+        return 0
+    except SystemExit as e:
+        return _exit_code(e)
+    except KeyboardInterrupt:
+        # SIGINT do próprio job chegou depois que o run_app devolveu o handler padrão
+        return 0
+
+def _worker_main(conn: Any, worker_id: int):
+    """Loop do processo worker: pré-aquece e aguarda salas via Pipe"""
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+
+    # Pré-aquecimento: imports pesados prontos antes da primeira sala (o gateway LLM
+    # é criado pelo event loop do job)
+    modules = {}
+    for agent_type, (module_name, _) in AGENT_ENTRYPOINTS.items():
+        try:
+            modules[agent_type] = importlib.import_module(module_name)
+        except Exception as e:
+            logger.warning(f"[Worker-{worker_id}] Não foi possível pré-carregar {module_name}: {e}")
+
+    try:
+        importlib.import_module("llm_gateway")
+    except Exception as e:
+        logger.warning(f"[Worker-{worker_id}] Gateway LLM não carregado: {e}")
+
+    conn.send(("ready", os.getpid(), (time.perf_counter() - started) * 1000))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        agent_id = job["agent_id"]
+        module = modules.get(job["agent_type"])
+        if module is None:
+            conn.send(("finished", agent_id, 1))
+            continue
+
+        conn.send(("started", agent_id, os.getpid()))
+        try:
+            return_code = _run_agent_job(module, AGENT_ENTRYPOINTS[job["agent_type"]][1], job["room_name"])
+        except Exception as e:
+            logger.error(f"[Worker-{worker_id}] Erro no agente {agent_id}: {e}")
+            return_code = 1
+        conn.send(("finished", agent_id, return_code))
+
+    conn.close()
+
+class PoolWorker:
+    """Estado de um processo worker do pool"""
+
+    def __init__(self, worker_id: int, process: Any, conn: Any):
+        self.worker_id = worker_id
+        self.process = process
+        self.conn = conn
+        self.state = "warming"  # warming -> idle -> busy -> idle ... -> retired
+        self.jobs_done = 0
+        self.agent_id: Optional[str] = None
+        self.warmup_ms: Optional[float] = None
+        self.spawned_at = datetime.now().isoformat()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "pid": self.process.pid,
+            "state": self.state,
+            "jobs_done": self.jobs_done,
+            "agent_id": self.agent_id,
+            "warmup_ms": round(self.warmup_ms, 1) if self.warmup_ms is not None else None,
+            "spawned_at": self.spawned_at,
+        }
+
+class AgentWorkerPool:
+    """Pool de interpretadores pré-aquecidos para executar agentes"""
+
+    def __init__(
+        self,
+        size: int = int(os.getenv("AGENT_POOL_SIZE", "2")),
+        max_jobs_per_worker: int = int(os.getenv("AGENT_POOL_MAX_JOBS", "20")),
+        on_job_finished: Optional[Callable[[str, int], None]] = None,
+    ):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.on_job_finished = on_job_finished
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._workers: Dict[int, PoolWorker] = {}
+        self._next_worker_id = 0
+        self._running = False
+        self.stats = {
+            "jobs_assigned": 0,
+            "jobs_finished": 0,
+            "workers_recycled": 0,
+            "workers_crashed": 0,
+            "pool_misses": 0,
+        }
+
+    def start(self):
+        """Sobe os N workers pré-aquecidos"""
+        self._running = True
+        for _ in range(self.size):
+            self._spawn_worker()
+        logger.info(f"Pool de agentes iniciado com {self.size} workers (reciclagem a cada {self.max_jobs_per_worker} jobs)")
+
+    def shutdown(self):
+        """Encerra todos os workers"""
+        self._running = False
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            self._stop_worker(worker)
+        logger.info("Pool de agentes encerrado")
+
+    def _spawn_worker(self):
+        with self._lock:
+            worker_id = self._next_worker_id
+            self._next_worker_id += 1
+
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, worker_id),
+            name=f"agent-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+
+        worker = PoolWorker(worker_id, process, parent_conn)
+        with self._lock:
+            self._workers[worker_id] = worker
+
+        monitor = threading.Thread(target=self._monitor_worker, args=(worker,), daemon=True)
+        monitor.start()
+
+    def _stop_worker(self, worker: PoolWorker, timeout: float = 5):
+        worker.state = "retired"
+        if worker.process.is_alive():
+            if worker.agent_id is None:
+                try:
+                    worker.conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+                worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join(timeout)
+        worker.conn.close()
+
+    def _monitor_worker(self, worker: PoolWorker):
+        """Lê as mensagens do worker e atualiza o estado do pool"""
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+
+            kind = message[0]
+            if kind == "ready":
+                worker.warmup_ms = message[2]
+                worker.state = "idle"
+                logger.info(f"Worker {worker.worker_id} pronto (PID {message[1]}, aquecimento {message[2]:.0f}ms)")
+
+            elif kind == "started":
+                logger.info(f"Worker {worker.worker_id} executando agente {message[1]}")
+
+            elif kind == "finished":
+                agent_id, return_code = message[1], message[2]
+                worker.jobs_done += 1
+                worker.agent_id = None
+                self.stats["jobs_finished"] += 1
+                if self.on_job_finished:
+                    self.on_job_finished(agent_id, return_code)
+
+                if worker.jobs_done >= self.max_jobs_per_worker:
+                    self._recycle(worker)
+                    return
+                worker.state = "idle"
+
+        # Pipe fechado: o worker morreu ou foi parado
+        with self._lock:
+            still_registered = self._workers.pop(worker.worker_id, None) is not None
+        if still_registered and worker.state != "retired":
+            self.stats["workers_crashed"] += 1
+            logger.warning(f"Worker {worker.worker_id} terminou inesperadamente")
+            if worker.agent_id and self.on_job_finished:
+                self.on_job_finished(worker.agent_id, worker.process.exitcode or 1)
+            if self._running:
+                self._spawn_worker()
+
+    def _recycle(self, worker: PoolWorker):
+        """Substitui um worker que atingiu o limite de jobs"""
+        with self._lock:
+            self._workers.pop(worker.worker_id, None)
+        self._stop_worker(worker)
+        self.stats["workers_recycled"] += 1
+        logger.info(f"Worker {worker.worker_id} reciclado após {worker.jobs_done} jobs")
+        if self._running:
+            self._spawn_worker()
+
+    def assign(self, agent_id: str, agent_type: str, room_name: str) -> Optional[PoolWorker]:
+        """Entrega a sala a um worker ocioso; retorna None se não houver nenhum"""
+        if agent_type not in AGENT_ENTRYPOINTS:
+            return None
+
+        with self._lock:
+            worker = next((w for w in self._workers.values() if w.state == "idle"), None)
+            if worker is None:
+                self.stats["pool_misses"] += 1
+                return None
+            worker.state = "busy"
+            worker.agent_id = agent_id
+
+        worker.conn.send({"agent_id": agent_id, "agent_type": agent_type, "room_name": room_name})
+        self.stats["jobs_assigned"] += 1
+        return worker
+
+    def release(self, agent_id: str) -> bool:
+        """Para o agente de um worker; o processo é substituído por um novo aquecido"""
+        with self._lock:
+            worker = next((w for w in self._workers.values() if w.agent_id == agent_id), None)
+            if worker is None:
+                return False
+            self._workers.pop(worker.worker_id, None)
+
+        self._stop_worker(worker)
+        logger.info(f"Agente {agent_id} parado no worker {worker.worker_id}")
+        if self._running:
+            self._spawn_worker()
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        """Ocupação atual do pool"""
+        with self._lock:
+            workers: List[PoolWorker] = list(self._workers.values())
+
+        states = [w.state for w in workers]
+        return {
+            "enabled": self._running,
+            "size": self.size,
+            "idle": states.count("idle"),
+            "busy": states.count("busy"),
+            "warming": states.count("warming"),
+            "max_jobs_per_worker": self.max_jobs_per_worker,
+            "stats": dict(self.stats),
+            "workers": [w.to_dict() for w in workers],
+        }
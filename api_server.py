@@ -17,6 +17,10 @@ from pydantic import BaseModel
 import uvicorn
 from livekit.api import LiveKitAPI
 from livekit.protocol import room as room_proto
+from agent_worker_pool import AgentWorkerPool
+from agent_dispatch import is_dispatch_enabled, dispatch_agent, cancel_room_dispatch, active_dispatches, track_dispatch
+from persistence import get_persistence_store
+from conversation_log import ConversationLog
 # Import condicional para evitar crash no Railway
 try:
     from sip_endpoints import sip_router
@@ -134,9 +138,68 @@ class CallStatus(BaseModel):
     start_time: Optional[str] = None
     end_time: Optional[str] = None
 
-# Estado global da aplicação
+# Estado global da aplicação (espelhado no SQLite e restaurado na subida)
 active_agents: Dict[str, Dict[str, Any]] = {}
-conversation_logs: List[Dict[str, Any]] = []
+conversation_logs = ConversationLog()
+persistence = get_persistence_store()
+
+def persist_agent(agent_id: str):
+    """Enfileira o estado atual do agente para gravação (não bloqueia)"""
+    if agent_id in active_agents:
+        persistence.upsert_agent(active_agents[agent_id])
+
+def on_pooled_agent_finished(agent_id: str, return_code: int):
+    """Atualiza o status quando um agente executado no pool termina"""
+    if agent_id in active_agents:
+        if return_code == 0:
+            active_agents[agent_id]["status"] = "finished"
+        else:
+            active_agents[agent_id]["status"] = "crashed"
+            active_agents[agent_id]["metrics"]["errors"] += 1
+        active_agents[agent_id]["ended_at"] = datetime.now().isoformat()
+        persist_agent(agent_id)
+
+# Pool de workers pré-aquecidos (opcional: AGENT_POOL_ENABLED=true; o padrão é o spawn a frio).
+# No modo de despacho (AGENT_DISPATCH_MODE=true) as salas vão para os
+# dispatch_worker.py já em execução e o pool local não é necessário
+AGENT_POOL_ENABLED = os.getenv("AGENT_POOL_ENABLED", "false").lower() == "true"
+# Criado na subida da API (não no import do módulo)
+agent_pool: Optional[AgentWorkerPool] = None
+
+@app.on_event("startup")
+async def restore_state():
+    """Recarrega agentes e conversas gravados antes do último reinício"""
+    await persistence.start()
+    for agent_info in await persistence.load_agents():
+        if agent_info.get("dispatch_id"):
+            # Salas despachadas seguem nos dispatch_worker.py, independentes da API
+            active_agents[agent_info["agent_id"]] = agent_info
+            track_dispatch(agent_info["room_name"], agent_info["dispatch_id"])
+        else:
+            # Processo local (pool ou spawn) morreu junto com a API: registro descartado
+            logger.info(f"Agente {agent_info['agent_id']} ({agent_info.get('status')}) não sobreviveu ao reinício")
+            persistence.delete_agent(agent_info["agent_id"])
+    conversation_logs.extend(await persistence.load_conversations(conversation_logs.max_entries))
+    logger.info(f"💾 Estado restaurado: {len(active_agents)} agentes, {len(conversation_logs)} conversas")
+
+@app.on_event("startup")
+async def start_agent_pool():
+    """Aquece os workers do pool na subida da API"""
+    global agent_pool
+    if AGENT_POOL_ENABLED and not is_dispatch_enabled():
+        agent_pool = AgentWorkerPool(on_job_finished=on_pooled_agent_finished)
+        agent_pool.start()
+
+@app.on_event("shutdown")
+async def stop_agent_pool():
+    """Encerra os workers do pool"""
+    if agent_pool:
+        agent_pool.shutdown()
+
+@app.on_event("shutdown")
+async def close_persistence():
+    """Grava as alterações pendentes antes de sair"""
+    await persistence.aclose()
 
 @app.get("/")
 async def root():
@@ -223,6 +286,7 @@ async def start_agent(agent_config: AgentConfig, background_tasks: BackgroundTas
         }
         
         active_agents[agent_id] = agent_info
+        persist_agent(agent_id)
         
         # Iniciar o agente em background
         background_tasks.add_task(start_agent_process, agent_id, agent_config)
@@ -265,6 +329,11 @@ async def stop_agent(request: StopAgentRequest):
         agent_to_stop_id = request.agent_id
 
     agent_info = active_agents.get(agent_to_stop_id, {})
+    if agent_info.get("dispatch_id"):
+        await cancel_room_dispatch(agent_info["room_name"], agent_info["dispatch_id"])
+    if agent_pool and agent_info.get("pool_worker") is not None:
+        # join/terminate do worker podem levar segundos: fora do event loop
+        await asyncio.to_thread(agent_pool.release, agent_to_stop_id)
     process = agent_info.get("process")
     
     if process and process.poll() is None:  # Verifica se o processo está rodando
@@ -279,6 +348,7 @@ async def stop_agent(request: StopAgentRequest):
 
     if agent_to_stop_id in active_agents:
         del active_agents[agent_to_stop_id]
+        persistence.delete_agent(agent_to_stop_id)
         logger.info(f"Agente {agent_to_stop_id} removido da lista de agentes ativos.")
         return {"message": f"Agente {agent_to_stop_id} parado e removido com sucesso."}
     
@@ -298,8 +368,33 @@ async def start_agent_process(agent_id: str, agent_config: AgentConfig):
         else:
             logger.warning(f"Tipo de agente desconhecido: {agent_config.agent_type}")
             active_agents[agent_id]["status"] = "error"
+            persist_agent(agent_id)
+            return
+
+        # Modo de despacho: a sala é registrada no LiveKit e atendida por um
+        # dispatch_worker.py que já executa várias sessões no mesmo processo
+        if is_dispatch_enabled():
+            dispatch_id = await dispatch_agent(
+                agent_config.room_name,
+                agent_config.agent_type,
+                {"agent_id": agent_id, "personality": agent_config.personality, "features": agent_config.features},
+            )
+            active_agents[agent_id]["dispatch_id"] = dispatch_id
+            persist_agent(agent_id)
+            logger.info(f"Agente {agent_config.agent_type} ({agent_id}) despachado para a sala {agent_config.room_name}")
             return
 
+        # Entregar a sala a um worker pré-aquecido, se houver um ocioso
+        if agent_pool:
+            worker = agent_pool.assign(agent_id, agent_config.agent_type, agent_config.room_name)
+            if worker:
+                active_agents[agent_id]["pool_worker"] = worker.worker_id
+                active_agents[agent_id]["pid"] = worker.process.pid
+                persist_agent(agent_id)
+                logger.info(f"Agente {script_to_run} ({agent_id}) entregue ao worker {worker.worker_id} do pool para a sala {agent_config.room_name}")
+                return
+            logger.info(f"Nenhum worker ocioso no pool; iniciando {script_to_run} a frio")
+
         command = [
             sys.executable,  # Garante que estamos usando o python correto do ambiente
             # O comando correto, conforme a documentação do LiveKit, é executar o script diretamente
@@ -324,12 +419,15 @@ async def start_agent_process(agent_id: str, agent_config: AgentConfig):
         log_thread.daemon = True  # Permite que a aplicação principal saia mesmo que a thread esteja rodando
         log_thread.start()
         active_agents[agent_id]["process"] = process
+        active_agents[agent_id]["pid"] = process.pid
+        persist_agent(agent_id)
         logger.info(f"Agente {script_to_run} ({agent_id}) iniciado com PID {process.pid} para a sala {agent_config.room_name}")
 
     except Exception as e:
         logger.error(f"Erro no processo do agente {agent_id}: {e}")
         active_agents[agent_id]["status"] = "error"
         active_agents[agent_id]["metrics"]["errors"] += 1
+        persist_agent(agent_id)
 
 def log_agent_output(agent_id: str, process: subprocess.Popen):
     """
@@ -354,6 +452,7 @@ def log_agent_output(agent_id: str, process: subprocess.Popen):
             
             active_agents[agent_id]["process"] = None
             active_agents[agent_id]["ended_at"] = datetime.now().isoformat()
+            persist_agent(agent_id)
 
     except Exception as e:
         logger.error(f"Erro no logger do processo do agente {agent_id}: {e}")
@@ -368,6 +467,13 @@ async def stop_agent(agent_id: str):
         agent_info = active_agents[agent_id]
         agent_info["status"] = "stopping"
 
+        if agent_info.get("dispatch_id"):
+            await cancel_room_dispatch(agent_info["room_name"], agent_info["dispatch_id"])
+
+        if agent_pool and agent_info.get("pool_worker") is not None:
+            # join/terminate do worker podem levar segundos: fora do event loop
+            await asyncio.to_thread(agent_pool.release, agent_id)
+
         process = agent_info.get("process")
         if process:
             process.terminate()
@@ -375,6 +481,7 @@ async def stop_agent(agent_id: str):
             logger.info(f"Processo do agente {agent_id} (PID: {process.pid}) terminado.")
 
         active_agents.pop(agent_id)
+        persistence.delete_agent(agent_id)
 
         logger.info(f"Agente {agent_id} parado com sucesso")
 
@@ -388,6 +495,7 @@ async def stop_agent(agent_id: str):
         logger.error(f"Erro ao parar agente {agent_id}: {e}")
         if agent_id in active_agents:
             active_agents.pop(agent_id)
+            persistence.delete_agent(agent_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/agents")
@@ -398,6 +506,13 @@ async def list_agents():
         "agents": list(active_agents.values())
     }
 
+@app.get("/agents/pool")
+async def get_agent_pool_status():
+    """Ocupação do pool de workers pré-aquecidos"""
+    if not agent_pool:
+        return {"enabled": False}
+    return agent_pool.status()
+
 @app.get("/agents/{agent_id}")
 async def get_agent_status(agent_id: str):
     """Obtém o status de um agente específico"""
@@ -411,7 +526,26 @@ async def get_conversations(limit: int = 50):
     """Obtém o histórico de conversas"""
     return {
         "total_conversations": len(conversation_logs),
-        "conversations": conversation_logs[-limit:]
+        "conversations": conversation_logs.latest(limit)
+    }
+
+@app.get("/conversations/search")
+async def search_conversations(
+    q: Optional[str] = None,
+    participant_id: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+):
+    """Busca conversas por palavras (todas devem aparecer) e/ou participante, pelo índice invertido"""
+    try:
+        conversations, next_cursor = conversation_logs.search(q, participant_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "total_conversations": len(conversation_logs),
+        "returned": len(conversations),
+        "next_cursor": next_cursor,
+        "conversations": conversations
     }
 
 @app.post("/conversations/log")
@@ -426,11 +560,9 @@ async def log_conversation(conversation: ConversationMessage):
         "processed_at": datetime.now().isoformat()
     }
     
+    # Em memória ficam só as últimas conversas (o SQLite guarda todas)
     conversation_logs.append(conversation_data)
-    
-    # Manter apenas as últimas 1000 conversas
-    if len(conversation_logs) > 1000:
-        conversation_logs.pop(0)
+    persistence.add_conversation(conversation_data)
     
     return {"message": "Conversa registrada com sucesso", "conversation_id": conversation_data["id"]}
 
@@ -445,6 +577,10 @@ async def get_metrics():
         "total_interactions": total_interactions,
         "total_errors": total_errors,
         "total_conversations": len(conversation_logs),
+        "agent_pool": {key: value for key, value in agent_pool.status().items() if key != "workers"} if agent_pool else None,
+        "dispatch_mode": is_dispatch_enabled(),
+        "dispatched_rooms": len(active_dispatches()),
+        "persistence": persistence.status(),
         "uptime": "running",  # Implementar cálculo de uptime real
         "timestamp": datetime.now().isoformat()
     }
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Calculadora por voz sem eval
+Converte contas faladas em português ("quanto é doze vezes sete") em uma
+expressão, valida a AST contra uma lista de operadores permitidos e a
+compila em funções Python puras, guardadas em cache por expressão
+"""
+import re
+import ast
+import operator
+import unicodedata
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple, Union
+
+Number = Union[int, float]
+
+# Limites contra expressões que travariam o worker (ex.: 9 ** 9 ** 9)
+MAX_EXPONENT = 100
+MAX_MAGNITUDE = 10 ** 30
+MAX_EXPRESSION_LENGTH = 200
+
+class CalculationError(ValueError):
+    """Expressão inválida, não permitida ou fora dos limites"""
+
+UNITS = {
+    "zero": 0, "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5,
+    "seis": 6, "sete": 7, "oito": 8, "nove": 9, "dez": 10, "onze": 11, "doze": 12,
+    "treze": 13, "catorze": 14, "quatorze": 14, "quinze": 15, "dezesseis": 16,
+    "dezessete": 17, "dezoito": 18, "dezenove": 19,
+}
+TENS = {
+    "vinte": 20, "trinta": 30, "quarenta": 40, "cinquenta": 50,
+    "sessenta": 60, "setenta": 70, "oitenta": 80, "noventa": 90,
+}
+HUNDREDS = {
+    "cem": 100, "cento": 100, "duzentos": 200, "duzentas": 200, "trezentos": 300, "trezentas": 300,
+    "quatrocentos": 400, "quatrocentas": 400, "quinhentos": 500, "quinhentas": 500,
+    "seiscentos": 600, "seiscentas": 600, "setecentos": 700, "setecentas": 700,
+    "oitocentos": 800, "oitocentas": 800, "novecentos": 900, "novecentas": 900,
+}
+SCALES = {"mil": 1000, "milhao": 10 ** 6, "milhoes": 10 ** 6, "bilhao": 10 ** 9, "bilhoes": 10 ** 9}
+
+# Operadores falados, do mais longo para o mais curto (casados antes das palavras soltas)
+SPOKEN_OPERATORS = [
+    ("multiplicado por", "*"), ("dividido por", "/"), ("elevado ao", "**"), ("elevado a", "**"),
+    ("ao quadrado", "**2"), ("ao cubo", "**3"), ("por cento de", "/100*"), ("por cento", "/100"),
+    ("mais", "+"), ("menos", "-"), ("vezes", "*"), ("sobre", "/"), ("x", "*"),
+]
+SYMBOLS = {"+": "+", "-": "-", "*": "*", "/": "/", "^": "**", "×": "*", "÷": "/", "(": "(", ")": ")", "%": "/100"}
+
+# Palavras que podem cercar a conta sem mudar o sentido
+FILLER = {
+    "quanto", "quantos", "e", "eh", "da", "de", "do", "faz", "faca", "calcula", "calcular", "calcule",
+    "conta", "a", "o", "me", "diz", "fala", "qual", "resultado", "por", "favor", "pra", "para", "mim",
+    "igual", "vale", "sabe", "voce", "ai", "ate", "numero", "seria",
+}
+
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)?|[a-z]+|[+\-*/^×÷()%]")
+
+def _fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def _join_operators(words: List[str]) -> List[str]:
+    """Junta operadores de várias palavras ("dividido por") em um token"""
+    joined = []
+    index = 0
+    while index < len(words):
+        for phrase, symbol in SPOKEN_OPERATORS:
+            parts = phrase.split()
+            if words[index:index + len(parts)] == parts:
+                joined.append(symbol)
+                index += len(parts)
+                break
+        else:
+            joined.append(words[index])
+            index += 1
+    return joined
+
+def spoken_to_expression(text: str) -> Tuple[str, int]:
+    """Converte a frase em expressão; devolve também quantas palavras não foram entendidas"""
+    tokens = _join_operators(_TOKEN.findall(_fold(text)))
+    output: List[str] = []
+    unknown = 0
+    total, current, in_number = 0, 0, False
+    decimal_digits: Optional[str] = None
+
+    def flush():
+        nonlocal total, current, in_number, decimal_digits
+        if in_number:
+            value = str(total + current)
+            if decimal_digits:
+                value = f"{value}.{decimal_digits}"
+            output.append(value)
+        total, current, in_number, decimal_digits = 0, 0, False, None
+
+    for token in tokens:
+        if token in ("virgula", "ponto") and in_number and decimal_digits is None:
+            decimal_digits = ""
+            continue
+        if decimal_digits is not None and token in UNITS and UNITS[token] < 10:
+            decimal_digits += str(UNITS[token])
+            continue
+        if token in UNITS or token in TENS or token in HUNDREDS:
+            value = UNITS.get(token) or TENS.get(token) or HUNDREDS.get(token, 0)
+            current += value
+            in_number = True
+        elif token in SCALES:
+            total += (current or 1) * SCALES[token]
+            current, in_number = 0, True
+        elif token[0].isdigit():
+            flush()
+            output.append(token.replace(",", "."))
+        elif token in SYMBOLS.values() or token in SYMBOLS or token.startswith(("**", "/100")):
+            flush()
+            output.append(SYMBOLS.get(token, token))
+        elif token == "e" and in_number:
+            continue  # "vinte e três"
+        else:
+            flush()
+            if token not in FILLER:
+                unknown += 1
+    flush()
+    return "".join(output), unknown
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+_UNARY = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+
+def _checked(value: Number) -> Number:
+    if isinstance(value, complex):
+        raise CalculationError("Resultado não é um número real")
+    if abs(value) > MAX_MAGNITUDE:
+        raise CalculationError("Resultado grande demais")
+    return value
+
+def _compile_node(node: ast.AST) -> Callable[[], Number]:
+    """Transforma a AST validada em funções encadeadas (sem eval)"""
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = node.value
+        return lambda: value
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        operand, apply = _compile_node(node.operand), _UNARY[type(node.op)]
+        return lambda: apply(operand())
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        left, right, apply = _compile_node(node.left), _compile_node(node.right), _BINARY[type(node.op)]
+        if isinstance(node.op, ast.Pow):
+            def power():
+                exponent = right()
+                if abs(exponent) > MAX_EXPONENT:
+                    raise CalculationError("Expoente grande demais")
+                return _checked(apply(left(), exponent))
+            return power
+        if isinstance(node.op, ast.Div):
+            def divide():
+                divisor = right()
+                if divisor == 0:
+                    raise CalculationError("Divisão por zero")
+                return _checked(apply(left(), divisor))
+            return divide
+        return lambda: _checked(apply(left(), right()))
+    raise CalculationError(f"Operação não permitida: {type(node).__name__}")
+
+def _is_operand(node: ast.AST) -> bool:
+    """Número (com ou sem sinal) ou subexpressão numérica"""
+    if isinstance(node, ast.UnaryOp):
+        return _is_operand(node.operand)
+    return isinstance(node, ast.BinOp) or (isinstance(node, ast.Constant) and type(node.value) in (int, float))
+
+@lru_cache(maxsize=1024)
+def has_binary_operation(expression: str) -> bool:
+    """A expressão opera dois números; só um sinal ("+1" de "mais um") não é conta"""
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError:
+        return False
+    return any(
+        isinstance(node, ast.BinOp) and _is_operand(node.left) and _is_operand(node.right)
+        for node in ast.walk(tree)
+    )
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> Callable[[], Number]:
+    """Valida e compila a expressão (resultado em cache)"""
+    if not expression or len(expression) > MAX_EXPRESSION_LENGTH:
+        raise CalculationError("Expressão vazia ou longa demais")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise CalculationError(f"Expressão inválida: {expression}") from e
+    return _compile_node(tree)
+
+def evaluate(expression: str) -> Number:
+    return compile_expression(expression)()
+
+def format_number(value: Number) -> str:
+    """Número no formato falado em pt-BR (vírgula decimal, até 4 casas)"""
+    if isinstance(value, float):
+        if value.is_integer():
+            value = int(value)
+        else:
+            return f"{round(value, 4)}".replace(".", ",")
+    return str(value)
+
+def calculate(text: str, max_unknown_words: int = 1) -> Optional[Tuple[str, Number]]:
+    """Resolve uma conta falada; None se a frase não for (só) uma conta"""
+    expression, unknown = spoken_to_expression(text)
+    if unknown > max_unknown_words or not has_binary_operation(expression):
+        return None
+    try:
+        return expression, evaluate(expression)
+    except (CalculationError, ArithmeticError):
+        return None
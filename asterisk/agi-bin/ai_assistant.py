@@ -6,15 +6,23 @@ Integração com Groq AI e AssemblyAI para chamadas telefônicas
 
 import sys
 import os
-import json
 import asyncio
 import logging
 from datetime import datetime
 from typing import Dict, Any, Optional
-import requests
-import websocket
-import threading
+import httpx
 import time
+import uuid
+
+# O cliente Groq compartilhado fica na raiz do projeto (/app no container)
+sys.path.insert(0, os.getenv("AI_APP_DIR", "/app"))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from groq_ai import GroqAI
+from streaming_stt import StreamingSTT, AssemblyAIRealtimeSTT, transcribe_while_recording
+from transcript_waiter import LATENCY, TranscriptTimeout, TranscriptWaiter
+from audio_preprocessing import EnergyVAD, preprocess_recording
+from tts_cache import TTSCache
+from asterisk_ami import AsteriskAMI, create_ami
 
 # Configurar logging
 logging.basicConfig(
@@ -27,144 +35,170 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# STT em streaming (AssemblyAI tempo real) no lugar de upload + polling
+STT_STREAMING = os.getenv("STT_STREAMING", "true").lower() == "true"
+STT_RECORD_SILENCE = int(os.getenv("STT_RECORD_SILENCE", "2"))
+# VAD local (energia + cruzamentos por zero) antes de enviar a gravação ao STT
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
+# Áudio das frases via cache TTS + STREAM FILE (TTS_CACHE_ENABLED=false volta ao SAY TEXT)
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+
+# Frases fixas do atendimento: pré-renderizadas no cache TTS na subida
+PROMPTS = {
+    "greeting": "Olá! Eu sou seu assistente de IA. Como posso ajudá-lo hoje?",
+    "no_input": "Não ouvi nada. Posso ajudá-lo com mais alguma coisa?",
+    "not_understood": "Desculpe, não consegui entender. Pode repetir?",
+    "goodbye": "Obrigado por ligar! Tenha um ótimo dia!",
+    "max_turns": "Foi um prazer conversar com você! Até logo!",
+    "error": "Desculpe, ocorreu um erro técnico. Encerrando chamada.",
+    "ai_fallback": "Desculpe, não consegui processar sua solicitação no momento.",
+}
+
+def create_tts_cache() -> Optional[TTSCache]:
+    if not TTS_CACHE_ENABLED:
+        return None
+    try:
+        return TTSCache()
+    except OSError as e:
+        logger.warning(f"Cache TTS indisponível: {e}")
+        return None
+
+def create_streaming_stt() -> Optional[StreamingSTT]:
+    api_key = os.getenv("ASSEMBLYAI_API_KEY", "")
+    if not STT_STREAMING or not api_key:
+        return None
+    return AssemblyAIRealtimeSTT(api_key)
+
+class AGIHangup(Exception):
+    """Canal desligado ou conexão AGI encerrada"""
+
 class AsteriskAGI:
-    """Classe para comunicação com Asterisk via AGI"""
+    """Classe para comunicação com Asterisk via AGI (stdio ou FastAGI)"""
     
-    def __init__(self):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
         self.env = {}
-        self.setup_agi()
     
-    def setup_agi(self):
+    @classmethod
+    async def from_stdio(cls) -> "AsteriskAGI":
+        """AGI clássico: Asterisk fala com o processo por stdin/stdout"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        return cls(reader, writer)
+    
+    async def _readline(self) -> str:
+        line = await self.reader.readline()
+        if not line:
+            raise AGIHangup("Conexão AGI encerrada")
+        return line.decode(errors="replace").strip()
+    
+    async def setup_agi(self):
         """Configurar ambiente AGI"""
         try:
             # Ler variáveis do ambiente AGI
             while True:
-                line = sys.stdin.readline().strip()
+                line = await self._readline()
                 if line == '':
                     break
                 key, value = line.split(':', 1)
                 self.env[key.strip()] = value.strip()
             
             logger.info(f"AGI Environment: {self.env}")
+        except AGIHangup:
+            raise
         except Exception as e:
             logger.error(f"Erro ao configurar AGI: {e}")
     
-    def execute(self, command: str) -> str:
+    async def execute(self, command: str) -> str:
         """Executar comando AGI"""
         try:
-            print(command)
-            sys.stdout.flush()
-            result = sys.stdin.readline().strip()
+            self.writer.write(f"{command}\n".encode())
+            await self.writer.drain()
+            result = await self._readline()
+            # FastAGI avisa o desligamento com uma linha HANGUP antes do resultado
+            while result == "HANGUP":
+                result = await self._readline()
             logger.info(f"AGI Command: {command} -> {result}")
             return result
+        except (AGIHangup, ConnectionError):
+            raise AGIHangup(f"Canal encerrado durante '{command}'")
         except Exception as e:
             logger.error(f"Erro ao executar comando AGI: {e}")
             return ""
     
-    def answer(self):
+    async def answer(self):
         """Atender chamada"""
-        return self.execute("ANSWER")
+        return await self.execute("ANSWER")
     
-    def hangup(self):
+    async def hangup(self):
         """Desligar chamada"""
-        return self.execute("HANGUP")
+        return await self.execute("HANGUP")
     
-    def say_text(self, text: str, escape_digits: str = ""):
+    async def say_text(self, text: str, escape_digits: str = ""):
         """Falar texto usando TTS"""
-        return self.execute(f'SAY TEXT "{text}" "{escape_digits}"')
+        return await self.execute(f'SAY TEXT "{text}" "{escape_digits}"')
     
-    def stream_file(self, filename: str, escape_digits: str = ""):
+    async def stream_file(self, filename: str, escape_digits: str = ""):
         """Reproduzir arquivo de áudio"""
-        return self.execute(f'STREAM FILE {filename} "{escape_digits}"')
+        return await self.execute(f'STREAM FILE {filename} "{escape_digits}"')
     
-    def record_file(self, filename: str, format: str = "wav", escape_digits: str = "#", timeout: int = 10000):
-        """Gravar áudio"""
-        return self.execute(f'RECORD FILE {filename} {format} "{escape_digits}" {timeout}')
+    async def record_file(self, filename: str, format: str = "wav", escape_digits: str = "#", timeout: int = 10000,
+                          silence: Optional[int] = None):
+        """Gravar áudio (silence: encerra após N segundos de silêncio)"""
+        command = f'RECORD FILE {filename} {format} "{escape_digits}" {timeout}'
+        if silence:
+            command += f" 0 s={silence}"
+        return await self.execute(command)
     
-    def get_variable(self, variable: str) -> str:
+    async def get_variable(self, variable: str) -> str:
         """Obter variável do canal"""
-        result = self.execute(f"GET VARIABLE {variable}")
+        result = await self.execute(f"GET VARIABLE {variable}")
         return result.split('(')[1].split(')')[0] if '(' in result else ""
     
-    def set_variable(self, variable: str, value: str):
+    async def set_variable(self, variable: str, value: str):
         """Definir variável do canal"""
-        return self.execute(f'SET VARIABLE {variable} "{value}"')
-
-class GroqAI:
-    """Cliente para Groq AI"""
+        return await self.execute(f'SET VARIABLE {variable} "{value}"')
     
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://api.groq.com/openai/v1"
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-    
-    def generate_response(self, text: str, context: Dict = None) -> str:
-        """Gerar resposta usando Groq AI"""
+    def close(self):
         try:
-            messages = [
-                {
-                    "role": "system",
-                    "content": """Você é um assistente de IA para chamadas telefônicas. 
-                    Seja conciso, educado e útil. Responda em português brasileiro.
-                    Mantenha respostas curtas (máximo 2 frases) para chamadas telefônicas."""
-                },
-                {
-                    "role": "user", 
-                    "content": text
-                }
-            ]
-            
-            if context:
-                messages[0]["content"] += f"\nContexto da chamada: {json.dumps(context, ensure_ascii=False)}"
-            
-            payload = {
-                "model": "llama3-8b-8192",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 150,
-                "stream": False
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"].strip()
-            else:
-                logger.error(f"Erro Groq API: {response.status_code} - {response.text}")
-                return "Desculpe, não consegui processar sua solicitação no momento."
-                
-        except Exception as e:
-            logger.error(f"Erro ao gerar resposta Groq: {e}")
-            return "Desculpe, ocorreu um erro técnico."
+            self.writer.close()
+        except Exception:
+            pass
 
 class AssemblyAISTT:
     """Cliente para AssemblyAI Speech-to-Text"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, client: Optional[httpx.AsyncClient] = None,
+                 waiter: Optional[TranscriptWaiter] = None, webhook_url: Optional[str] = None):
         self.api_key = api_key
         self.headers = {"authorization": api_key}
         self.base_url = "https://api.assemblyai.com/v2"
+        # Pool HTTP compartilhado entre as chamadas (FastAGI)
+        self.client = client or httpx.AsyncClient(headers=self.headers, timeout=30)
+        # Polling adaptativo: 200ms no início, backoff exponencial até o prazo
+        self.waiter = waiter or TranscriptWaiter(
+            initial_interval=float(os.getenv("STT_POLL_INITIAL", "0.2")),
+            max_interval=float(os.getenv("STT_POLL_MAX", "2.0")),
+            deadline=float(os.getenv("STT_DEADLINE", "30"))
+        )
+        # URL pública do webhook de conclusão (opcional)
+        self.webhook_url = webhook_url if webhook_url is not None else os.getenv("STT_WEBHOOK_URL") or None
     
-    def transcribe_audio(self, audio_file_path: str) -> str:
+    async def transcribe_audio(self, audio_file_path: str) -> str:
         """Transcrever arquivo de áudio"""
         try:
             # Upload do arquivo
-            with open(audio_file_path, 'rb') as f:
-                upload_response = requests.post(
-                    f"{self.base_url}/upload",
-                    headers=self.headers,
-                    files={'file': f},
-                    timeout=30
-                )
+            audio_data = await asyncio.to_thread(self._read_file, audio_file_path)
+            upload_response = await self.client.post(
+                f"{self.base_url}/upload",
+                headers=self.headers,
+                content=audio_data,
+                timeout=30
+            )
             
             if upload_response.status_code != 200:
                 logger.error(f"Erro no upload: {upload_response.text}")
@@ -177,8 +211,10 @@ class AssemblyAISTT:
                 "audio_url": audio_url,
                 "language_code": "pt"
             }
+            if self.webhook_url:
+                transcript_request["webhook_url"] = self.webhook_url
             
-            transcript_response = requests.post(
+            transcript_response = await self.client.post(
                 f"{self.base_url}/transcript",
                 headers=self.headers,
                 json=transcript_request,
@@ -192,56 +228,80 @@ class AssemblyAISTT:
             transcript_id = transcript_response.json()["id"]
             
             # Aguardar conclusão
-            while True:
-                status_response = requests.get(
+            async def fetch_status() -> Dict[str, Any]:
+                status_response = await self.client.get(
                     f"{self.base_url}/transcript/{transcript_id}",
                     headers=self.headers,
                     timeout=10
                 )
-                
                 if status_response.status_code != 200:
                     logger.error(f"Erro ao verificar status: {status_response.text}")
-                    return ""
-                
-                status_data = status_response.json()
-                
-                if status_data["status"] == "completed":
-                    return status_data["text"]
-                elif status_data["status"] == "error":
-                    logger.error(f"Erro na transcrição: {status_data}")
-                    return ""
-                
-                time.sleep(2)
+                    return {"status": "error"}
+                return status_response.json()
+            
+            status_data = await self.waiter.wait(transcript_id, fetch_status)
+            
+            if status_data["status"] == "completed":
+                return status_data["text"]
+            logger.error(f"Erro na transcrição: {status_data}")
+            return ""
                 
+        except TranscriptTimeout as e:
+            logger.error(f"Transcrição expirou: {e}")
+            return ""
         except Exception as e:
             logger.error(f"Erro AssemblyAI: {e}")
             return ""
+    
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+    
+    async def aclose(self):
+        await self.client.aclose()
 
 class AIAssistant:
     """Assistente de IA principal"""
     
-    def __init__(self):
-        self.agi = AsteriskAGI()
-        self.groq = GroqAI(os.getenv("GROQ_API_KEY", ""))
-        self.assembly = AssemblyAISTT(os.getenv("ASSEMBLYAI_API_KEY", ""))
+    def __init__(self, agi: AsteriskAGI, groq: GroqAI, assembly: AssemblyAISTT,
+                 streaming_stt: Optional[StreamingSTT] = None, tts_cache: Optional[TTSCache] = None,
+                 ami: Optional[AsteriskAMI] = None):
+        # Clientes Groq/AssemblyAI são compartilhados entre chamadas no FastAGI
+        self.agi = agi
+        self.groq = groq
+        self.assembly = assembly
+        # STT em tempo real durante a gravação; None usa upload + polling
+        self.streaming_stt = streaming_stt
+        # AMI para encerrar a gravação no fim de fala do STT; None espera o silêncio
+        self.ami = ami
+        # VAD local antes do upload (modo em lote)
+        self.vad = EnergyVAD() if VAD_ENABLED else None
+        # Frases sintetizadas uma vez e tocadas com STREAM FILE
+        self.tts_cache = tts_cache
         self.call_context = {
-            "caller_id": self.agi.get_variable("CALLERID(num)"),
-            "caller_name": self.agi.get_variable("CALLERID(name)"),
+            "caller_id": "",
+            "caller_name": "",
             "start_time": datetime.now().isoformat(),
             "conversation": []
         }
+    
+    async def load_call_context(self):
+        """Ler dados do chamador do canal"""
+        self.call_context["caller_id"] = await self.agi.get_variable("CALLERID(num)")
+        self.call_context["caller_name"] = await self.agi.get_variable("CALLERID(name)")
         
-    def run(self):
+    async def run(self):
         """Executar assistente de IA"""
         try:
+            await self.load_call_context()
             logger.info(f"🤖 Iniciando AI Assistant para chamada: {self.call_context}")
             
             # Atender chamada
-            self.agi.answer()
+            await self.agi.answer()
             
             # Saudação inicial
-            greeting = f"Olá! Eu sou seu assistente de IA. Como posso ajudá-lo hoje?"
-            self.speak(greeting)
+            await self.speak(PROMPTS["greeting"])
             
             # Loop principal de conversação
             conversation_count = 0
@@ -249,21 +309,60 @@ class AIAssistant:
             
             while conversation_count < max_turns:
                 # Gravar fala do usuário
-                audio_file = f"/tmp/user_audio_{int(time.time())}.wav"
+                # O Asterisk acrescenta a extensão do formato ao nome gravado
+                audio_base = f"/tmp/user_audio_{uuid.uuid4().hex}"
+                audio_file = f"{audio_base}.wav"
                 logger.info("🎤 Aguardando fala do usuário...")
                 
-                result = self.agi.record_file(audio_file, "wav", "#", 10000)
-                
-                if "timeout" in result.lower():
-                    self.speak("Não ouvi nada. Posso ajudá-lo com mais alguma coisa?")
-                    continue
+                user_text = None
+                recorded_at = None
+                if self.streaming_stt:
+                    # Transcreve enquanto grava; a gravação termina no fim de fala do STT (ou no silêncio)
+                    result, user_text = await transcribe_while_recording(
+                        self.streaming_stt,
+                        self.agi.record_file(audio_base, "wav", "#", 10000, silence=STT_RECORD_SILENCE),
+                        audio_file,
+                        stop_recording=self.stop_recording if self.ami else None
+                    )
+                    recorded_at = time.monotonic()
+                    if user_text == "":
+                        self._remove_files(audio_file)
+                        await self.speak(PROMPTS["no_input"])
+                        continue
+                else:
+                    result = await self.agi.record_file(audio_base, "wav", "#", 10000)
+                    recorded_at = time.monotonic()
+                    
+                    # Sem VAD, o timeout do RECORD FILE é o único sinal de silêncio
+                    if not self.vad and "timeout" in result.lower():
+                        await self.speak(PROMPTS["no_input"])
+                        continue
                 
-                # Transcrever áudio
-                logger.info("🔄 Transcrevendo áudio...")
-                user_text = self.assembly.transcribe_audio(audio_file)
+                if user_text is None:
+                    upload_file = audio_file
+                    if self.vad:
+                        # Corta o silêncio e descarta gravações sem fala antes do STT
+                        try:
+                            vad_result = await asyncio.to_thread(preprocess_recording, audio_file, self.vad)
+                        except Exception as e:
+                            logger.warning(f"VAD indisponível para {audio_file}: {e}")
+                        else:
+                            if not vad_result.has_speech:
+                                self._remove_files(audio_file)
+                                await self.speak(PROMPTS["no_input"])
+                                continue
+                            upload_file = vad_result.path
+                    
+                    # Transcrever áudio
+                    logger.info("🔄 Transcrevendo áudio...")
+                    user_text = await self.assembly.transcribe_audio(upload_file)
+                    if upload_file != audio_file:
+                        self._remove_files(upload_file)
+                stt_ms = (time.monotonic() - recorded_at) * 1000
+                LATENCY["stt_ms"].observe(stt_ms)
                 
                 if not user_text:
-                    self.speak("Desculpe, não consegui entender. Pode repetir?")
+                    await self.speak(PROMPTS["not_understood"])
                     continue
                 
                 logger.info(f"👤 Usuário disse: {user_text}")
@@ -275,12 +374,18 @@ class AIAssistant:
                 
                 # Verificar se quer encerrar
                 if any(word in user_text.lower() for word in ["tchau", "obrigado", "desligar", "encerrar"]):
-                    self.speak("Obrigado por ligar! Tenha um ótimo dia!")
+                    await self.speak(PROMPTS["goodbye"])
                     break
                 
                 # Gerar resposta IA
                 logger.info("🧠 Gerando resposta IA...")
-                ai_response = self.groq.generate_response(user_text, self.call_context)
+                llm_started = time.monotonic()
+                ai_response = await self.groq.generate_response(user_text, self.call_context)
+                llm_ms = (time.monotonic() - llm_started) * 1000
+                LATENCY["llm_ms"].observe(llm_ms)
+                turn_ms = (time.monotonic() - recorded_at) * 1000
+                LATENCY["turn_ms"].observe(turn_ms)
+                logger.info(f"⏱️ Turno: STT {stt_ms:.0f}ms, IA {llm_ms:.0f}ms, total {turn_ms:.0f}ms")
                 
                 logger.info(f"🤖 IA responde: {ai_response}")
                 self.call_context["conversation"].append({
@@ -290,7 +395,7 @@ class AIAssistant:
                 })
                 
                 # Falar resposta
-                self.speak(ai_response)
+                await self.speak(ai_response)
                 
                 conversation_count += 1
                 
@@ -302,29 +407,66 @@ class AIAssistant:
             
             # Encerrar chamada
             if conversation_count >= max_turns:
-                self.speak("Foi um prazer conversar com você! Até logo!")
+                await self.speak(PROMPTS["max_turns"])
             
-            self.agi.hangup()
+            await self.agi.hangup()
             
+        except AGIHangup:
+            logger.info("📴 Chamador desligou")
         except Exception as e:
             logger.error(f"❌ Erro no AI Assistant: {e}")
-            self.speak("Desculpe, ocorreu um erro técnico. Encerrando chamada.")
-            self.agi.hangup()
+            try:
+                await self.speak(PROMPTS["error"])
+                await self.agi.hangup()
+            except AGIHangup:
+                pass
     
-    def speak(self, text: str):
+    async def stop_recording(self):
+        """Encerra o RECORD FILE em andamento com o dígito de escape (#) via AMI"""
+        await self.ami.receive_dtmf(self.agi.env.get("agi_channel", ""), "#")
+
+    @staticmethod
+    def _remove_files(*paths: str):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    async def speak(self, text: str):
         """Falar texto usando TTS"""
         try:
             logger.info(f"🗣️ Falando: {text}")
-            # Para produção, usar TTS real (Festival, eSpeak, etc.)
-            # Por enquanto, usar SAY TEXT do Asterisk
-            self.agi.say_text(text)
+            if self.tts_cache:
+                try:
+                    audio_path = await self.tts_cache.get_path(text)
+                except Exception as e:
+                    logger.warning(f"Cache TTS falhou, usando SAY TEXT: {e}")
+                else:
+                    await self.agi.stream_file(audio_path)
+                    return
+            await self.agi.say_text(text)
+        except AGIHangup:
+            raise
         except Exception as e:
             logger.error(f"Erro ao falar: {e}")
 
+async def run_stdio():
+    """Modo AGI clássico (um processo por chamada); prefira o fastagi_server.py"""
+    agi = await AsteriskAGI.from_stdio()
+    await agi.setup_agi()
+    groq = GroqAI(os.getenv("GROQ_API_KEY", ""))
+    assembly = AssemblyAISTT(os.getenv("ASSEMBLYAI_API_KEY", ""))
+    try:
+        # O disco do cache é compartilhado com o FastAGI, que pré-renderiza os prompts
+        await AIAssistant(agi, groq, assembly, create_streaming_stt(), create_tts_cache(), create_ami()).run()
+    finally:
+        await assembly.aclose()
+        await groq.aclose()
+
 if __name__ == "__main__":
     try:
-        assistant = AIAssistant()
-        assistant.run()
+        asyncio.run(run_stdio())
     except Exception as e:
         logger.error(f"Erro fatal: {e}")
         sys.exit(1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Cliente mínimo do Asterisk Manager Interface (AMI)
+Durante o RECORD FILE o canal AGI fica bloqueado; para encerrar a gravação
+no fim de fala detectado pelo STT, o AMI injeta no canal o dígito de escape
+do RECORD FILE (PlayDTMF com Receive: yes, como se o chamador o digitasse)
+"""
+
+import os
+import asyncio
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger("asterisk_ami")
+
+AMI_HOST = os.getenv("AMI_HOST", "127.0.0.1")
+AMI_PORT = int(os.getenv("AMI_PORT", "5038"))
+AMI_USERNAME = os.getenv("AMI_USERNAME", "")
+AMI_SECRET = os.getenv("AMI_SECRET", "")
+AMI_TIMEOUT = float(os.getenv("AMI_TIMEOUT", "2"))
+
+class AMIError(Exception):
+    """Ação AMI recusada ou conexão perdida"""
+
+class AsteriskAMI:
+    """Uma conexão AMI curta por ação (login, ação, logoff)"""
+
+    def __init__(self, host: str = AMI_HOST, port: int = AMI_PORT, username: str = AMI_USERNAME,
+                 secret: str = AMI_SECRET, timeout: float = AMI_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.secret = secret
+        self.timeout = timeout
+
+    @staticmethod
+    async def _send(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, fields: Dict[str, str]) -> Dict[str, str]:
+        """Envia uma ação e lê o bloco de resposta (até a linha em branco)"""
+        writer.write("".join(f"{key}: {value}\r\n" for key, value in fields.items()).encode() + b"\r\n")
+        await writer.drain()
+        response: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise AMIError(f"AMI encerrou a conexão durante {fields['Action']}")
+            line = line.decode(errors="replace").strip()
+            if not line:
+                if "Response" in response:
+                    return response
+                # Evento solto antes da resposta
+                response = {}
+                continue
+            key, _, value = line.partition(":")
+            response[key.strip()] = value.strip()
+
+    async def _action(self, fields: Dict[str, str]) -> Dict[str, str]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            # Banner "Asterisk Call Manager/x.y"
+            await reader.readline()
+            login = await self._send(reader, writer, {
+                "Action": "Login", "Username": self.username, "Secret": self.secret, "Events": "off",
+            })
+            if login.get("Response") != "Success":
+                raise AMIError(f"Login AMI recusado: {login.get('Message', login)}")
+            response = await self._send(reader, writer, fields)
+            if response.get("Response") != "Success":
+                raise AMIError(f"{fields['Action']} recusado: {response.get('Message', response)}")
+            writer.write(b"Action: Logoff\r\n\r\n")
+            await writer.drain()
+            return response
+        finally:
+            writer.close()
+
+    async def receive_dtmf(self, channel: str, digit: str):
+        """Simula o chamador digitando digit no canal (requer PlayDTMF com a opção Receive)"""
+        await asyncio.wait_for(
+            self._action({"Action": "PlayDTMF", "Channel": channel, "Digit": digit, "Receive": "yes"}),
+            timeout=self.timeout,
+        )
+
+def create_ami() -> Optional[AsteriskAMI]:
+    """AMI configurado (AMI_USERNAME/AMI_SECRET) ou None"""
+    if not AMI_USERNAME or not AMI_SECRET:
+        return None
+    return AsteriskAMI()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Pré-processamento do áudio gravado pelo AGI
+VAD local por energia + taxa de cruzamentos por zero: corta o silêncio do
+início e do fim da gravação e evita chamar o STT quando ninguém falou
+"""
+
+import math
+import wave
+import logging
+from array import array
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("audio_preprocessing")
+
+# Totais do processo (bytes enviados ao STT vs. gravados)
+VAD_STATS = {
+    "recordings": 0,
+    "no_speech": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+}
+
+class VADResult:
+    """Resultado da detecção de fala em uma gravação"""
+
+    def __init__(self, has_speech: bool, total_ms: int, speech_start_ms: int = 0, speech_end_ms: int = 0,
+                 speech_ms: int = 0, path: Optional[str] = None, bytes_in: int = 0, bytes_out: int = 0):
+        self.has_speech = has_speech
+        self.total_ms = total_ms
+        self.speech_start_ms = speech_start_ms
+        self.speech_end_ms = speech_end_ms
+        self.speech_ms = speech_ms
+        self.path = path
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+class EnergyVAD:
+    """VAD por energia RMS e cruzamentos por zero, com limiar adaptativo ao ruído"""
+
+    def __init__(
+        self,
+        frame_ms: int = 20,
+        min_energy: float = 300.0,
+        noise_factor: float = 3.0,
+        zcr_threshold: float = 0.25,
+        min_speech_ms: int = 200,
+        hangover_ms: int = 300,
+        padding_ms: int = 150,
+    ):
+        self.frame_ms = frame_ms
+        self.min_energy = min_energy
+        self.noise_factor = noise_factor
+        self.zcr_threshold = zcr_threshold
+        self.min_speech_ms = min_speech_ms
+        self.hangover_ms = hangover_ms
+        self.padding_ms = padding_ms
+
+    @staticmethod
+    def _frame_features(samples: array, start: int, end: int):
+        energy = 0
+        crossings = 0
+        previous = samples[start]
+        for i in range(start, end):
+            value = samples[i]
+            energy += value * value
+            if (value >= 0) != (previous >= 0):
+                crossings += 1
+            previous = value
+        count = end - start
+        return math.sqrt(energy / count), crossings / count
+
+    def classify(self, samples: array, sample_rate: int) -> List[bool]:
+        """Marca cada quadro como fala (True) ou silêncio"""
+        frame_size = max(1, sample_rate * self.frame_ms // 1000)
+        features = [
+            self._frame_features(samples, start, min(start + frame_size, len(samples)))
+            for start in range(0, len(samples) - frame_size + 1, frame_size)
+        ]
+        if not features:
+            return []
+
+        # Piso de ruído: percentil 20 das energias da própria gravação
+        energies = sorted(energy for energy, _ in features)
+        noise_floor = energies[len(energies) // 5]
+        threshold = max(self.min_energy, noise_floor * self.noise_factor)
+
+        # Vozeado: energia alta; fricativas: energia média com muitos cruzamentos
+        return [
+            energy >= threshold or (energy >= threshold * 0.5 and zcr >= self.zcr_threshold)
+            for energy, zcr in features
+        ]
+
+    def detect(self, samples: array, sample_rate: int) -> VADResult:
+        flags = self.classify(samples, sample_rate)
+        total_ms = len(samples) * 1000 // sample_rate if sample_rate else 0
+        min_frames = max(1, self.min_speech_ms // self.frame_ms)
+        hangover_frames = self.hangover_ms // self.frame_ms
+
+        # Segmentos de fala: trechos com pelo menos min_speech_ms, tolerando pausas curtas
+        segments = []
+        start = None
+        silence_run = 0
+        for index, is_speech in enumerate(flags + [False] * (hangover_frames + 1)):
+            if is_speech:
+                if start is None:
+                    start = index
+                silence_run = 0
+            elif start is not None:
+                silence_run += 1
+                if silence_run > hangover_frames:
+                    end = index - silence_run + 1
+                    if sum(flags[start:end]) >= min_frames:
+                        segments.append((start, end))
+                    start = None
+                    silence_run = 0
+
+        if not segments:
+            return VADResult(False, total_ms)
+
+        speech_ms = sum(end - start for start, end in segments) * self.frame_ms
+        return VADResult(
+            True,
+            total_ms,
+            speech_start_ms=max(0, segments[0][0] * self.frame_ms - self.padding_ms),
+            speech_end_ms=min(total_ms, segments[-1][1] * self.frame_ms + self.padding_ms),
+            speech_ms=speech_ms,
+        )
+
+def preprocess_recording(path: str, vad: Optional[EnergyVAD] = None) -> VADResult:
+    """Analisa o WAV gravado e escreve a versão sem silêncio em <path>.trim.wav"""
+    vad = vad or EnergyVAD()
+    with wave.open(path, "rb") as source:
+        params = source.getparams()
+        frames = source.readframes(params.nframes)
+
+    VAD_STATS["recordings"] += 1
+    VAD_STATS["bytes_in"] += len(frames)
+
+    if params.sampwidth != 2 or params.nchannels != 1:
+        # Formato inesperado: não arrisca cortar, envia como está
+        VAD_STATS["bytes_out"] += len(frames)
+        return VADResult(True, 0, path=path, bytes_in=len(frames), bytes_out=len(frames))
+
+    samples = array("h", frames)
+    result = vad.detect(samples, params.framerate)
+    result.bytes_in = len(frames)
+    if not result.has_speech:
+        VAD_STATS["no_speech"] += 1
+        logger.info(f"🔇 Sem fala em {path} ({result.total_ms}ms gravados)")
+        return result
+
+    first = result.speech_start_ms * params.framerate // 1000
+    last = result.speech_end_ms * params.framerate // 1000
+    trimmed = samples[first:last].tobytes()
+
+    trimmed_path = f"{path}.trim.wav"
+    with wave.open(trimmed_path, "wb") as target:
+        target.setnchannels(1)
+        target.setsampwidth(2)
+        target.setframerate(params.framerate)
+        target.writeframes(trimmed)
+
+    result.path = trimmed_path
+    result.bytes_out = len(trimmed)
+    VAD_STATS["bytes_out"] += len(trimmed)
+    logger.info(
+        f"✂️ Fala {result.speech_start_ms}-{result.speech_end_ms}ms de {result.total_ms}ms; "
+        f"{len(frames)} -> {len(trimmed)} bytes"
+    )
+    return result
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Servidor FastAGI (agi://host:4573) para o Assistente de IA
+Um único processo asyncio atende todas as chamadas do Asterisk: cada conexão
+vira uma corrotina AIAssistant, reaproveitando os pools HTTP do Groq e do
+AssemblyAI em vez de abrir um interpretador Python por chamada
+"""
+
+import os
+import signal
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict
+
+from ai_assistant import (
+    AGIHangup, AsteriskAGI, AssemblyAISTT, AIAssistant, GroqAI, PROMPTS,
+    create_streaming_stt, create_tts_cache
+)
+from asterisk_ami import create_ami
+from transcript_waiter import TranscriptWebhookRegistry, latency_snapshot, start_webhook_listener
+from audio_preprocessing import VAD_STATS
+
+logger = logging.getLogger("fastagi_server")
+
+FASTAGI_HOST = os.getenv("FASTAGI_HOST", "127.0.0.1")
+FASTAGI_PORT = int(os.getenv("FASTAGI_PORT", "4573"))
+FASTAGI_MAX_SESSIONS = int(os.getenv("FASTAGI_MAX_SESSIONS", "200"))
+# Porta local do webhook de conclusão da AssemblyAI (usado se STT_WEBHOOK_URL estiver definido)
+STT_WEBHOOK_PORT = int(os.getenv("STT_WEBHOOK_PORT", "4574"))
+
+# Scripts aceitos em agi://host:porta/<script>
+SCRIPTS = {"ai_assistant", "ai_assistant.py"}
+
+class FastAGIServer:
+    """Servidor TCP FastAGI com clientes compartilhados entre as chamadas"""
+
+    def __init__(self, host: str = FASTAGI_HOST, port: int = FASTAGI_PORT, max_sessions: int = FASTAGI_MAX_SESSIONS):
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.groq = GroqAI(os.getenv("GROQ_API_KEY", ""))
+        self.assembly = AssemblyAISTT(os.getenv("ASSEMBLYAI_API_KEY", ""))
+        self.webhooks = TranscriptWebhookRegistry()
+        self.assembly.waiter.webhooks = self.webhooks if self.assembly.webhook_url else None
+        self.webhook_server = None
+        self.streaming_stt = create_streaming_stt()
+        self.ami = create_ami() if self.streaming_stt else None
+        self.tts_cache = create_tts_cache()
+        self.server = None
+        self.sessions: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "total_sessions": 0,
+            "rejected_sessions": 0,
+            "failed_sessions": 0,
+            "started_at": datetime.now().isoformat(),
+        }
+
+    async def start(self):
+        if self.tts_cache:
+            # Prompts fixos prontos antes da primeira chamada
+            await self.tts_cache.prerender(PROMPTS.values())
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        logger.info(f"🚀 FastAGI escutando em agi://{self.host}:{self.port}")
+        if self.assembly.webhook_url:
+            self.webhook_server = await start_webhook_listener(self.webhooks, "0.0.0.0", STT_WEBHOOK_PORT)
+
+    async def shutdown(self):
+        """Para de aceitar chamadas, encerra as sessões e fecha os pools"""
+        for server in (self.server, self.webhook_server):
+            if server:
+                server.close()
+                await server.wait_closed()
+        for task in list(self.sessions.values()):
+            task.cancel()
+        if self.sessions:
+            await asyncio.gather(*self.sessions.values(), return_exceptions=True)
+        await self.assembly.aclose()
+        await self.groq.aclose()
+        logger.info(f"🛑 FastAGI encerrado. Latências: {latency_snapshot()}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Uma conexão FastAGI = uma chamada"""
+        agi = AsteriskAGI(reader, writer)
+        session_id = f"agi_{self.stats['total_sessions']}"
+        self.stats["total_sessions"] += 1
+        self.sessions[session_id] = asyncio.current_task()
+        try:
+            await agi.setup_agi()
+            script = agi.env.get("agi_network_script", "").split("?", 1)[0].strip("/")
+
+            if len(self.sessions) > self.max_sessions:
+                self.stats["rejected_sessions"] += 1
+                logger.warning(f"⚠️ Limite de {self.max_sessions} sessões atingido; recusando {agi.env.get('agi_channel')}")
+                await agi.execute("SET VARIABLE AGISTATUS FAILURE")
+                return
+            if script not in SCRIPTS:
+                self.stats["failed_sessions"] += 1
+                logger.warning(f"⚠️ Script FastAGI desconhecido: '{script}'")
+                await agi.execute("SET VARIABLE AGISTATUS FAILURE")
+                return
+
+            await AIAssistant(agi, self.groq, self.assembly, self.streaming_stt, self.tts_cache, self.ami).run()
+        except AGIHangup:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed_sessions"] += 1
+            logger.error(f"❌ Erro na sessão FastAGI {session_id}: {e}")
+        finally:
+            self.sessions.pop(session_id, None)
+            agi.close()
+            turn = latency_snapshot()["turn_ms"]
+            if turn["count"]:
+                logger.info(f"⏱️ Latência por turno: p50 {turn['p50_ms']:.0f}ms, p95 {turn['p95_ms']:.0f}ms ({turn['count']} turnos)")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active_sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            **self.stats,
+            "latency": latency_snapshot(),
+            "vad": dict(VAD_STATS),
+            "tts_cache": self.tts_cache.status() if self.tts_cache else None,
+        }
+
+async def main():
+    server = FastAGIServer()
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await server.start()
+    await stop.wait()
+    await server.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+STT em streaming para o caminho AGI
+Enquanto o RECORD FILE do Asterisk grava, o WAV é lido em tempo real e os
+quadros de áudio seguem para uma sessão de reconhecimento em tempo real até
+a gravação parar. O fim de fala detectado pelo STT encerra o turno parando a
+gravação, sem esperar o silêncio do RECORD FILE nem fazer upload e polling
+"""
+
+import os
+import abc
+import json
+import base64
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+import websockets
+
+logger = logging.getLogger("streaming_stt")
+
+WAV_HEADER_SIZE = 44       # cabeçalho PCM gerado pelo Asterisk (formato wav)
+SAMPLE_RATE = 8000         # slin 8 kHz, 16 bits, mono
+BYTES_PER_MS = SAMPLE_RATE * 2 // 1000
+
+# Chamado a cada fim de fala detectado pelo STT
+EndpointCallback = Callable[[], None]
+
+class StreamingSTT(abc.ABC):
+    """Interface de reconhecimento em streaming
+
+    Implementações consomem todos os quadros PCM 16 bits até o áudio acabar,
+    avisam on_endpoint a cada fim de fala detectado e devolvem o texto final
+    completo (todas as frases)
+    """
+
+    @abc.abstractmethod
+    async def transcribe_stream(
+        self,
+        frames: AsyncIterator[bytes],
+        sample_rate: int = SAMPLE_RATE,
+        on_endpoint: Optional[EndpointCallback] = None,
+    ) -> str:
+        ...
+
+    async def aclose(self):
+        pass
+
+async def tail_wav_frames(
+    path: str,
+    recording_done: asyncio.Event,
+    frame_ms: int = 100,
+    poll_interval: float = 0.02,
+    wait_for_file: float = 3.0,
+) -> AsyncIterator[bytes]:
+    """Lê um WAV que ainda está sendo gravado, em quadros de frame_ms"""
+    frame_size = frame_ms * BYTES_PER_MS
+    waited = 0.0
+    while not os.path.exists(path):
+        if recording_done.is_set() or waited >= wait_for_file:
+            return
+        await asyncio.sleep(poll_interval)
+        waited += poll_interval
+
+    with open(path, "rb") as f:
+        # Pula o cabeçalho (o Asterisk só corrige os tamanhos ao fechar o arquivo)
+        while f.tell() < WAV_HEADER_SIZE:
+            skipped = f.read(WAV_HEADER_SIZE - f.tell())
+            if not skipped:
+                if recording_done.is_set():
+                    return
+                await asyncio.sleep(poll_interval)
+
+        pending = b""
+        while True:
+            chunk = f.read(frame_size - len(pending))
+            if chunk:
+                pending += chunk
+                if len(pending) >= frame_size:
+                    yield pending
+                    pending = b""
+                continue
+            if recording_done.is_set():
+                # Último trecho depois que a gravação terminou
+                rest = pending + f.read()
+                if rest:
+                    yield rest
+                return
+            await asyncio.sleep(poll_interval)
+
+class AssemblyAIRealtimeSTT(StreamingSTT):
+    """Sessão de tempo real da AssemblyAI via websocket
+
+    A URL é configurável (ASSEMBLYAI_REALTIME_URL) para que um servidor local
+    com o mesmo protocolo possa substituí-la
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        url: str = os.getenv("ASSEMBLYAI_REALTIME_URL", "wss://api.assemblyai.com/v2/realtime/ws"),
+        end_utterance_silence_ms: int = int(os.getenv("STT_END_SILENCE_MS", "700")),
+        final_timeout: float = 5.0,
+    ):
+        self.api_key = api_key
+        self.url = url
+        self.end_utterance_silence_ms = end_utterance_silence_ms
+        self.final_timeout = final_timeout
+
+    async def transcribe_stream(
+        self,
+        frames: AsyncIterator[bytes],
+        sample_rate: int = SAMPLE_RATE,
+        on_endpoint: Optional[EndpointCallback] = None,
+    ) -> str:
+        url = f"{self.url}?sample_rate={sample_rate}"
+        headers = {"Authorization": self.api_key} if self.api_key else {}
+        finals = []
+
+        async with websockets.connect(url, extra_headers=headers, open_timeout=5) as ws:
+            begin = json.loads(await asyncio.wait_for(ws.recv(), timeout=5))
+            if begin.get("message_type") != "SessionBegins":
+                raise ConnectionError(f"Sessão STT recusada: {begin}")
+            await ws.send(json.dumps({"end_utterance_silence_threshold": self.end_utterance_silence_ms}))
+
+            async def receive():
+                async for raw in ws:
+                    message = json.loads(raw)
+                    kind = message.get("message_type")
+                    if kind == "FinalTranscript" and message.get("text"):
+                        finals.append(message["text"])
+                        # Fim de fala detectado pelo servidor; o áudio continua até a gravação parar
+                        if on_endpoint:
+                            on_endpoint()
+                    elif kind == "SessionTerminated":
+                        return
+                    elif "error" in message:
+                        logger.error(f"Erro STT: {message['error']}")
+                        return
+
+            receiver = asyncio.create_task(receive())
+            try:
+                async for frame in frames:
+                    if receiver.done():
+                        break
+                    await ws.send(json.dumps({"audio_data": base64.b64encode(frame).decode()}))
+
+                # Fecha a sessão; o servidor envia o FinalTranscript pendente antes de terminar
+                if not receiver.done():
+                    await ws.send(json.dumps({"terminate_session": True}))
+                    await asyncio.wait_for(receiver, timeout=self.final_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("STT não confirmou o fim da sessão a tempo")
+            finally:
+                receiver.cancel()
+                if hasattr(frames, "aclose"):
+                    await frames.aclose()
+
+        return " ".join(finals).strip()
+
+async def transcribe_while_recording(
+    stt: StreamingSTT,
+    record_coro,
+    audio_file: str,
+    frame_ms: int = 100,
+    stop_recording: Optional[Callable[[], Awaitable]] = None,
+) -> Tuple[str, Optional[str]]:
+    """Executa o RECORD FILE e o STT em paralelo
+
+    O STT recebe o áudio até a gravação terminar; no primeiro fim de fala
+    detectado, stop_recording (se houver) encerra a gravação. Sem ele, vale o
+    silêncio do RECORD FILE. Retorna (resultado do RECORD FILE, texto final);
+    o texto é None se o streaming falhar, para o chamador cair no modo em lote
+    """
+    recording_done = asyncio.Event()
+    stop_task: Optional[asyncio.Task] = None
+
+    async def record():
+        try:
+            return await record_coro
+        finally:
+            recording_done.set()
+
+    async def stop():
+        try:
+            await stop_recording()
+        except Exception as e:
+            # A gravação ainda termina pelo silêncio do RECORD FILE
+            logger.warning(f"Não foi possível parar a gravação no fim de fala: {e}")
+
+    def on_endpoint():
+        nonlocal stop_task
+        if stop_recording and stop_task is None and not recording_done.is_set():
+            stop_task = asyncio.create_task(stop())
+
+    record_task = asyncio.create_task(record())
+    stt_task = asyncio.create_task(
+        stt.transcribe_stream(tail_wav_frames(audio_file, recording_done, frame_ms), on_endpoint=on_endpoint)
+    )
+    try:
+        record_result = await record_task
+    except BaseException:
+        stt_task.cancel()
+        raise
+    finally:
+        if stop_task is not None:
+            await asyncio.gather(stop_task, return_exceptions=True)
+
+    try:
+        text = await stt_task
+    except Exception as e:
+        logger.error(f"Erro no STT em streaming: {e}")
+        return record_result, None
+
+    logger.info(f"Gravação: {record_result} | transcrição em streaming: '{text}'")
+    return record_result, text
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Espera adaptativa pela transcrição da AssemblyAI
+Consulta cedo e com frequência (200ms) e vai espaçando as consultas de forma
+exponencial até um prazo total; se a AssemblyAI chamar o webhook, a espera
+termina na hora. Também guarda histogramas de latência por turno
+"""
+
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("transcript_waiter")
+
+class TranscriptTimeout(Exception):
+    """Transcrição não concluída dentro do prazo"""
+
+class LatencyHistogram:
+    """Histograma de latências em ms (buckets fixos + percentis recentes)"""
+
+    BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+    def __init__(self, name: str, window: int = 1000):
+        self.name = name
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value_ms: float):
+        index = next((i for i, bound in enumerate(self.BUCKETS_MS) if value_ms <= bound), len(self.BUCKETS_MS))
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+        self.recent.append(value_ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)], 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {f"<={bound}": self.counts[i] for i, bound in enumerate(self.BUCKETS_MS)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 1),
+            "buckets": buckets,
+        }
+
+# Latências por turno de conversa (compartilhadas pelo processo FastAGI)
+LATENCY = {
+    "stt_ms": LatencyHistogram("stt_ms"),          # fim da gravação -> texto
+    "stt_wait_ms": LatencyHistogram("stt_wait_ms"),  # espera pelo status "completed"
+    "llm_ms": LatencyHistogram("llm_ms"),          # texto -> resposta da IA
+    "turn_ms": LatencyHistogram("turn_ms"),        # fim da gravação -> início da fala
+}
+
+def latency_snapshot() -> Dict[str, Any]:
+    return {name: histogram.snapshot() for name, histogram in LATENCY.items()}
+
+class TranscriptWebhookRegistry:
+    """Transcrições aguardando o webhook de conclusão"""
+
+    def __init__(self):
+        self._events: Dict[str, asyncio.Event] = {}
+
+    def register(self, transcript_id: str) -> asyncio.Event:
+        return self._events.setdefault(transcript_id, asyncio.Event())
+
+    def discard(self, transcript_id: str):
+        self._events.pop(transcript_id, None)
+
+    def notify(self, transcript_id: str, status: str = "completed") -> bool:
+        event = self._events.get(transcript_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+class TranscriptWaiter:
+    """Polling com backoff exponencial, prazo total e atalho por webhook"""
+
+    def __init__(
+        self,
+        initial_interval: float = 0.2,
+        max_interval: float = 2.0,
+        multiplier: float = 1.5,
+        deadline: float = 30.0,
+        webhooks: Optional[TranscriptWebhookRegistry] = None,
+    ):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.deadline = deadline
+        self.webhooks = webhooks
+
+    async def wait(self, transcript_id: str, fetch_status: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Aguarda status completed/error; TranscriptTimeout ao passar do prazo"""
+        started = time.monotonic()
+        interval = self.initial_interval
+        event = self.webhooks.register(transcript_id) if self.webhooks else None
+        polls = 0
+        try:
+            while True:
+                data = await fetch_status()
+                polls += 1
+                if data.get("status") in ("completed", "error"):
+                    LATENCY["stt_wait_ms"].observe((time.monotonic() - started) * 1000)
+                    logger.info(f"Transcrição {transcript_id} pronta após {polls} consultas")
+                    return data
+
+                remaining = self.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise TranscriptTimeout(f"Transcrição {transcript_id} não concluída em {self.deadline}s")
+
+                sleep_for = min(interval, remaining)
+                if event is not None:
+                    try:
+                        # Webhook recebido: consulta imediatamente
+                        await asyncio.wait_for(event.wait(), timeout=sleep_for)
+                        event.clear()
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await asyncio.sleep(sleep_for)
+                interval = min(interval * self.multiplier, self.max_interval)
+        finally:
+            if self.webhooks:
+                self.webhooks.discard(transcript_id)
+
+async def start_webhook_listener(registry: TranscriptWebhookRegistry, host: str, port: int):
+    """Servidor HTTP mínimo para o webhook da AssemblyAI (POST com transcript_id)"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        status_line = "400 Bad Request"
+        try:
+            request_line = (await reader.readline()).decode(errors="replace")
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode(errors="replace").strip()
+                if not line:
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+            if request_line.startswith("POST"):
+                payload = json.loads(body or b"{}")
+                transcript_id = payload.get("transcript_id", "")
+                matched = registry.notify(transcript_id, payload.get("status", "completed"))
+                status_line = "200 OK" if matched else "404 Not Found"
+        except Exception as e:
+            logger.warning(f"Webhook de transcrição inválido: {e}")
+        finally:
+            writer.write(f"HTTP/1.1 {status_line}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+            try:
+                await writer.drain()
+            finally:
+                writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Webhook de transcrição escutando em http://{host}:{port}")
+    return server
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Cache de áudio TTS por frase
+Cada frase sintetizada vira um arquivo endereçado pelo conteúdo, com chave
+(texto, voz, codec, taxa de amostragem). Um índice LRU em memória evita ir ao
+disco nas frases quentes, o disco guarda o restante com limite de tamanho e os
+prompts fixos são pré-renderizados na subida para tocar sem síntese
+"""
+
+import os
+import time
+import wave
+import asyncio
+import hashlib
+import logging
+import tempfile
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger("tts_cache")
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "/var/lib/asterisk/sounds/tts_cache")
+
+class TTSError(Exception):
+    """Falha ao sintetizar a frase"""
+
+def _resample(samples: array, source_rate: int, target_rate: int) -> array:
+    """Reamostragem linear de PCM 16 bits mono"""
+    if source_rate == target_rate or not samples:
+        return samples
+    ratio = source_rate / target_rate
+    length = int(len(samples) / ratio)
+    last = len(samples) - 1
+    out = array("h", bytes(2 * length))
+    for i in range(length):
+        position = i * ratio
+        index = int(position)
+        fraction = position - index
+        following = samples[min(index + 1, last)]
+        out[i] = int(samples[index] + (following - samples[index]) * fraction)
+    return out
+
+class EspeakSynthesizer:
+    """TTS local com espeak-ng, convertido para WAV 8 kHz (slin) do Asterisk"""
+
+    codec = "wav"
+
+    def __init__(self, voice: str = os.getenv("TTS_VOICE", "pt-br"), sample_rate: int = 8000,
+                 speed: int = int(os.getenv("TTS_SPEED", "165")), binary: str = os.getenv("TTS_ESPEAK_BIN", "espeak-ng")):
+        self.voice = voice
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.binary = binary
+
+    async def synthesize(self, text: str, output_path: str):
+        fd, raw_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.binary, "-v", self.voice, "-s", str(self.speed), "-w", raw_path, text,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await process.communicate()
+            if process.returncode != 0:
+                raise TTSError(stderr.decode(errors="replace").strip() or f"{self.binary} saiu com {process.returncode}")
+            await asyncio.to_thread(self._convert, raw_path, output_path)
+        except FileNotFoundError:
+            raise TTSError(f"{self.binary} não encontrado")
+        finally:
+            try:
+                os.remove(raw_path)
+            except OSError:
+                pass
+
+    def _convert(self, raw_path: str, output_path: str):
+        with wave.open(raw_path, "rb") as source:
+            rate = source.getframerate()
+            samples = array("h", source.readframes(source.getnframes()))
+        samples = _resample(samples, rate, self.sample_rate)
+
+        # Escreve em arquivo temporário e renomeia: leitores nunca veem WAV parcial
+        partial_path = f"{output_path}.part"
+        with wave.open(partial_path, "wb") as target:
+            target.setnchannels(1)
+            target.setsampwidth(2)
+            target.setframerate(self.sample_rate)
+            target.writeframes(samples.tobytes())
+        os.replace(partial_path, output_path)
+
+class TTSCache:
+    """Cache de frases TTS em dois níveis (índice LRU em memória + disco)"""
+
+    def __init__(
+        self,
+        synthesizer: Optional[EspeakSynthesizer] = None,
+        cache_dir: str = TTS_CACHE_DIR,
+        max_memory_entries: int = int(os.getenv("TTS_CACHE_MEMORY_ENTRIES", "512")),
+        max_disk_bytes: int = int(os.getenv("TTS_CACHE_DISK_MB", "200")) * 1024 * 1024,
+    ):
+        self.synthesizer = synthesizer or EspeakSynthesizer()
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # chave -> (caminho sem extensão, tamanho em bytes), em ordem de uso
+        self._memory: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._pinned: set = set()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._disk_bytes = self._scan_disk()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "errors": 0,
+            "evictions": 0,
+            "synthesis_ms": 0.0,
+        }
+
+    def _scan_disk(self) -> int:
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(f".{self.synthesizer.codec}"):
+                total += entry.stat().st_size
+        return total
+
+    def key(self, text: str) -> str:
+        """Chave de conteúdo: (texto normalizado, voz, codec, taxa)"""
+        normalized = " ".join(text.split())
+        material = f"{normalized}|{self.synthesizer.voice}|{self.synthesizer.codec}|{self.synthesizer.sample_rate}"
+        return hashlib.sha256(material.encode()).hexdigest()[:32]
+
+    def _base_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _remember(self, key: str, base_path: str, size: int):
+        self._memory[key] = (base_path, size)
+        self._memory.move_to_end(key)
+        if len(self._memory) <= self.max_memory_entries:
+            return
+        # Sai só do índice em memória (o arquivo continua no disco); fixados ficam
+        for candidate in list(self._memory):
+            if len(self._memory) <= self.max_memory_entries:
+                break
+            if candidate not in self._pinned:
+                del self._memory[candidate]
+
+    async def get_path(self, text: str) -> str:
+        """Caminho sem extensão (formato do STREAM FILE) do áudio da frase"""
+        key = self.key(text)
+        cached = self._memory.get(key)
+        if cached:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return cached[0]
+
+        base_path = self._base_path(key)
+        file_path = f"{base_path}.{self.synthesizer.codec}"
+        if os.path.exists(file_path):
+            self.stats["disk_hits"] += 1
+            os.utime(file_path)  # mantém a ordem de uso para a limpeza do disco
+            self._remember(key, base_path, os.path.getsize(file_path))
+            return base_path
+
+        # Várias chamadas pedindo a mesma frase esperam uma única síntese
+        pending = self._in_flight.get(key)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            self.stats["misses"] += 1
+            started = time.perf_counter()
+            await self.synthesizer.synthesize(text, file_path)
+            self.stats["synthesis_ms"] += (time.perf_counter() - started) * 1000
+            size = os.path.getsize(file_path)
+            self._disk_bytes += size
+            self._remember(key, base_path, size)
+            self._evict_disk()
+            future.set_result(base_path)
+            return base_path
+        except Exception as e:
+            self.stats["errors"] += 1
+            future.set_exception(e)
+            future.exception()  # evita aviso quando ninguém mais aguarda
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    def _evict_disk(self):
+        """Remove os arquivos menos usados (exceto fixados) acima do limite"""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        pinned_files = {f"{key}.{self.synthesizer.codec}" for key in self._pinned}
+        entries = sorted(
+            (entry for entry in os.scandir(self.cache_dir)
+             if entry.is_file() and entry.name.endswith(f".{self.synthesizer.codec}") and entry.name not in pinned_files),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._disk_bytes -= size
+            self._memory.pop(entry.name.rsplit(".", 1)[0], None)
+            self.stats["evictions"] += 1
+
+    async def prerender(self, texts: Iterable[str]) -> int:
+        """Renderiza e fixa os prompts conhecidos (não saem do cache)"""
+        rendered = 0
+        for text in texts:
+            key = self.key(text)
+            self._pinned.add(key)
+            try:
+                await self.get_path(text)
+                rendered += 1
+            except Exception as e:
+                logger.warning(f"Não foi possível pré-renderizar '{text[:40]}': {e}")
+        logger.info(f"🔊 {rendered} prompts fixos prontos no cache TTS")
+        return rendered
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "synthesis_ms": round(self.stats["synthesis_ms"], 1),
+            "memory_entries": len(self._memory),
+            "pinned": len(self._pinned),
+            "disk_bytes": self._disk_bytes,
+            "voice": self.synthesizer.voice,
+            "codec": self.synthesizer.codec,
+            "sample_rate": self.synthesizer.sample_rate,
+        }
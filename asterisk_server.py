@@ -11,8 +11,8 @@ import logging
 import subprocess
 import psutil
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from typing import Dict, Optional, Any
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -21,6 +21,9 @@ import requests
 import websockets
 from contextlib import asynccontextmanager
 
+from persistence import get_persistence_store
+from ws_broadcast import get_broadcast_hub
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -48,9 +51,23 @@ class WebRTCAnswer(BaseModel):
     sdp: str
     type: str = "answer"
 
-# Gerenciador de chamadas ativas
+# Gerenciador de chamadas ativas (espelhado no SQLite)
 active_calls: Dict[str, CallStatus] = {}
-websocket_connections: List[WebSocket] = []
+ws_hub = get_broadcast_hub()
+persistence = get_persistence_store()
+PERSISTENCE_SOURCE = "asterisk"
+
+def persist_call(call_id: str):
+    """Enfileira o estado da chamada para gravação no SQLite (não bloqueia)"""
+    call = active_calls[call_id]
+    persistence.upsert_call(PERSISTENCE_SOURCE, call.dict(), active=call.status != "ended")
+
+async def restore_calls():
+    """Recarrega as chamadas em andamento (o Asterisk as mantém entre reinícios da API)"""
+    for data in await persistence.load_calls(PERSISTENCE_SOURCE, active=True):
+        active_calls[data["call_id"]] = CallStatus(**data)
+    if active_calls:
+        logger.info(f"💾 {len(active_calls)} chamadas ativas restauradas")
 
 class AsteriskManager:
     """Gerenciador do Asterisk"""
@@ -137,11 +154,14 @@ class AsteriskManager:
                     
                     logger.info(f"✅ Configuração copiada: {config_file}")
             
-            # Copiar AGI script
-            agi_src = "./asterisk/agi-bin/ai_assistant.py"
-            agi_dst = "/var/lib/asterisk/agi-bin/ai_assistant.py"
+            # Copiar scripts AGI (ai_assistant.py e o servidor FastAGI)
+            agi_dir = "./asterisk/agi-bin"
+            agi_scripts = [name for name in os.listdir(agi_dir) if name.endswith(".py")] if os.path.isdir(agi_dir) else []
             
-            if os.path.exists(agi_src):
+            for agi_script in agi_scripts:
+                agi_src = f"{agi_dir}/{agi_script}"
+                agi_dst = f"/var/lib/asterisk/agi-bin/{agi_script}"
+                
                 with open(agi_src, 'r') as f:
                     content = f.read()
                 
@@ -150,7 +170,7 @@ class AsteriskManager:
                 
                 # Tornar executável
                 os.chmod(agi_dst, 0o755)
-                logger.info("✅ AGI script configurado")
+                logger.info(f"✅ AGI script configurado: {agi_script}")
             
         except Exception as e:
             logger.error(f"❌ Erro ao configurar Asterisk: {e}")
@@ -177,6 +197,7 @@ class AsteriskManager:
                     start_time=datetime.now().isoformat(),
                     ai_enabled=True
                 )
+                persist_call(call_id)
                 
                 logger.info(f"📞 Chamada iniciada: {call_id} -> {destination}")
                 return {
@@ -211,6 +232,7 @@ class AsteriskManager:
                 
                 # Atualizar status
                 active_calls[call_id].status = "ended"
+                persist_call(call_id)
                 logger.info(f"📞 Chamada encerrada: {call_id}")
                 return True
             else:
@@ -229,10 +251,14 @@ async def lifespan(app: FastAPI):
     """Gerenciar ciclo de vida da aplicação"""
     # Startup
     logger.info("🚀 Iniciando Asterisk AI Server...")
+    await persistence.start()
+    await restore_calls()
     await asterisk_manager.start_asterisk()
     yield
     # Shutdown
     logger.info("🛑 Encerrando Asterisk AI Server...")
+    await persistence.aclose()
+    await ws_hub.aclose()
 
 # Criar aplicação FastAPI
 app = FastAPI(
@@ -273,6 +299,7 @@ async def health_check():
         "status": "healthy",
         "asterisk_running": asterisk_manager.is_asterisk_running(),
         "active_calls": len(active_calls),
+        "websocket": ws_hub.status(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -375,24 +402,12 @@ async def hangup_call(call_id: str, background_tasks: BackgroundTasks):
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket para notificações em tempo real"""
-    await websocket.accept()
-    websocket_connections.append(websocket)
-    
-    try:
-        while True:
-            # Manter conexão viva
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        websocket_connections.remove(websocket)
+    # Cada cliente tem fila e tarefa de escrita próprias; assinaturas por ?topics= e ?call_id=
+    await ws_hub.serve(websocket)
 
 async def notify_websocket_clients(message: Dict[str, Any]):
-    """Notificar todos os clientes WebSocket"""
-    if websocket_connections:
-        for websocket in websocket_connections.copy():
-            try:
-                await websocket.send_json(message)
-            except:
-                websocket_connections.remove(websocket)
+    """Notificar os clientes WebSocket (só enfileira; um painel lento não atrasa os demais)"""
+    ws_hub.broadcast(message)
 
 @app.get("/asterisk/status")
 async def asterisk_status():
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Barge-in: interrupção da resposta do agente quando o usuário volta a falar
+A resposta de cada turno roda em uma task própria; ao detectar fala do
+usuário a task é cancelada, o que encerra o streaming do Groq (a conexão é
+fechada e a geração para no servidor) e interrompe a reprodução no TTS no
+meio da frase. O histórico recebe apenas as frases que chegaram a tocar
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from response_streaming import speak_streamed
+
+logger = logging.getLogger("barge_in")
+
+BARGE_IN_ENABLED = os.getenv("BARGE_IN_ENABLED", "true").lower() == "true"
+
+# Totais do processo (todas as sessões do worker)
+BARGE_IN_STATS = {
+    "responses": 0,
+    "interruptions": 0,
+}
+
+class SpokenResponse:
+    """O que foi efetivamente falado em um turno"""
+
+    def __init__(self, text: str, interrupted: bool = False, sentences: int = 0, duration_ms: float = 0.0):
+        self.text = text
+        self.interrupted = interrupted
+        self.sentences = sentences
+        self.duration_ms = duration_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+class BargeInController:
+    """Mantém a resposta em andamento de um agente e a cancela sob barge-in"""
+
+    def __init__(self, name: str = "agent", enabled: bool = BARGE_IN_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+        # task interrompida -> quantas frases já tinham tocado
+        self._interrupted: Dict[asyncio.Task, int] = {}
+        self._playback: Optional[Any] = None
+        self._spoken: List[str] = []
+        self.stats = {
+            "responses": 0,
+            "interruptions": 0,
+        }
+
+    @property
+    def speaking(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def attach(self, session: Any):
+        """Escuta a detecção de fala do usuário na AgentSession"""
+        if not self.enabled:
+            return
+        session.on("user_state_changed", self._on_user_state_changed)
+
+    def _on_user_state_changed(self, event: Any):
+        if getattr(event, "new_state", None) == "speaking":
+            self.interrupt("fala do usuário")
+
+    def _set_playback(self, handle: Any):
+        self._playback = handle
+
+    def interrupt(self, reason: str = "fala do usuário") -> bool:
+        """Cancela a geração e a reprodução em andamento; False se não havia nada"""
+        if not self.speaking:
+            return False
+
+        # Só conta o que já tinha terminado de tocar neste instante
+        self._interrupted[self._task] = len(self._spoken)
+        self._task.cancel()
+
+        playback, self._playback = self._playback, None
+        if playback is not None and hasattr(playback, "interrupt"):
+            try:
+                playback.interrupt()
+            except Exception as e:
+                logger.warning(f"[{self.name}] Falha ao interromper a reprodução: {e}")
+
+        self.stats["interruptions"] += 1
+        BARGE_IN_STATS["interruptions"] += 1
+        logger.info(f"✋ [{self.name}] Resposta interrompida ({reason})")
+        return True
+
+    async def speak(self, chat_ctx: Any, sentences: AsyncIterator[str]) -> SpokenResponse:
+        """Fala as frases em uma task cancelável e devolve o que foi ouvido"""
+        # Um novo turno substitui a resposta anterior que ainda estiver tocando
+        self.interrupt("novo turno")
+
+        spoken: List[str] = []
+        self._spoken = spoken
+        started = time.perf_counter()
+        task = asyncio.create_task(speak_streamed(chat_ctx, sentences, spoken, self._set_playback))
+        self._task = task
+        self.stats["responses"] += 1
+        BARGE_IN_STATS["responses"] += 1
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            if task not in self._interrupted:
+                # Cancelamento externo (fim da sessão): propaga
+                task.cancel()
+                raise
+        finally:
+            if self._task is task:
+                self._task = None
+                self._playback = None
+            # Fecha o gerador para liberar a conexão de streaming do LLM
+            if task.done() and hasattr(sentences, "aclose"):
+                await sentences.aclose()
+
+        # A frase que estava tocando foi cortada e fica fora do texto falado
+        heard = self._interrupted.pop(task, None)
+        interrupted = heard is not None
+        if interrupted:
+            del spoken[heard:]
+
+        return SpokenResponse(
+            " ".join(spoken),
+            interrupted=interrupted,
+            sentences=len(spoken),
+            duration_ms=(time.perf_counter() - started) * 1000,
+        )
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Histórico de chamadas indexado
+As chamadas entram em ordem de encerramento (append-only), então o
+histórico já nasce ordenado: cada registro recebe uma sequência crescente,
+índices secundários (trunk, status, caller...) guardam as sequências de
+cada valor e uma página é lida do fim para o começo em O(página), com
+cursor e filtros. A memória é limitada: ao passar de max_records o
+registro mais antigo sai (e pode ser entregue a on_evict)
+"""
+import os
+import logging
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("call_history")
+
+CALL_HISTORY_MAX_RECORDS = int(os.getenv("CALL_HISTORY_MAX_RECORDS", "10000"))
+CALL_HISTORY_PAGE_SIZE = 50
+CALL_HISTORY_MAX_PAGE_SIZE = 500
+
+class SequenceList:
+    """Sequências crescentes com inclusão no fim e remoção do início em O(1) amortizado"""
+
+    __slots__ = ("items", "start")
+
+    def __init__(self):
+        self.items: List[int] = []
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.items) - self.start
+
+    def append(self, seq: int):
+        self.items.append(seq)
+
+    def first(self) -> int:
+        return self.items[self.start]
+
+    def popleft(self):
+        self.start += 1
+        # Compacta quando metade da lista já saiu (custo amortizado constante)
+        if self.start > 64 and self.start * 2 > len(self.items):
+            del self.items[:self.start]
+            self.start = 0
+
+    def __contains__(self, seq: int) -> bool:
+        position = bisect_left(self.items, seq, self.start)
+        return position < len(self.items) and self.items[position] == seq
+
+    def newest_before(self, cursor: Optional[int]) -> Iterator[int]:
+        """Sequências menores que o cursor, da mais recente para a mais antiga"""
+        end = len(self.items) if cursor is None else bisect_left(self.items, cursor, self.start)
+        for position in range(end - 1, self.start - 1, -1):
+            yield self.items[position]
+
+class CallHistoryStore:
+    """Histórico em memória, limitado, ordenado por chegada e indexado por campos"""
+
+    def __init__(
+        self,
+        indexed_fields: Sequence[str] = ("trunk", "status", "caller_id"),
+        max_records: int = CALL_HISTORY_MAX_RECORDS,
+        on_evict: Optional[Callable[[Dict[str, Any]], None]] = None,
+        name: str = "calls",
+    ):
+        self.indexed_fields = tuple(indexed_fields)
+        self.max_records = max(1, max_records)
+        self.on_evict = on_evict
+        self.name = name
+        self.total_appended = 0
+
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._order = SequenceList()
+        # campo -> valor -> sequências dos registros com esse valor
+        self._indexes: Dict[str, Dict[str, SequenceList]] = {field: {} for field in self.indexed_fields}
+        self._next_seq = 1
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Inclui uma chamada encerrada; devolve sua sequência"""
+        seq = self._next_seq
+        self._next_seq += 1
+        self.total_appended += 1
+        self._records[seq] = record
+        self._order.append(seq)
+        for field in self.indexed_fields:
+            value = record.get(field)
+            if value is not None:
+                self._indexes[field].setdefault(str(value), SequenceList()).append(seq)
+
+        while len(self._records) > self.max_records:
+            self._evict_oldest()
+        return seq
+
+    def _evict_oldest(self):
+        seq = self._order.first()
+        self._order.popleft()
+        record = self._records.pop(seq)
+        # O mais antigo do histórico também é o mais antigo em cada índice
+        for field in self.indexed_fields:
+            value = record.get(field)
+            if value is None:
+                continue
+            postings = self._indexes[field][str(value)]
+            postings.popleft()
+            if not postings:
+                del self._indexes[field][str(value)]
+        if self.on_evict is not None:
+            try:
+                self.on_evict(record)
+            except Exception as e:
+                logger.warning(f"[{self.name}] Falha ao repassar registro antigo do histórico: {e}")
+
+    def page(
+        self,
+        limit: int = CALL_HISTORY_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        **filters: Optional[str],
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Página do mais recente para o mais antigo; devolve (registros, próximo cursor)
+
+        Filtros só valem para campos indexados (valores None são ignorados)
+        """
+        limit = max(1, min(limit, CALL_HISTORY_MAX_PAGE_SIZE))
+        before = self._parse_cursor(cursor)
+        filters = {field: str(value) for field, value in filters.items() if value is not None}
+        unknown = set(filters) - set(self.indexed_fields)
+        if unknown:
+            raise ValueError(f"Filtro não suportado: {', '.join(sorted(unknown))}")
+
+        if filters:
+            postings = [self._indexes[field].get(value) for field, value in filters.items()]
+            if any(p is None for p in postings):
+                return [], None
+            # Percorre o índice mais seletivo e confere os demais filtros no registro
+            candidates = min(postings, key=len).newest_before(before)
+        else:
+            candidates = self._order.newest_before(before)
+
+        records: List[Dict[str, Any]] = []
+        last_seq = None
+        for seq in candidates:
+            record = self._records[seq]
+            if any(str(record.get(field)) != value for field, value in filters.items()):
+                continue
+            if len(records) == limit:
+                # Há mais registros depois desta página
+                return records, str(last_seq)
+            records.append(record)
+            last_seq = seq
+        return records, None
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Optional[int]:
+        if not cursor:
+            return None
+        try:
+            return int(cursor)
+        except ValueError:
+            raise ValueError(f"Cursor inválido: {cursor}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "stored": len(self._records),
+            "total_appended": self.total_appended,
+            "max_records": self.max_records,
+            "indexed_fields": list(self.indexed_fields),
+        }
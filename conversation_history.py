@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Histórico de conversa com orçamento de tokens
+Cada mensagem tem seus tokens contados uma única vez ao entrar; o prompt
+recebe as mensagens mais recentes que cabem no orçamento e as que saem da
+janela são condensadas em segundo plano em um resumo contínuo, mantendo o
+tamanho do prompt (e a latência do LLM) estável em ligações longas
+
+As trocas ficam em um buffer circular de capacidade fixa com registros
+__slots__ e timestamps monotônicos, formatados só na exportação
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("conversation_history")
+
+# Se definido, substitui o orçamento padrão de cada agente
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET") or 0)
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "120"))
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
+# Capacidade do buffer circular por sessão (o orçamento de tokens costuma esvaziar antes)
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "64"))
+
+# Custo fixo por mensagem no formato de chat (papel + separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa de tokens do tokenizador BPE sem dependências
+
+    Palavras longas viram várias sub-palavras (~4 caracteres cada) e cada
+    pontuação conta como um token
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        tokens += 1 if len(piece) <= 4 else (len(piece) + 3) // 4
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+class TurnRecord:
+    """Uma mensagem da conversa (sem __dict__ por instância)"""
+
+    __slots__ = ("role", "content", "tokens", "at", "extra", "_message")
+
+    def __init__(self, role: str, content: str, tokens: int, at: float, extra: Optional[Dict[str, Any]] = None):
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+        self.at = at  # time.monotonic() na criação
+        self.extra = extra
+        self._message: Optional[Dict[str, str]] = None
+
+    @property
+    def message(self) -> Dict[str, str]:
+        """Mensagem no formato do chat, criada uma vez e reaproveitada em todo prompt"""
+        if self._message is None:
+            self._message = {"role": self.role, "content": self.content}
+        return self._message
+
+class TurnRingBuffer:
+    """Buffer circular de capacidade fixa: inclusão e remoção do mais antigo em O(1)"""
+
+    __slots__ = ("capacity", "_items", "_head", "_size")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._items: List[Optional[TurnRecord]] = [None] * self.capacity
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[TurnRecord]:
+        items, capacity, head = self._items, self.capacity, self._head
+        for offset in range(self._size):
+            yield items[(head + offset) % capacity]
+
+    def push(self, record: TurnRecord) -> Optional[TurnRecord]:
+        """Inclui no fim; se estiver cheio, devolve o registro mais antigo sobrescrito"""
+        tail = (self._head + self._size) % self.capacity
+        overwritten = None
+        if self._size == self.capacity:
+            overwritten = self._items[tail]
+            self._head = (self._head + 1) % self.capacity
+        else:
+            self._size += 1
+        self._items[tail] = record
+        return overwritten
+
+    def popleft(self) -> TurnRecord:
+        if not self._size:
+            raise IndexError("buffer vazio")
+        record = self._items[self._head]
+        self._items[self._head] = None
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+        return record
+
+class ConversationHistory:
+    """Janela de mensagens limitada por tokens + resumo contínuo do que saiu dela"""
+
+    def __init__(
+        self,
+        token_budget: int = 600,
+        summarizer: Optional[Any] = None,
+        summary_max_tokens: int = HISTORY_SUMMARY_TOKENS,
+        name: str = "conversation",
+        max_turns: int = HISTORY_MAX_TURNS,
+    ):
+        self.token_budget = HISTORY_TOKEN_BUDGET or token_budget
+        self.summarizer = summarizer if HISTORY_SUMMARY_ENABLED else None
+        self.summary_max_tokens = summary_max_tokens
+        self.name = name
+
+        self.turns = TurnRingBuffer(max_turns)
+        # Âncora para converter os timestamps monotônicos em hora local na exportação
+        self._started_mono = time.monotonic()
+        self._started_wall = time.time()
+        self.window_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.message_count = 0
+        self._evicted: List[TurnRecord] = []
+        self._summary_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "evicted_messages": 0,
+            "summaries": 0,
+            "summary_errors": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __iter__(self) -> Iterator[TurnRecord]:
+        return iter(self.turns)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.window_tokens + self.summary_tokens
+
+    def add(self, role: str, content: str, **extra: Any):
+        """Adiciona uma mensagem e ajusta a janela ao orçamento"""
+        record = TurnRecord(role, content, estimate_tokens(content), time.monotonic(), extra or None)
+        self.window_tokens += record.tokens
+        self.message_count += 1
+        overwritten = self.turns.push(record)
+        if overwritten is not None:
+            self._evict(overwritten)
+        self._fit()
+
+    def _fit(self):
+        """Tira as mensagens mais antigas até caber no orçamento (a última sempre fica)"""
+        while len(self.turns) > 1 and self.prompt_tokens > self.token_budget:
+            self._evict(self.turns.popleft())
+
+        if self._evicted:
+            self._schedule_summary()
+
+    def _evict(self, record: TurnRecord):
+        self.window_tokens -= record.tokens
+        self._evicted.append(record)
+        self.stats["evicted_messages"] += 1
+
+    def _schedule_summary(self):
+        if self.summarizer is None:
+            self._evicted.clear()
+            return
+        if self._summary_task is not None and not self._summary_task.done():
+            return  # a task em andamento consome o que chegar depois
+        try:
+            self._summary_task = asyncio.get_running_loop().create_task(self._summarize())
+        except RuntimeError:
+            pass  # sem event loop: resume na próxima mensagem
+
+    async def _summarize(self):
+        """Incorpora as mensagens que saíram da janela ao resumo (fora do caminho da resposta)"""
+        while self._evicted:
+            batch, self._evicted = self._evicted, []
+            transcript = "\n".join(
+                f"{'Usuário' if record.role == 'user' else 'Assistente'}: {record.content}" for record in batch
+            )
+            try:
+                summary = await self.summarizer.complete(
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "Você resume conversas telefônicas. Atualize o resumo com os novos trechos, "
+                                       "mantendo nomes, números, pedidos e decisões. Responda só com o resumo, "
+                                       f"em até {self.summary_max_tokens // 2} palavras.",
+                        },
+                        {
+                            "role": "user",
+                            "content": f"Resumo atual: {self.summary or '(vazio)'}\n\nNovos trechos:\n{transcript}",
+                        },
+                    ],
+                    max_tokens=self.summary_max_tokens,
+                    temperature=0.2,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Sem resumo novo, os trechos antigos são descartados (a janela continua válida)
+                self.stats["summary_errors"] += 1
+                logger.warning(f"[{self.name}] Falha ao resumir histórico: {e}")
+                continue
+
+            self.summary = summary.strip()
+            self.summary_tokens = estimate_tokens(self.summary)
+            self.stats["summaries"] += 1
+            logger.debug(f"[{self.name}] Resumo atualizado ({self.summary_tokens} tokens)")
+            # O resumo também ocupa orçamento: reajusta a janela
+            self._fit()
+
+    def append_to(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Acrescenta ao prompt o resumo (se houver) e a janela recente, sem listas intermediárias"""
+        if self.summary:
+            messages.append({"role": "system", "content": f"Resumo da conversa até aqui: {self.summary}"})
+        for record in self.turns:
+            messages.append(record.message)
+        return messages
+
+    def _export(self, record: TurnRecord) -> Dict[str, Any]:
+        exported = {
+            "role": record.role,
+            "content": record.content,
+            "timestamp": datetime.fromtimestamp(self._started_wall + (record.at - self._started_mono)).isoformat(),
+            "elapsed": round(record.at - self._started_mono, 1),
+        }
+        if record.extra:
+            exported.update(record.extra)
+        return exported
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Janela atual em formato serializável (para logs)"""
+        return [self._export(record) for record in self.turns]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "messages": len(self.turns),
+            "message_count": self.message_count,
+            "window_tokens": self.window_tokens,
+            "summary_tokens": self.summary_tokens,
+            "token_budget": self.token_budget,
+            **self.stats,
+        }
+
+    async def aclose(self):
+        """Cancela o resumo em andamento (fim da sessão)"""
+        if self._summary_task is not None and not self._summary_task.done():
+            self._summary_task.cancel()
+            try:
+                await self._summary_task
+            except asyncio.CancelledError:
+                pass
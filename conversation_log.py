@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Log de conversas com índice invertido
+As conversas chegam em ordem (append-only): cada uma recebe uma sequência
+crescente e entra nas listas de postagem de cada palavra (mensagem e
+resposta normalizadas) e do participant_id. Inclusão e descarte do mais
+antigo são O(1) amortizado; uma busca percorre só a lista mais seletiva,
+da mais recente para a mais antiga, e confere as demais por bisseção
+"""
+import os
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from keyword_engine import normalize
+from call_history import SequenceList, CALL_HISTORY_PAGE_SIZE, CALL_HISTORY_MAX_PAGE_SIZE
+
+logger = logging.getLogger("conversation_log")
+
+CONVERSATION_LOG_MAX_ENTRIES = int(os.getenv("CONVERSATION_LOG_MAX_ENTRIES", "1000"))
+
+# Campos de texto indexados por palavra
+TEXT_FIELDS = ("message", "agent_response")
+
+def _terms(record: Dict[str, Any]) -> Iterable[str]:
+    """Palavras distintas da conversa (sem acentos, minúsculas)"""
+    return set(" ".join(normalize(record.get(field) or "") for field in TEXT_FIELDS).split())
+
+class ConversationLog:
+    """Últimas conversas em memória, limitadas e indexadas por palavra e participante"""
+
+    def __init__(self, max_entries: int = CONVERSATION_LOG_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self.total_appended = 0
+
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._order = SequenceList()
+        # palavra -> sequências das conversas que a contêm
+        self._terms: Dict[str, SequenceList] = {}
+        # participant_id -> sequências das conversas do participante
+        self._participants: Dict[str, SequenceList] = {}
+        self._next_seq = 1
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Inclui uma conversa; devolve sua sequência"""
+        seq = self._next_seq
+        self._next_seq += 1
+        self.total_appended += 1
+        self._records[seq] = record
+        self._order.append(seq)
+        for term in _terms(record):
+            self._terms.setdefault(term, SequenceList()).append(seq)
+        participant_id = record.get("participant_id")
+        if participant_id is not None:
+            self._participants.setdefault(str(participant_id), SequenceList()).append(seq)
+
+        while len(self._records) > self.max_entries:
+            self._evict_oldest()
+        return seq
+
+    def extend(self, records: Iterable[Dict[str, Any]]):
+        """Inclui conversas já em ordem cronológica (restauração na subida)"""
+        for record in records:
+            self.append(record)
+
+    def _evict_oldest(self):
+        seq = self._order.first()
+        self._order.popleft()
+        record = self._records.pop(seq)
+        # A conversa mais antiga do log também é a primeira de cada lista de postagem
+        for term in _terms(record):
+            self._drop_first(self._terms, term)
+        participant_id = record.get("participant_id")
+        if participant_id is not None:
+            self._drop_first(self._participants, str(participant_id))
+
+    @staticmethod
+    def _drop_first(index: Dict[str, SequenceList], key: str):
+        postings = index[key]
+        postings.popleft()
+        if not postings:
+            del index[key]
+
+    def latest(self, limit: int = CALL_HISTORY_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Últimas conversas, da mais antiga para a mais recente"""
+        records: List[Dict[str, Any]] = []
+        for seq in self._order.newest_before(None):
+            if len(records) == limit:
+                break
+            records.append(self._records[seq])
+        records.reverse()
+        return records
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        participant_id: Optional[str] = None,
+        limit: int = CALL_HISTORY_PAGE_SIZE,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Conversas com todas as palavras da busca (e do participante), da mais recente para a mais antiga
+
+        Devolve (conversas, próximo cursor)
+        """
+        limit = max(1, min(limit, CALL_HISTORY_MAX_PAGE_SIZE))
+        before = self._parse_cursor(cursor)
+        terms = set(normalize(query or "").split())
+        if not terms and participant_id is None:
+            raise ValueError("Informe ao menos uma palavra ou um participant_id")
+
+        postings = [self._terms.get(term) for term in terms]
+        if participant_id is not None:
+            postings.append(self._participants.get(str(participant_id)))
+        if any(p is None for p in postings):
+            return [], None
+
+        # Percorre a lista mais seletiva e confere as demais pela sequência
+        postings.sort(key=len)
+        driver, others = postings[0], postings[1:]
+        records: List[Dict[str, Any]] = []
+        last_seq = None
+        for seq in driver.newest_before(before):
+            if not all(seq in other for other in others):
+                continue
+            if len(records) == limit:
+                # Há mais resultados depois desta página
+                return records, str(last_seq)
+            records.append(self._records[seq])
+            last_seq = seq
+        return records, None
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Optional[int]:
+        if not cursor:
+            return None
+        try:
+            return int(cursor)
+        except ValueError:
+            raise ValueError(f"Cursor inválido: {cursor}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "stored": len(self._records),
+            "total_appended": self.total_appended,
+            "max_entries": self.max_entries,
+            "indexed_terms": len(self._terms),
+            "participants": len(self._participants),
+        }
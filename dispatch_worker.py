@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Worker LiveKit de despacho: muitas chamadas por processo
+Recebe as salas registradas pela API (agent_dispatch.py) e executa o agente
+indicado nos metadados do job. Os jobs rodam como threads do mesmo processo,
+então cada chamada custa um objeto de agente e não um interpretador inteiro.
+Cada thread de job tem o seu event loop: o gateway LLM é um por loop (fechado
+no fim do job) e os caches/estatísticas compartilhados são protegidos por locks.
+
+Rode um processo por núcleo:
+    python dispatch_worker.py start
+"""
+import os
+import json
+import logging
+from dotenv import load_dotenv
+
+from livekit import agents
+from livekit.agents import JobContext, JobExecutorType, WorkerOptions
+
+# Imports antecipados: todos os agentes ficam carregados no worker
+import groq_voice_agent
+import advanced_groq_agent
+import telephony_agent
+import sip_voice_agent
+import real_sip_integration
+from agent_dispatch import DISPATCH_AGENT_NAME
+from llm_gateway import close_llm_gateway
+
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("dispatch_worker")
+
+ENTRYPOINTS = {
+    "groq": groq_voice_agent.entrypoint,
+    "advanced_groq": advanced_groq_agent.entrypoint,
+    "telephony": telephony_agent.telephony_entrypoint,
+    "sip": sip_voice_agent.sip_entrypoint,
+    "real_sip": real_sip_integration.real_sip_entrypoint,
+}
+
+async def dispatch_entrypoint(ctx: JobContext):
+    """Encaminha o job para o agente indicado nos metadados do despacho"""
+    try:
+        metadata = json.loads(ctx.job.metadata or "{}")
+    except json.JSONDecodeError:
+        metadata = {}
+
+    agent_type = metadata.get("agent_type", "groq")
+    entrypoint = ENTRYPOINTS.get(agent_type)
+    if entrypoint is None:
+        logger.error(f"Tipo de agente desconhecido no despacho: {agent_type} (sala {ctx.room.name})")
+        return
+
+    logger.info(f"Job despachado: sala {ctx.room.name}, agente {agent_type}")
+    # O pool HTTP do gateway pertence ao loop desta thread: fecha junto com o job
+    ctx.add_shutdown_callback(close_llm_gateway)
+    await entrypoint(ctx)
+
+if __name__ == "__main__":
+    worker_options = WorkerOptions(
+        entrypoint_fnc=dispatch_entrypoint,
+        # Só recebe salas despachadas explicitamente para este nome
+        agent_name=DISPATCH_AGENT_NAME,
+        # Sessões como threads do mesmo processo em vez de um processo por job
+        job_executor_type=JobExecutorType.THREAD,
+        max_concurrent_jobs=int(os.getenv("DISPATCH_MAX_CONCURRENT_JOBS", "200")),
+    )
+
+    logger.info(f"Iniciando worker de despacho '{DISPATCH_AGENT_NAME}'...")
+    agents.cli.run_app(worker_options)
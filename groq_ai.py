@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Cliente Groq AI compartilhado pelos servidores SIP e pelo script AGI
+Usa o gateway assíncrono (keep-alive, pool de conexões, HTTP/2 quando
+disponível e limite de concorrência) em vez de um requests.post por chamada
+"""
+import os
+import json
+import logging
+from typing import Dict, Optional
+
+from llm_gateway import LLMGateway
+
+logger = logging.getLogger("groq_ai")
+
+TELEPHONY_SYSTEM_PROMPT = """Você é um assistente de IA para chamadas telefônicas.
+Seja conciso, educado e útil. Responda em português brasileiro.
+Mantenha respostas curtas (máximo 2 frases) para chamadas telefônicas."""
+
+class GroqAI:
+    """Cliente para Groq AI"""
+
+    def __init__(self, api_key: str, max_concurrency: int = int(os.getenv("GROQ_MAX_CONCURRENCY", "32"))):
+        self.api_key = api_key
+        self.gateway = LLMGateway(api_key=api_key, max_concurrency=max_concurrency)
+
+    async def generate_response(self, text: str, context: Optional[Dict] = None) -> str:
+        """Gerar resposta usando Groq AI"""
+        try:
+            if not self.api_key:
+                return "IA não configurada. Configure GROQ_API_KEY."
+
+            system_prompt = TELEPHONY_SYSTEM_PROMPT
+            if context:
+                system_prompt += f"\nContexto da chamada: {json.dumps(context, ensure_ascii=False)}"
+
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": text}
+            ]
+
+            return await self.gateway.complete(
+                messages=messages,
+                model="llama3-8b-8192",
+                max_tokens=150,
+                temperature=0.7,
+                timeout=10
+            )
+
+        except Exception as e:
+            logger.error(f"Erro ao gerar resposta Groq: {e}")
+            return "Desculpe, não consegui processar sua solicitação no momento."
+
+    async def aclose(self):
+        """Fecha o pool de conexões HTTP"""
+        await self.gateway.aclose()
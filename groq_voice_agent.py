@@ -2,7 +2,7 @@ import os
 import json
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, AsyncIterator
 from dotenv import load_dotenv
 
 from livekit import agents
@@ -14,7 +14,14 @@ from livekit.agents.llm import (
     StopResponse,
 )
 import assemblyai
-import groq
+from llm_gateway import get_llm_gateway
+from response_streaming import stream_llm_sentences, single_sentence
+from barge_in import BargeInController
+from conversation_history import ConversationHistory
+from keyword_engine import get_keyword_engine
+from intent_router import IntentRouter
+from response_cache import get_response_cache
+from prompt_builder import PromptBuilder
 
 load_dotenv()
 logging.basicConfig(
@@ -33,10 +40,17 @@ class GroqVoiceAgent(Agent):
             stt=assemblyai.STT(),
         )
         
-        # Inicializar cliente Groq
-        self.groq_client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.conversation_history = []
-        self.max_history = 10  # Manter apenas as últimas 10 mensagens
+        # Gateway assíncrono compartilhado (não bloqueia o event loop)
+        self.llm_gateway = get_llm_gateway()
+        # Histórico limitado por tokens; o que sai da janela vira resumo
+        self.conversation_history = ConversationHistory(token_budget=600, summarizer=self.llm_gateway, name="groq_voice")
+        self.streaming_enabled = os.getenv("GROQ_STREAMING", "true").lower() == "true"
+        self.barge_in = BargeInController("groq_voice")
+        # Pedidos simples (hora, data, piada...) respondidos sem chamar o Groq
+        self.router = IntentRouter(name="groq_voice")
+        # Respostas do LLM reaproveitadas quando a mesma pergunta se repete
+        self.response_cache = get_response_cache()
+        self.cache_namespace = "groq_voice"
         
         # Configurações do agente
         self.agent_personality = {
@@ -46,68 +60,44 @@ class GroqVoiceAgent(Agent):
             "response_style": "conciso e natural"
         }
         
+        # Prompt de sistema compilado uma vez: prefixo idêntico em todos os turnos
+        self.prompt = PromptBuilder(
+            f"""Você é {self.agent_personality['name']}, um assistente de voz inteligente.
+            Características:
+            - Tom: {self.agent_personality['tone']}
+            - Idioma: {self.agent_personality['language']}
+            - Estilo: {self.agent_personality['response_style']}
+            
+            Regras importantes:
+            1. Mantenha respostas curtas e naturais para conversas em tempo real
+            2. Seja útil e preciso
+            3. Use linguagem coloquial quando apropriado
+            4. Evite respostas muito longas ou complexas""",
+            name="groq_voice",
+        )
+        
         logger.info("Agente de voz Groq inicializado com sucesso")
 
     def update_conversation_history(self, message: str, is_user: bool = True):
         """Atualiza o histórico de conversa"""
-        self.conversation_history.append({
-            "role": "user" if is_user else "assistant",
-            "content": message,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Manter apenas as últimas mensagens
-        if len(self.conversation_history) > self.max_history * 2:
-            self.conversation_history = self.conversation_history[-self.max_history * 2:]
+        self.conversation_history.add("user" if is_user else "assistant", message)
+
+    def build_messages(self, user_message: str) -> List[Dict[str, str]]:
+        """Monta as mensagens enviadas ao Groq"""
+        return self.prompt.build(self.conversation_history, user_message)
 
     async def generate_response(self, user_message: str) -> str:
         """Gera resposta usando Groq"""
         try:
-            # Preparar contexto da conversa
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""Você é {self.agent_personality['name']}, um assistente de voz inteligente.
-                    Características:
-                    - Tom: {self.agent_personality['tone']}
-                    - Idioma: {self.agent_personality['language']}
-                    - Estilo: {self.agent_personality['response_style']}
-                    
-                    Regras importantes:
-                    1. Mantenha respostas curtas e naturais para conversas em tempo real
-                    2. Seja útil e preciso
-                    3. Use linguagem coloquial quando apropriado
-                    4. Evite respostas muito longas ou complexas"""
-                }
-            ]
-            
-            # Adicionar histórico recente
-            for msg in self.conversation_history[-6:]:  # Últimas 3 trocas
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            # Adicionar mensagem atual
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
-            
             # Chamar Groq
-            response = self.groq_client.chat.completions.create(
+            messages = self.build_messages(user_message)
+            ai_response = await self.llm_gateway.complete(
                 model="llama3-8b-8192",  # Modelo rápido do Groq
                 messages=messages,
                 max_tokens=150,  # Resposta curta para tempo real
-                temperature=0.7,
-                stream=False
+                temperature=0.7
             )
-            
-            ai_response = response.choices[0].message.content.strip()
-            
-            # Atualizar histórico
-            self.update_conversation_history(user_message, is_user=True)
-            self.update_conversation_history(ai_response, is_user=False)
+            self.response_cache.put(user_message, ai_response, self.cache_namespace, self.conversation_history, messages)
             
             return ai_response
             
@@ -115,27 +105,38 @@ class GroqVoiceAgent(Agent):
             logger.error(f"Erro ao gerar resposta com Groq: {e}")
             return "Desculpe, tive um problema técnico. Pode repetir?"
 
+    async def generate_response_stream(self, user_message: str) -> AsyncIterator[str]:
+        """Gera resposta em streaming, entregando frase a frase ao TTS"""
+        sentences = []
+        try:
+            messages = self.build_messages(user_message)
+            async for sentence in stream_llm_sentences(
+                self.llm_gateway,
+                model="llama3-8b-8192",
+                messages=messages,
+                max_tokens=150,
+                temperature=0.7
+            ):
+                sentences.append(sentence)
+                yield sentence
+                
+        except Exception as e:
+            logger.error(f"Erro no streaming Groq: {e}")
+            if not sentences:
+                yield "Desculpe, tive um problema técnico. Pode repetir?"
+        else:
+            self.response_cache.put(user_message, " ".join(sentences), self.cache_namespace, self.conversation_history, messages)
+
     def analyze_user_intent(self, text: str) -> Dict[str, Any]:
         """Análise básica da intenção do usuário"""
         text_lower = text.lower()
         
-        intents = {
-            "greeting": ["oi", "olá", "bom dia", "boa tarde", "boa noite", "hello"],
-            "farewell": ["tchau", "adeus", "até logo", "até mais", "bye"],
-            "help": ["ajuda", "help", "como usar", "o que você faz"],
-            "weather": ["clima", "tempo", "temperatura", "chuva", "sol"],
-            "time": ["horas", "que horas", "que dia", "data"],
-            "joke": ["piada", "engraçado", "humor", "rir"]
-        }
-        
-        detected_intent = "general"
-        for intent, keywords in intents.items():
-            if any(keyword in text_lower for keyword in keywords):
-                detected_intent = intent
-                break
+        # Todas as intenções em uma passada, por palavra inteira e sem acentos
+        matches = get_keyword_engine().match(text)
         
         return {
-            "intent": detected_intent,
+            "intent": matches.first("intent") or "general",
+            "all_intents": list(matches.labels("intent")),
             "confidence": 0.8,
             "keywords": [word for word in text_lower.split() if len(word) > 3]
         }
@@ -151,11 +152,28 @@ class GroqVoiceAgent(Agent):
         # Análise da intenção
         intent_analysis = self.analyze_user_intent(user_transcript)
         
-        # Gerar resposta
-        ai_response = await self.generate_response(user_transcript)
+        # Gerar e falar a resposta (em streaming, a primeira frase já é falada aqui);
+        # se o usuário voltar a falar, geração e reprodução são canceladas
+        local_response = await self.router.try_local(user_transcript)
+        if local_response is None:
+            # Pergunta repetida: resposta do cache, sem ida ao Groq
+            local_response = self.response_cache.get(user_transcript, self.cache_namespace, self.conversation_history)
+        if local_response is not None:
+            sentences = single_sentence(local_response)
+        elif self.streaming_enabled:
+            sentences = self.generate_response_stream(user_transcript)
+        else:
+            sentences = single_sentence(self.generate_response(user_transcript))
+        spoken = await self.barge_in.speak(chat_ctx, sentences)
+        ai_response = spoken.text
+        
+        # Histórico só com o que o usuário realmente ouviu
+        self.update_conversation_history(user_transcript, is_user=True)
+        if ai_response:
+            self.update_conversation_history(ai_response, is_user=False)
         
         # Log da resposta
-        logger.info(f"IA: {ai_response}")
+        logger.info(f"IA{' (interrompida)' if spoken.interrupted else ''}: {ai_response}")
         
         # Log estruturado
         log_data = {
@@ -164,14 +182,13 @@ class GroqVoiceAgent(Agent):
             "user_message": user_transcript,
             "ai_response": ai_response,
             "intent": intent_analysis,
-            "conversation_length": len(self.conversation_history)
+            "interrupted": spoken.interrupted,
+            "conversation_length": self.conversation_history.message_count,
+            "history_tokens": self.conversation_history.prompt_tokens
         }
         
         logger.info(f"Interação processada: {json.dumps(log_data, ensure_ascii=False)}")
         
-        # Enviar resposta para o chat
-        await chat_ctx.respond(ai_response)
-        
         raise StopResponse()
 
 async def entrypoint(ctx: JobContext):
@@ -180,9 +197,11 @@ async def entrypoint(ctx: JobContext):
     
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
     
+    agent = GroqVoiceAgent()
     session = AgentSession()
+    agent.barge_in.attach(session)
     await session.start(
-        agent=GroqVoiceAgent(),
+        agent=agent,
         room=ctx.room,
         room_output_options=RoomOutputOptions(
             transcription_enabled=True,
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Roteador de intenções antes do LLM
+Cada transcrição é classificada localmente (motor de palavras-chave + um
+classificador TF-IDF de n-gramas treinado com frases de exemplo); pedidos
+determinísticos com confiança alta (hora, data, contas, piada...)
+são respondidos na hora, sem ida ao Groq. O restante segue para o LLM
+"""
+import os
+import math
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from keyword_engine import get_keyword_engine, normalize
+from arithmetic import calculate, format_number
+from llm_gateway import gateway_metrics
+
+logger = logging.getLogger("intent_router")
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.55"))
+# Vantagem mínima do classificador sobre a segunda intenção (inclusive "other")
+INTENT_ROUTER_MARGIN = float(os.getenv("INTENT_ROUTER_MARGIN", "0.2"))
+# Reforço de confiança quando o motor de palavras-chave concorda com o classificador
+# (só vale quando o classificador já decidiu com margem)
+KEYWORD_BOOST = 0.25
+
+# Frases de treino por intenção; "other" ensina o que deve ir para o LLM
+TRAINING_PHRASES: Dict[str, List[str]] = {
+    "time": [
+        "que horas são", "que horas são agora", "me diz as horas", "você sabe que horas são",
+        "qual é a hora", "pode me dizer a hora", "horas por favor",
+    ],
+    "date": [
+        "que dia é hoje", "qual a data de hoje", "hoje é que dia", "me diz a data",
+        "qual é a data", "em que dia estamos",
+    ],
+    "joke": [
+        "conta uma piada", "me conta uma piada", "sabe alguma piada", "fala uma piada",
+        "me faz rir", "quero ouvir uma piada", "conta algo engraçado",
+    ],
+    "quote": [
+        "me diz uma frase motivacional", "uma frase de inspiração", "fala uma citação",
+        "quero uma frase para me motivar", "me inspira com uma frase",
+    ],
+    "weather": [
+        "como está o tempo", "vai chover hoje", "qual a temperatura", "como está o clima",
+        "previsão do tempo", "está fazendo sol",
+    ],
+    "calculator": [
+        "quanto é dois mais dois", "calcula dez vezes três", "quanto dá cem dividido por quatro",
+        "faz uma conta para mim", "soma cinco com sete",
+    ],
+    "translator": [
+        "como se diz obrigado em inglês", "traduz olá para espanhol", "tradução de bom dia",
+        "como fala isso em inglês",
+    ],
+    "greeting": ["oi", "olá", "bom dia", "boa tarde", "boa noite", "oi tudo bem", "olá tudo bem"],
+    "thanks": ["obrigado", "obrigada", "muito obrigado", "valeu", "agradeço", "obrigado pela ajuda"],
+    "farewell": ["tchau", "até logo", "até mais", "adeus", "tchau obrigado", "pode desligar"],
+    "other": [
+        "preciso de ajuda com minha conta", "quero falar sobre meu pedido", "como funciona o serviço",
+        "qual o preço do plano", "meu boleto venceu o que eu faço", "explica como funciona a fatura",
+        "quero cancelar minha assinatura", "tenho uma dúvida sobre o produto", "por que isso aconteceu",
+        "me ajuda a resolver um problema", "o que você acha disso", "fala mais sobre isso",
+        "quanto tempo demora a entrega", "qual o horário de atendimento da loja",
+        # Perguntas com "horas"/"dia"/"piada" que não são pedidos de hora, data ou piada
+        "que horas vocês abrem", "até que horas a loja funciona", "que horas a loja fecha",
+        "qual o horário de funcionamento", "vocês abrem no sábado", "até que horas posso pagar o boleto",
+        "que horas o técnico vem", "que dia chega meu pedido", "meu pedido está atrasado",
+        "quero reclamar do atraso do pedido", "isso não tem graça meu pedido não chegou",
+    ],
+}
+
+JOKES = [
+    "Por que o livro de matemática está triste? Porque tem muitos problemas!",
+    "O que o zero disse para o oito? Bonito cinto!",
+    "Por que o computador foi ao médico? Porque estava com vírus!",
+]
+QUOTES = [
+    "A persistência é o caminho do êxito. - Charles Chaplin",
+    "O sucesso nasce do querer, da determinação e persistência. - Augusto Cury",
+    "Acredite em você mesmo e tudo será possível!",
+]
+
+Handler = Callable[[str], Awaitable[str]]
+
+async def answer_time(text: str) -> str:
+    return f"Agora são {datetime.now().strftime('%H:%M')}."
+
+async def answer_date(text: str) -> str:
+    return f"Hoje é dia {datetime.now().strftime('%d/%m/%Y')}."
+
+async def answer_joke(text: str) -> str:
+    return random.choice(JOKES)
+
+async def answer_quote(text: str) -> str:
+    return random.choice(QUOTES)
+
+async def answer_calculation(text: str) -> Optional[str]:
+    result = calculate(text)
+    if result is None:
+        return None
+    return f"O resultado é {format_number(result[1])}."
+
+async def answer_greeting(text: str) -> str:
+    return "Olá! Como posso ajudar?"
+
+async def answer_thanks(text: str) -> str:
+    return "De nada! Posso ajudar em mais alguma coisa?"
+
+async def answer_farewell(text: str) -> str:
+    return "Até logo! Obrigado pelo contato."
+
+DEFAULT_HANDLERS: Dict[str, Handler] = {
+    "time": answer_time,
+    "date": answer_date,
+    "joke": answer_joke,
+    "quote": answer_quote,
+    "calculator": answer_calculation,
+    "greeting": answer_greeting,
+    "thanks": answer_thanks,
+    "farewell": answer_farewell,
+}
+
+# Intenções locais só valem em frases curtas ("oi, preciso de ajuda com...",
+# "quero uma piada sobre meu pedido atrasado" vão ao LLM)
+MAX_WORDS = {"greeting": 4, "thanks": 5, "farewell": 5, "joke": 5, "time": 6, "date": 6}
+
+def _features(text: str) -> Counter:
+    """Unigramas e bigramas de palavras sobre o texto normalizado"""
+    words = normalize(text).split()
+    features = Counter(words)
+    features.update(f"{a}_{b}" for a, b in zip(words, words[1:]))
+    return features
+
+class TfidfIntentClassifier:
+    """Classificador por centróide TF-IDF (similaridade de cosseno)"""
+
+    def __init__(self, phrases: Dict[str, List[str]] = TRAINING_PHRASES):
+        documents = [(intent, _features(phrase)) for intent, examples in phrases.items() for phrase in examples]
+        document_frequency = Counter(term for _, features in documents for term in features)
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+        centroids: Dict[str, Counter] = {}
+        for intent, features in documents:
+            centroids.setdefault(intent, Counter()).update(self._normalized(self._weigh(features)))
+        self.centroids = {intent: self._normalized(vector) for intent, vector in centroids.items()}
+
+    def _weigh(self, features: Counter) -> Dict[str, float]:
+        return {term: (1 + math.log(count)) * self.idf[term] for term, count in features.items() if term in self.idf}
+
+    @staticmethod
+    def _normalized(vector: Dict[str, float]) -> Dict[str, float]:
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        return {term: value / norm for term, value in vector.items()} if norm else {}
+
+    def classify(self, text: str) -> List[Tuple[str, float]]:
+        """Intenções ordenadas por similaridade (0..1)"""
+        query = self._normalized(self._weigh(_features(text)))
+        scores = [
+            (intent, sum(weight * centroid.get(term, 0.0) for term, weight in query.items()))
+            for intent, centroid in self.centroids.items()
+        ]
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+_classifier: Optional[TfidfIntentClassifier] = None
+_classifier_lock = threading.Lock()
+
+def get_intent_classifier() -> TfidfIntentClassifier:
+    """Classificador compartilhado pelo processo (treinado uma vez)"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = TfidfIntentClassifier()
+        return _classifier
+
+# Totais do processo (todos os agentes do worker)
+ROUTER_STATS = {
+    "routed": 0,
+    "local": 0,
+    "local_ms": 0.0,
+    "by_intent": Counter(),
+}
+# Threads de job do worker de despacho atualizam os mesmos totais
+_stats_lock = threading.Lock()
+
+def router_snapshot() -> Dict[str, Any]:
+    """Taxa de acerto local e estimativa de latência/tokens economizados"""
+    with _stats_lock:
+        routed, local = ROUTER_STATS["routed"], ROUTER_STATS["local"]
+        local_ms, by_intent = ROUTER_STATS["local_ms"], dict(ROUTER_STATS["by_intent"])
+    gateway = gateway_metrics()
+    llm_requests = gateway.get("requests", 0) - gateway.get("errors", 0) - gateway.get("cancelled", 0)
+    avg_llm_ms = gateway.get("latency_ms", 0.0) / llm_requests if llm_requests > 0 else 0.0
+    avg_tokens = gateway.get("tokens", 0) / llm_requests if llm_requests > 0 else 0.0
+    avg_local_ms = local_ms / local if local else 0.0
+    return {
+        "routed": routed,
+        "local": local,
+        "hit_rate": round(local / routed, 3) if routed else 0.0,
+        "avg_local_ms": round(avg_local_ms, 3),
+        "saved_latency_ms": round(local * max(0.0, avg_llm_ms - avg_local_ms)),
+        "saved_tokens": round(local * avg_tokens),
+        "by_intent": by_intent,
+    }
+
+class RouteDecision:
+    """Resultado da classificação de uma transcrição"""
+
+    def __init__(self, intent: str, confidence: float, keyword_hit: bool, local: bool):
+        self.intent = intent
+        self.confidence = confidence
+        self.keyword_hit = keyword_hit
+        self.local = local
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+class IntentRouter:
+    """Decide, por agente, o que é respondido localmente e o que vai ao LLM"""
+
+    def __init__(
+        self,
+        handlers: Optional[Dict[str, Handler]] = None,
+        threshold: float = INTENT_ROUTER_THRESHOLD,
+        margin: float = INTENT_ROUTER_MARGIN,
+        enabled: bool = INTENT_ROUTER_ENABLED,
+        name: str = "agent",
+    ):
+        # Handlers do agente têm precedência sobre os padrões
+        self.handlers = {**DEFAULT_HANDLERS, **(handlers or {})}
+        self.threshold = threshold
+        self.margin = margin
+        self.enabled = enabled
+        self.name = name
+        self.classifier = get_intent_classifier()
+        self.keywords = get_keyword_engine()
+
+    def classify(self, text: str) -> RouteDecision:
+        # Conta falada que o avaliador local entende por inteiro: não precisa de classificador
+        if calculate(text) is not None:
+            return RouteDecision("calculator", 1.0, False, "calculator" in self.handlers)
+
+        ranked = self.classifier.classify(text)
+        intent, confidence = ranked[0] if ranked else ("other", 0.0)
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        # Classificador indeciso ("que horas vocês abrem": hora x other) vai ao LLM
+        decisive = confidence - runner_up >= self.margin
+
+        matches = self.keywords.match(text)
+        keyword_intents = set(matches.labels("intent")) | set(matches.labels("function"))
+        keyword_hit = intent in keyword_intents
+        if keyword_hit and decisive:
+            confidence = min(1.0, confidence + KEYWORD_BOOST)
+
+        local = (
+            intent in self.handlers
+            and decisive
+            and confidence >= self.threshold
+            and len(text.split()) <= MAX_WORDS.get(intent, len(text.split()))
+        )
+        return RouteDecision(intent, round(confidence, 3), keyword_hit, local)
+
+    async def try_local(self, text: str) -> Optional[str]:
+        """Resposta local para pedidos simples; None quando a frase deve ir ao LLM"""
+        if not self.enabled or not text.strip():
+            return None
+
+        started = time.perf_counter()
+        decision = self.classify(text)
+        with _stats_lock:
+            ROUTER_STATS["routed"] += 1
+            routed = ROUTER_STATS["routed"]
+        if routed % 100 == 0:
+            logger.info(f"📊 Roteador de intenções: {router_snapshot()}")
+        if not decision.local:
+            return None
+
+        try:
+            response = await self.handlers[decision.intent](text)
+        except Exception as e:
+            logger.warning(f"[{self.name}] Handler local '{decision.intent}' falhou, seguindo para o LLM: {e}")
+            return None
+        if not response:
+            return None
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _stats_lock:
+            ROUTER_STATS["local"] += 1
+            ROUTER_STATS["local_ms"] += elapsed_ms
+            ROUTER_STATS["by_intent"][decision.intent] += 1
+        logger.info(
+            f"⚡ [{self.name}] Intenção '{decision.intent}' ({decision.confidence:.2f}) "
+            f"respondida localmente em {elapsed_ms:.2f}ms"
+        )
+        return response
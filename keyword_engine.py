@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Motor de palavras-chave (Aho-Corasick)
+Todas as listas de gatilhos (intenção, personalidade, funções especiais,
+sentimento, moderação) viram um único autômato pré-compilado: uma passada
+O(n) sobre o texto devolve todos os acertos, com casamento por palavra
+inteira e sem diferenciar acentos ("sol" não casa com "solução", "inglês"
+casa com "ingles"). As listas podem ser estendidas por um JSON recarregado
+a quente (KEYWORDS_CONFIG)
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+import unicodedata
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("keyword_engine")
+
+KEYWORDS_CONFIG = os.getenv("KEYWORDS_CONFIG", "")
+KEYWORDS_RELOAD_INTERVAL = float(os.getenv("KEYWORDS_RELOAD_INTERVAL", "5"))
+
+# conjunto -> rótulo -> gatilhos; a ordem dos rótulos é a prioridade
+DEFAULT_KEYWORDS: Dict[str, Dict[str, List[str]]] = {
+    "intent": {
+        "greeting": ["oi", "olá", "bom dia", "boa tarde", "boa noite", "hello"],
+        "farewell": ["tchau", "adeus", "até logo", "até mais", "bye"],
+        "help": ["ajuda", "help", "como usar", "o que você faz"],
+        "weather": ["clima", "tempo", "temperatura", "chuva", "sol"],
+        "time": ["horas", "que horas", "que dia", "data"],
+        "joke": ["piada", "engraçado", "humor", "rir"],
+    },
+    "personality": {
+        "teacher": ["professor", "ensinar", "explicar", "educativo", "aula"],
+        "friend": ["amigo", "amigável", "casual", "descontraído", "conversa"],
+        "coach": ["coach", "motivar", "inspirar", "energia", "motivação"],
+        "assistant": ["assistente", "ajudar", "profissional", "formal"],
+    },
+    "function": {
+        "weather": ["clima", "tempo", "temperatura", "chuva", "sol"],
+        "time": ["horas", "que horas", "que dia", "data", "agora"],
+        "joke": ["piada", "engraçado", "humor", "rir", "divertido"],
+        "quote": ["frase", "inspiração", "motivação", "citação"],
+        "calculator": ["calcular", "conta", "matemática", "soma", "multiplicar"],
+        "translator": ["traduzir", "inglês", "espanhol", "idioma"],
+    },
+    "sentiment": {
+        "positive": ["bom", "ótimo", "excelente", "gosto", "legal", "feliz"],
+        "negative": ["ruim", "péssimo", "terrível", "não gosto", "triste", "raiva"],
+    },
+    "moderation": {
+        "inappropriate": ["palavrao1", "palavrao2"],
+        "spam": ["spam", "promoção", "venda"],
+    },
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+def normalize(text: str) -> str:
+    """Minúsculas, sem acentos, palavras separadas por um único espaço"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(_WORD.findall(stripped))
+
+class KeywordAutomaton:
+    """Autômato Aho-Corasick sobre texto normalizado"""
+
+    def __init__(self, keywords: Dict[str, Dict[str, List[str]]]):
+        # Estado 0 é a raiz; saídas: (conjunto, rótulo, gatilho original)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, str, str, int]]] = [[]]
+        self.pattern_count = 0
+
+        for set_name, labels in keywords.items():
+            for label, triggers in labels.items():
+                for trigger in triggers:
+                    pattern = normalize(trigger)
+                    if pattern:
+                        self._add(pattern, (set_name, label, trigger, len(pattern)))
+        self._build_failure_links()
+
+    def _add(self, pattern: str, output: Tuple[str, str, str, int]):
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(output)
+        self.pattern_count += 1
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                # Herda as saídas do sufixo: a busca não precisa seguir a cadeia de falhas
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def search(self, normalized: str) -> List[Tuple[str, str, str]]:
+        """Todos os gatilhos que aparecem como palavras inteiras, em uma passada"""
+        hits = []
+        state = 0
+        length = len(normalized)
+        goto, fail, output = self._goto, self._fail, self._output
+        for index, ch in enumerate(normalized):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not output[state]:
+                continue
+            end = index + 1
+            for set_name, label, trigger, size in output[state]:
+                start = end - size
+                # Fronteira de palavra: texto normalizado só tem espaço entre palavras
+                if (start == 0 or normalized[start - 1] == " ") and (end == length or normalized[end] == " "):
+                    hits.append((set_name, label, trigger))
+        return hits
+
+class KeywordMatches:
+    """Acertos de uma frase, agrupados por conjunto e rótulo"""
+
+    def __init__(self, hits: List[Tuple[str, str, str]], label_order: Dict[str, List[str]]):
+        self._by_set: Dict[str, Dict[str, List[str]]] = {}
+        for set_name, label, trigger in hits:
+            self._by_set.setdefault(set_name, {}).setdefault(label, []).append(trigger)
+        self._label_order = label_order
+
+    def labels(self, set_name: str) -> Dict[str, List[str]]:
+        """rótulo -> gatilhos encontrados (na ordem de prioridade do conjunto)"""
+        found = self._by_set.get(set_name, {})
+        return {label: found[label] for label in self._label_order.get(set_name, []) if label in found}
+
+    def first(self, set_name: str) -> Optional[str]:
+        """Rótulo de maior prioridade encontrado no conjunto"""
+        return next(iter(self.labels(set_name)), None)
+
+    def count(self, set_name: str, label: str) -> int:
+        return len(self._by_set.get(set_name, {}).get(label, []))
+
+class KeywordEngine:
+    """Autômato compartilhado, recarregado quando o JSON de configuração muda"""
+
+    def __init__(self, config_path: str = KEYWORDS_CONFIG, reload_interval: float = KEYWORDS_RELOAD_INTERVAL):
+        self.config_path = config_path
+        self.reload_interval = reload_interval
+        self._config_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        # (autômato, texto, acertos) da última frase
+        self._last: Tuple[Optional[KeywordAutomaton], str, Optional[KeywordMatches]] = (None, "", None)
+        # Uma recompilação por vez quando várias threads de job percebem a mudança
+        self._reload_lock = threading.Lock()
+        self._compile(self._load())
+
+    def _load(self) -> Dict[str, Dict[str, List[str]]]:
+        """Padrões embutidos + conjuntos/rótulos do JSON (o JSON substitui listas de mesmo rótulo)"""
+        keywords = {set_name: dict(labels) for set_name, labels in DEFAULT_KEYWORDS.items()}
+        if not self.config_path or not os.path.exists(self.config_path):
+            return keywords
+        try:
+            self._config_mtime = os.path.getmtime(self.config_path)
+            with open(self.config_path, encoding="utf-8") as f:
+                config = json.load(f)
+            for set_name, labels in config.items():
+                keywords.setdefault(set_name, {}).update(labels)
+        except Exception as e:
+            logger.error(f"Erro ao carregar palavras-chave de {self.config_path}: {e}")
+        return keywords
+
+    def _compile(self, keywords: Dict[str, Dict[str, List[str]]]):
+        started = time.perf_counter()
+        automaton = KeywordAutomaton(keywords)
+        # Troca atômica: buscas em andamento terminam com o autômato antigo
+        label_order = {set_name: list(labels) for set_name, labels in keywords.items()}
+        self.keywords = keywords
+        self.label_order = label_order
+        self.automaton = automaton
+        # Autômato e ordem dos rótulos trocados juntos (lidos de uma vez por match)
+        self._compiled = (automaton, label_order)
+        logger.info(
+            f"🔤 {automaton.pattern_count} palavras-chave compiladas "
+            f"em {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+
+    def maybe_reload(self) -> bool:
+        """Recompila se o JSON mudou (verifica no máximo a cada reload_interval)"""
+        if not self.config_path:
+            return False
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return False
+        if not self._reload_lock.acquire(blocking=False):
+            # Outra thread já está verificando; esta segue com o autômato atual
+            return False
+        try:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.config_path)
+            except OSError:
+                return False
+            if mtime == self._config_mtime:
+                return False
+            self._compile(self._load())
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def match(self, text: str) -> KeywordMatches:
+        """Acertos de todos os conjuntos em uma passada (reaproveita o resultado da última frase)"""
+        self.maybe_reload()
+        # Lê cada tupla uma vez: outra thread pode trocá-la (nova frase ou recompilação)
+        automaton, label_order = self._compiled
+        last_automaton, last_text, last_matches = self._last
+        if last_automaton is automaton and text == last_text and last_matches is not None:
+            return last_matches
+        matches = KeywordMatches(automaton.search(normalize(text)), label_order)
+        self._last = (automaton, text, matches)
+        return matches
+
+_engine: Optional[KeywordEngine] = None
+_engine_lock = threading.Lock()
+
+def get_keyword_engine() -> KeywordEngine:
+    """Retorna o motor compartilhado pelo processo"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = KeywordEngine()
+        return _engine
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Gateway assíncrono para o LLM (Groq)
+Cliente HTTP compartilhado pelos agentes do mesmo event loop, com conexões
+keep-alive, HTTP/2 quando disponível, limite de concorrência, timeout por
+requisição e cancelamento (barge-in). O cliente httpx e o semáforo pertencem
+ao loop que os criou: no worker de despacho (um loop por thread de job) cada
+loop tem o seu gateway
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import weakref
+import importlib.util
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger("llm_gateway")
+
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+DEFAULT_MODEL = "llama3-8b-8192"
+
+# HTTP/2 só é habilitado se o pacote h2 estiver instalado (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+class LLMGatewayError(Exception):
+    """Erro retornado pela API do LLM"""
+
+class LLMGateway:
+    """Cliente assíncrono compartilhado para chat completions do Groq"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = GROQ_BASE_URL,
+        timeout: float = float(os.getenv("LLM_TIMEOUT", "10")),
+        max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "50")),
+        max_keepalive_connections: int = 20,
+        max_concurrency: Optional[int] = int(os.getenv("LLM_MAX_CONCURRENCY", "0")) or None,
+        http2: bool = True,
+    ):
+        self.api_key = api_key or os.getenv("GROQ_API_KEY", "")
+        self.base_url = base_url
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=30.0,
+        )
+        self.http2 = http2 and HTTP2_AVAILABLE
+        # Limita requisições simultâneas ao Groq sem bloquear o event loop
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.metrics = {
+            "requests": 0,
+            "errors": 0,
+            "cancelled": 0,
+            "in_flight": 0,
+            "waiting": 0,
+            # Somatórios das requisições concluídas (médias de latência e tokens por chamada)
+            "latency_ms": 0.0,
+            "tokens": 0,
+        }
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Cliente HTTP com pool de conexões, criado sob demanda"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                limits=self.limits,
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                http2=self.http2,
+            )
+        return self._client
+
+    async def _acquire_slot(self):
+        """Aguarda uma vaga no limite de concorrência, se configurado"""
+        if self._semaphore is None:
+            return
+        self.metrics["waiting"] += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.metrics["waiting"] -= 1
+
+    def _release_slot(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def _payload(self, messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = DEFAULT_MODEL,
+        max_tokens: int = 150,
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Executa um chat completion e retorna o texto da resposta"""
+        payload = self._payload(messages, model, max_tokens, temperature, stream=False)
+        await self._acquire_slot()
+        started = time.perf_counter()
+        self.metrics["requests"] += 1
+        self.metrics["in_flight"] += 1
+
+        try:
+            response = await asyncio.wait_for(
+                self.client.post("/chat/completions", json=payload),
+                timeout=timeout or self.timeout,
+            )
+            if response.status_code != 200:
+                raise LLMGatewayError(f"Groq API {response.status_code}: {response.text}")
+
+            result = response.json()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.metrics["latency_ms"] += elapsed_ms
+            self.metrics["tokens"] += result.get("usage", {}).get("total_tokens", 0)
+            logger.debug(f"Completion em {elapsed_ms:.0f}ms")
+            return result["choices"][0]["message"]["content"].strip()
+
+        except asyncio.CancelledError:
+            self.metrics["cancelled"] += 1
+            raise
+        except Exception:
+            self.metrics["errors"] += 1
+            raise
+        finally:
+            self.metrics["in_flight"] -= 1
+            self._release_slot()
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = DEFAULT_MODEL,
+        max_tokens: int = 150,
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """Executa um chat completion em streaming, entregando os deltas de texto"""
+        payload = self._payload(messages, model, max_tokens, temperature, stream=True)
+        await self._acquire_slot()
+        started = time.perf_counter()
+        self.metrics["requests"] += 1
+        self.metrics["in_flight"] += 1
+
+        try:
+            async with self.client.stream(
+                "POST",
+                "/chat/completions",
+                json=payload,
+                timeout=httpx.Timeout(timeout or self.timeout, connect=5.0),
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise LLMGatewayError(f"Groq API {response.status_code}: {body.decode(errors='replace')}")
+
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    # O Groq envia o uso de tokens no último chunk (x_groq.usage)
+                    usage = chunk.get("x_groq", {}).get("usage") or chunk.get("usage")
+                    if usage:
+                        self.metrics["tokens"] += usage.get("total_tokens", 0)
+                    if not chunk.get("choices"):
+                        continue
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+
+            self.metrics["latency_ms"] += (time.perf_counter() - started) * 1000
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # Saída do async with fecha a conexão e interrompe a geração no servidor
+            self.metrics["cancelled"] += 1
+            raise
+        except Exception:
+            self.metrics["errors"] += 1
+            raise
+        finally:
+            self.metrics["in_flight"] -= 1
+            self._release_slot()
+
+    async def aclose(self):
+        """Fecha o pool de conexões"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# event loop -> gateway; o de fora de um loop (pré-aquecimento, scripts) fica em _gateway
+_gateways: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LLMGateway]" = weakref.WeakKeyDictionary()
+_gateway: Optional[LLMGateway] = None
+# Métricas dos gateways já fechados (jobs encerrados)
+_closed_metrics: Dict[str, Any] = {}
+_gateways_lock = threading.Lock()
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def get_llm_gateway() -> LLMGateway:
+    """Retorna o gateway do event loop em execução (compartilhado pelos agentes desse loop)"""
+    global _gateway
+    loop = _running_loop()
+    with _gateways_lock:
+        if loop is None:
+            if _gateway is None:
+                _gateway = LLMGateway()
+            return _gateway
+        gateway = _gateways.get(loop)
+        if gateway is None:
+            gateway = _gateways[loop] = LLMGateway()
+        return gateway
+
+def _add_metrics(totals: Dict[str, Any], metrics: Dict[str, Any]):
+    for key, value in metrics.items():
+        totals[key] = totals.get(key, 0) + value
+
+async def close_llm_gateway():
+    """Fecha o gateway do loop atual (fim do job, antes de o loop da thread encerrar)"""
+    with _gateways_lock:
+        gateway = _gateways.pop(asyncio.get_running_loop(), None)
+        if gateway is not None:
+            _add_metrics(_closed_metrics, gateway.metrics)
+    if gateway is not None:
+        await gateway.aclose()
+
+def gateway_metrics() -> Dict[str, Any]:
+    """Métricas somadas de todos os gateways do processo"""
+    with _gateways_lock:
+        gateways = list(_gateways.values()) + ([_gateway] if _gateway is not None else [])
+        totals = dict(_closed_metrics)
+    for gateway in gateways:
+        _add_metrics(totals, gateway.metrics)
+    return totals
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Persistência durável em SQLite (WAL)
+Agentes, chamadas e logs de conversa continuam nos dicts/listas em memória
+de cada módulo; cada alteração é enfileirada aqui e gravada por uma única
+task escritora, em lotes (uma transação por lote) numa thread dedicada, de
+modo que os handlers nunca esperam pelo disco. Várias alterações da mesma
+linha dentro de um lote viram uma só gravação. Na subida, cada módulo
+recarrega seu estado a partir do banco (as chamadas encerradas limitadas à
+capacidade do histórico em memória); o escritor apaga as encerradas mais
+antigas além de PERSISTENCE_CALL_RETENTION por origem
+"""
+import os
+import json
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("persistence")
+
+PERSISTENCE_ENABLED = os.getenv("PERSISTENCE_ENABLED", "true").lower() == "true"
+PERSISTENCE_DB_PATH = os.getenv("PERSISTENCE_DB_PATH", "data/voice_agents.db")
+PERSISTENCE_BATCH_SIZE = int(os.getenv("PERSISTENCE_BATCH_SIZE", "200"))
+# Espera após a primeira alteração para juntar as seguintes na mesma transação
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "0.05"))
+# Chamadas encerradas mantidas por origem (padrão: a capacidade do histórico em memória)
+PERSISTENCE_CALL_RETENTION = int(os.getenv(
+    "PERSISTENCE_CALL_RETENTION", os.getenv("CALL_HISTORY_MAX_RECORDS", "10000")
+))
+
+# Campos que só fazem sentido no processo atual (ex.: subprocess.Popen)
+TRANSIENT_FIELDS = {"process"}
+# Primeiro campo presente identifica quem ligou/recebeu, conforme a origem
+CALLER_FIELDS = ("caller_id", "caller_number", "destination", "destination_number")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agents (
+    agent_id TEXT PRIMARY KEY,
+    room_name TEXT,
+    agent_type TEXT,
+    status TEXT,
+    start_time TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_agents_room ON agents(room_name);
+
+CREATE TABLE IF NOT EXISTS calls (
+    source TEXT NOT NULL,
+    call_id TEXT NOT NULL,
+    status TEXT,
+    active INTEGER NOT NULL,
+    trunk TEXT,
+    caller TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (source, call_id)
+);
+CREATE INDEX IF NOT EXISTS idx_calls_source_active ON calls(source, active, end_time);
+CREATE INDEX IF NOT EXISTS idx_calls_source_status ON calls(source, status);
+CREATE INDEX IF NOT EXISTS idx_calls_source_trunk ON calls(source, trunk);
+CREATE INDEX IF NOT EXISTS idx_calls_source_caller ON calls(source, caller);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    participant_id TEXT,
+    timestamp TEXT,
+    processed_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_processed ON conversations(processed_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_participant ON conversations(participant_id, processed_at);
+"""
+
+# Comandos fixos: o sqlite3 mantém cada um preparado no cache da conexão
+UPSERT_AGENT = (
+    "INSERT OR REPLACE INTO agents (agent_id, room_name, agent_type, status, start_time, data) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+DELETE_AGENT = "DELETE FROM agents WHERE agent_id = ?"
+UPSERT_CALL = (
+    "INSERT OR REPLACE INTO calls (source, call_id, status, active, trunk, caller, start_time, end_time, data) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+DELETE_CALL = "DELETE FROM calls WHERE source = ? AND call_id = ?"
+INSERT_CONVERSATION = (
+    "INSERT OR REPLACE INTO conversations (id, participant_id, timestamp, processed_at, data) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+SELECT_AGENTS = "SELECT data FROM agents ORDER BY start_time"
+SELECT_ACTIVE_CALLS = "SELECT data FROM calls WHERE source = ? AND active = 1 ORDER BY start_time"
+SELECT_ENDED_CALLS = (
+    "SELECT data FROM (SELECT data, end_time FROM calls WHERE source = ? AND active = 0 "
+    "ORDER BY end_time DESC LIMIT ?) ORDER BY end_time"
+)
+SELECT_CALL_SOURCES = "SELECT DISTINCT source FROM calls"
+# end_time da encerrada mais recente que já fica fora da retenção
+SELECT_RETENTION_CUTOFF = (
+    "SELECT end_time FROM calls WHERE source = ? AND active = 0 ORDER BY end_time DESC LIMIT 1 OFFSET ?"
+)
+PRUNE_ENDED_CALLS = "DELETE FROM calls WHERE source = ? AND active = 0 AND end_time <= ?"
+SELECT_RECENT_CONVERSATIONS = (
+    "SELECT data FROM (SELECT data, processed_at FROM conversations ORDER BY processed_at DESC LIMIT ?) "
+    "ORDER BY processed_at"
+)
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(
+        {key: value for key, value in record.items() if key not in TRANSIENT_FIELDS},
+        ensure_ascii=False,
+        default=str,
+    )
+
+class PersistenceStore:
+    """Fila de gravações + escritor único em SQLite WAL"""
+
+    def __init__(
+        self,
+        path: str = PERSISTENCE_DB_PATH,
+        enabled: bool = PERSISTENCE_ENABLED,
+        batch_size: int = PERSISTENCE_BATCH_SIZE,
+        flush_interval: float = PERSISTENCE_FLUSH_INTERVAL,
+        call_retention: int = PERSISTENCE_CALL_RETENTION,
+    ):
+        self.path = path
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.call_retention = max(1, call_retention)
+        # Limpeza a cada ~10% da retenção em novas encerradas, não a cada lote
+        self.prune_every = max(1, self.call_retention // 10)
+
+        # linha (tabela + chave) -> (comando, parâmetros); a última alteração vence
+        self._pending: "OrderedDict[Tuple[str, ...], Tuple[str, tuple]]" = OrderedDict()
+        # origem -> chamadas encerradas gravadas desde a última limpeza
+        self._ended_since_prune: Dict[str, int] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        # Uma thread só: conexão nunca usada em paralelo e gravações em ordem
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._starting: Optional[asyncio.Future] = None
+        self._closing = False
+        self.stats = {
+            "queued": 0,
+            "coalesced": 0,
+            "written": 0,
+            "batches": 0,
+            "errors": 0,
+            "pruned": 0,
+        }
+
+    @property
+    def started(self) -> bool:
+        return self._writer_task is not None
+
+    async def start(self):
+        """Abre o banco e inicia o escritor (idempotente; chamado por cada módulo na subida)"""
+        if not self.enabled:
+            return
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        await self._starting
+
+    async def _start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._wakeup = asyncio.Event()
+        await self._run(self._open)
+        self._writer_task = self._loop.create_task(self._writer())
+        if self._pending:
+            self._wakeup.set()
+        logger.info(f"💾 Persistência SQLite (WAL) em {self.path}")
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None: transações explícitas, uma por lote
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+        self._prune_calls([row[0] for row in conn.execute(SELECT_CALL_SOURCES)])
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _enqueue(self, key: Tuple[str, ...], sql: str, params: tuple):
+        """Agenda uma gravação (pode ser chamado de outras threads, ex.: leitura de logs)"""
+        if not self.enabled:
+            return
+        if self._loop is not None and threading.get_ident() != self._loop_thread:
+            self._loop.call_soon_threadsafe(self._put, key, sql, params)
+        else:
+            self._put(key, sql, params)
+
+    def _put(self, key: Tuple[str, ...], sql: str, params: tuple):
+        if key in self._pending:
+            self.stats["coalesced"] += 1
+            del self._pending[key]
+        self._pending[key] = (sql, params)
+        self.stats["queued"] += 1
+        if sql == UPSERT_CALL and not params[3]:
+            self._ended_since_prune[params[0]] = self._ended_since_prune.get(params[0], 0) + 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _writer(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            if not self._closing:
+                await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            await self._flush()
+            await self._maybe_prune()
+
+    async def _flush(self):
+        while self._pending:
+            batch = [self._pending.popitem(last=False)[1] for _ in range(min(len(self._pending), self.batch_size))]
+            try:
+                await self._run(self._write_batch, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"❌ Erro ao gravar lote de {len(batch)} alterações no SQLite: {e}")
+
+    def _write_batch(self, batch: List[Tuple[str, tuple]]):
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            # Comandos iguais e consecutivos vão juntos em executemany
+            for sql, group in groupby(batch, key=lambda item: item[0]):
+                conn.executemany(sql, [params for _, params in group])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.stats["written"] += len(batch)
+        self.stats["batches"] += 1
+
+    async def _maybe_prune(self):
+        """Apaga as encerradas além da retenção nas origens com gravações suficientes desde a última vez"""
+        sources = [source for source, count in self._ended_since_prune.items() if count >= self.prune_every]
+        if not sources:
+            return
+        for source in sources:
+            del self._ended_since_prune[source]
+        try:
+            await self._run(self._prune_calls, sources)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"❌ Erro ao limpar chamadas antigas no SQLite: {e}")
+
+    def _prune_calls(self, sources: List[str]):
+        for source in sources:
+            cutoff = self._conn.execute(SELECT_RETENTION_CUTOFF, (source, self.call_retention)).fetchone()
+            if cutoff is not None:
+                self.stats["pruned"] += self._conn.execute(PRUNE_ENDED_CALLS, (source, cutoff[0])).rowcount
+
+    async def aclose(self):
+        """Grava o que estiver pendente e fecha o banco (desligamento)"""
+        if self._writer_task is not None:
+            # Sem cancelar: um lote já retirado da fila não pode se perder
+            self._closing = True
+            self._wakeup.set()
+            await self._writer_task
+            self._writer_task = None
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._starting = None
+        self._closing = False
+
+    # Gravações (não bloqueiam: só enfileiram)
+
+    def upsert_agent(self, agent_info: Dict[str, Any]):
+        agent_id = agent_info["agent_id"]
+        self._enqueue(("agents", agent_id), UPSERT_AGENT, (
+            agent_id,
+            agent_info.get("room_name"),
+            agent_info.get("agent_type"),
+            agent_info.get("status"),
+            agent_info.get("start_time"),
+            _dumps(agent_info),
+        ))
+
+    def delete_agent(self, agent_id: str):
+        self._enqueue(("agents", agent_id), DELETE_AGENT, (agent_id,))
+
+    def upsert_call(self, source: str, call_info: Dict[str, Any], active: bool):
+        call_id = call_info["call_id"]
+        caller = next((call_info[field] for field in CALLER_FIELDS if call_info.get(field)), None)
+        self._enqueue(("calls", source, call_id), UPSERT_CALL, (
+            source,
+            call_id,
+            call_info.get("status"),
+            1 if active else 0,
+            call_info.get("trunk"),
+            caller,
+            call_info.get("start_time"),
+            call_info.get("end_time"),
+            _dumps(call_info),
+        ))
+
+    def delete_call(self, source: str, call_id: str):
+        self._enqueue(("calls", source, call_id), DELETE_CALL, (source, call_id))
+
+    def add_conversation(self, conversation: Dict[str, Any]):
+        conversation_id = conversation["id"]
+        self._enqueue(("conversations", conversation_id), INSERT_CONVERSATION, (
+            conversation_id,
+            conversation.get("participant_id"),
+            conversation.get("timestamp"),
+            conversation.get("processed_at"),
+            _dumps(conversation),
+        ))
+
+    # Leituras (restauração na subida), na mesma thread do escritor
+
+    def _select(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        return [json.loads(row[0]) for row in self._conn.execute(sql, params)]
+
+    async def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        if not self.enabled:
+            return []
+        await self.start()
+        return await self._run(self._select, sql, params)
+
+    async def load_agents(self) -> List[Dict[str, Any]]:
+        return await self._query(SELECT_AGENTS)
+
+    async def load_calls(self, source: str, active: bool, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Chamadas ativas (por início) ou encerradas (por encerramento) de uma origem;
+        das encerradas vêm só as limit mais recentes (padrão: a retenção)
+        """
+        if active:
+            return await self._query(SELECT_ACTIVE_CALLS, (source,))
+        return await self._query(SELECT_ENDED_CALLS, (source, limit or self.call_retention))
+
+    async def load_conversations(self, limit: int) -> List[Dict[str, Any]]:
+        """Últimas conversas, da mais antiga para a mais recente"""
+        return await self._query(SELECT_RECENT_CONVERSATIONS, (limit,))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "pending": len(self._pending),
+            **self.stats,
+        }
+
+_store: Optional[PersistenceStore] = None
+
+def get_persistence_store() -> PersistenceStore:
+    """Retorna a persistência compartilhada pelo processo"""
+    global _store
+    if _store is None:
+        _store = PersistenceStore()
+    return _store
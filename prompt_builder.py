@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Montagem de prompts com prefixo estável
+O bloco de sistema de cada agente/personalidade é compilado uma única vez
+por processo e reaproveitado (mesmo objeto, mesmos bytes) em todos os
+turnos e ligações, o que permite ao provedor reaproveitar o prefixo em
+cache. Campos voláteis (duração, Call ID, caller) entram no fim, logo antes
+da fala do usuário. Cada prompt montado gera um relatório de tokens
+"""
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from conversation_history import estimate_tokens
+
+logger = logging.getLogger("prompt_builder")
+
+# Totais do processo (todos os agentes do worker)
+PROMPT_STATS = {
+    "prompts": 0,
+    "static_tokens": 0,
+    "history_tokens": 0,
+    "context_tokens": 0,
+    "user_tokens": 0,
+}
+
+# Blocos de sistema já compilados: conteúdo -> mensagem compartilhada
+_compiled: Dict[str, Dict[str, str]] = {}
+_hooks: List[Callable[["PromptReport"], None]] = []
+
+def compile_block(text: str) -> str:
+    """Remove a indentação do código-fonte e linhas vazias nas pontas"""
+    return "\n".join(line.strip() for line in text.strip().splitlines())
+
+def compile_system_message(text: str) -> Dict[str, str]:
+    """Mensagem de sistema compilada uma vez por processo (não deve ser alterada)"""
+    content = compile_block(text)
+    message = _compiled.get(content)
+    if message is None:
+        message = _compiled[content] = {"role": "system", "content": content}
+    return message
+
+def add_prompt_hook(callback: Callable[["PromptReport"], None]):
+    """Registra uma função chamada com o relatório de tokens de cada prompt"""
+    _hooks.append(callback)
+
+def prompt_snapshot() -> Dict[str, Any]:
+    """Tamanho médio do prompt e fração estável (reaproveitável pelo cache de prefixo)"""
+    prompts = PROMPT_STATS["prompts"]
+    total = sum(value for key, value in PROMPT_STATS.items() if key != "prompts")
+    return {
+        **PROMPT_STATS,
+        "avg_prompt_tokens": round(total / prompts, 1) if prompts else 0.0,
+        "static_ratio": round(PROMPT_STATS["static_tokens"] / total, 3) if total else 0.0,
+    }
+
+class PromptReport:
+    """Tokens (estimados) de um prompt, por parte"""
+
+    def __init__(self, name: str, static_tokens: int, history_tokens: int, context_tokens: int, user_tokens: int):
+        self.name = name
+        self.static_tokens = static_tokens
+        self.history_tokens = history_tokens
+        self.context_tokens = context_tokens
+        self.user_tokens = user_tokens
+        self.total_tokens = static_tokens + history_tokens + context_tokens + user_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+class PromptBuilder:
+    """Prompt = sistema estático + histórico + contexto volátil + fala do usuário"""
+
+    def __init__(self, system_prompt: str, context_template: str = "", name: str = "agent"):
+        self.name = name
+        self.system_message = compile_system_message(system_prompt)
+        self.static_tokens = estimate_tokens(self.system_message["content"])
+        # Template do contexto volátil, preenchido com str.format_map a cada turno
+        self.context_template = compile_block(context_template)
+        self.last_report: Optional[PromptReport] = None
+
+    def build(self, history: Any, user_message: str, **context: Any) -> List[Dict[str, str]]:
+        """Monta as mensagens do turno (context preenche o template volátil)"""
+        messages = [self.system_message]
+        # Histórico que cabe no orçamento de tokens (resumo + trocas recentes)
+        history.append_to(messages)
+
+        context_tokens = 0
+        if self.context_template:
+            content = self.context_template.format_map(context)
+            messages.append({"role": "system", "content": content})
+            context_tokens = estimate_tokens(content)
+
+        messages.append({"role": "user", "content": user_message})
+        self._report(PromptReport(
+            self.name, self.static_tokens, history.prompt_tokens, context_tokens, estimate_tokens(user_message)
+        ))
+        return messages
+
+    def _report(self, report: PromptReport):
+        self.last_report = report
+        PROMPT_STATS["prompts"] += 1
+        PROMPT_STATS["static_tokens"] += report.static_tokens
+        PROMPT_STATS["history_tokens"] += report.history_tokens
+        PROMPT_STATS["context_tokens"] += report.context_tokens
+        PROMPT_STATS["user_tokens"] += report.user_tokens
+        logger.debug(f"[{self.name}] Prompt com ~{report.total_tokens} tokens ({report.static_tokens} estáticos)")
+        for hook in _hooks:
+            try:
+                hook(report)
+            except Exception as e:
+                logger.warning(f"Hook de prompt falhou: {e}")
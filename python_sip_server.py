@@ -6,19 +6,22 @@ Sem dependência do Asterisk - usando bibliotecas Python
 """
 
 import os
-import json
 import asyncio
 import logging
-import socket
 import threading
+import uuid
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from typing import Dict, Optional, Any, Tuple
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import requests
+from groq_ai import GroqAI
+from sip_transactions import SipTransactionLayer, SipTimeoutError, SipMessage, ClientTransaction, TIMER_B, build_request, generate_tag
+from sip_registration import DigestAuth, SipRegistrationManager
+from persistence import get_persistence_store
+from ws_broadcast import get_broadcast_hub
 import websockets
 from contextlib import asynccontextmanager
 import subprocess
@@ -43,12 +46,32 @@ class CallStatus(BaseModel):
     duration: Optional[int] = None
     ai_enabled: bool = True
 
-# Gerenciador de chamadas ativas
+# Gerenciador de chamadas ativas (espelhado no SQLite)
 active_calls: Dict[str, CallStatus] = {}
-websocket_connections: List[WebSocket] = []
+ws_hub = get_broadcast_hub()
+persistence = get_persistence_store()
+PERSISTENCE_SOURCE = "python_sip"
+
+def persist_call(call_id: str):
+    """Enfileira o estado da chamada para gravação no SQLite (não bloqueia)"""
+    call = active_calls[call_id]
+    persistence.upsert_call(PERSISTENCE_SOURCE, call.dict(), active=call.status != "ended")
+
+async def restore_calls():
+    """Recarrega as chamadas em andamento no último reinício
+
+    Os diálogos SIP vivem neste processo e não sobrevivem a ele: essas
+    chamadas voltam como "interrupted" e deixam de contar como ativas
+    """
+    for data in await persistence.load_calls(PERSISTENCE_SOURCE, active=True):
+        data["status"] = "interrupted"
+        active_calls[data["call_id"]] = CallStatus(**data)
+        persistence.upsert_call(PERSISTENCE_SOURCE, data, active=False)
+    if active_calls:
+        logger.info(f"💾 {len(active_calls)} chamadas interrompidas pelo reinício restauradas")
 
 class SimpleSIPClient:
-    """Cliente SIP simplificado usando Python puro"""
+    """Cliente SIP simplificado sobre a camada de transações asyncio"""
     
     def __init__(self, sip_server: str, sip_port: int, username: str, password: str, caller_id: str):
         self.sip_server = sip_server
@@ -56,97 +79,143 @@ class SimpleSIPClient:
         self.username = username
         self.password = password
         self.caller_id = caller_id
-        self.socket = None
-        self.registered = False
-        
-    def connect(self):
-        """Conectar ao servidor SIP"""
+        self.transactions = SipTransactionLayer()
+        # Digest com nonce/nc em cache, compartilhado entre REGISTER, INVITE e BYE
+        self.auth = DigestAuth(username, password)
+        self.registration = SipRegistrationManager(
+            self.transactions, sip_server, sip_port, username, self.auth,
+            expires=int(os.getenv("SIP_REGISTER_EXPIRES", "3600"))
+        )
+        # call_id -> diálogo (From/To com tags, Call-ID, CSeq) para o BYE
+        self.dialogs: Dict[str, Dict[str, Any]] = {}
+        self._cseq = 0
+    
+    @property
+    def server_addr(self):
+        return (self.sip_server, self.sip_port)
+    
+    @property
+    def connected(self) -> bool:
+        return self.transactions.is_running
+    
+    @property
+    def registered(self) -> bool:
+        return self.registration.is_registered
+    
+    def _next_cseq(self) -> int:
+        self._cseq += 1
+        return self._cseq
+    
+    async def connect(self):
+        """Abrir o socket UDP e iniciar o registro em segundo plano"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket.settimeout(10)
-            logger.info(f"🔌 Conectando ao SIP: {self.sip_server}:{self.sip_port}")
+            if not self.connected:
+                logger.info(f"🔌 Conectando ao SIP: {self.sip_server}:{self.sip_port}")
+                await self.transactions.start(remote_host=self.sip_server)
+            self.registration.start()
             return True
         except Exception as e:
             logger.error(f"❌ Erro ao conectar SIP: {e}")
             return False
     
-    def register(self):
-        """Registrar no servidor SIP"""
+    async def close(self):
+        await self.registration.stop()
+        self.transactions.close()
+    
+    def _contact(self) -> str:
+        return f"<sip:{self.username}@{self.transactions.local_host}:{self.transactions.local_port}>"
+    
+    async def register(self):
+        """Forçar um REGISTER agora (o registro normal roda em segundo plano)"""
         try:
-            if not self.socket:
-                self.connect()
-            
-            # Mensagem SIP REGISTER simplificada
-            register_msg = f"""REGISTER sip:{self.sip_server} SIP/2.0
-Via: SIP/2.0/UDP {self.sip_server}:{self.sip_port}
-From: <sip:{self.username}@{self.sip_server}>
-To: <sip:{self.username}@{self.sip_server}>
-Call-ID: {int(time.time())}@{self.sip_server}
-CSeq: 1 REGISTER
-Contact: <sip:{self.username}@{self.sip_server}:{self.sip_port}>
-Authorization: Digest username="{self.username}", password="{self.password}"
-Content-Length: 0
-
-"""
-            
-            self.socket.sendto(register_msg.encode(), (self.sip_server, self.sip_port))
-            
-            # Aguardar resposta
-            response, addr = self.socket.recvfrom(1024)
-            response_str = response.decode()
-            
-            if "200 OK" in response_str:
-                self.registered = True
-                logger.info("✅ Registrado no SIP com sucesso!")
-                return True
-            else:
-                logger.error(f"❌ Falha no registro SIP: {response_str}")
-                return False
-                
+            if not self.connected:
+                await self.connect()
+            return await self.registration.register_once()
         except Exception as e:
             logger.error(f"❌ Erro no registro SIP: {e}")
             return False
     
-    def make_call(self, destination: str) -> Dict[str, Any]:
+    def _build_invite(self, dialog: Dict[str, Any], sdp: str):
+        headers = [
+            ("Via", self.transactions.via()),
+            ("Max-Forwards", "70"),
+            ("From", dialog["from"]),
+            ("To", dialog["to"]),
+            ("Call-ID", dialog["call_id"]),
+            ("CSeq", f"{dialog['cseq']} INVITE"),
+            ("Contact", self._contact()),
+            ("Content-Type", "application/sdp"),
+        ]
+        # Reaproveita os nonces já recebidos (registrar e proxy): evita o 401/407 na primeira tentativa
+        headers.extend(self.auth.headers("INVITE", dialog["request_uri"]))
+        return build_request("INVITE", dialog["request_uri"], headers, sdp)
+    
+    async def _send_invite(self, dialog: Dict[str, Any], sdp: str) -> Tuple[ClientTransaction, SipMessage]:
+        """Envia o INVITE e aguarda o primeiro sinal além do 100 Trying (180/183 ou final)
+        
+        Proxies respondem 100 Trying antes de desafiar: o 401/407 chega como resposta final
+        """
+        loop = asyncio.get_running_loop()
+        progress = loop.create_future()
+        
+        def on_provisional(response: SipMessage):
+            if response.status_code > 100 and not progress.done():
+                progress.set_result(response)
+        
+        transaction = self.transactions.send_request(self._build_invite(dialog, sdp), self.server_addr, on_provisional)
+        # INVITE em andamento: o hangup antes do atendimento vira CANCEL
+        dialog["invite"] = transaction
+        await asyncio.wait({transaction.final_response, progress}, timeout=TIMER_B, return_when=asyncio.FIRST_COMPLETED)
+        if transaction.final_response.done():
+            return transaction, transaction.final_response.result()
+        if progress.done():
+            return transaction, progress.result()
+        # Só 100 Trying até aqui: a chamada segue em segundo plano
+        return transaction, await transaction.first_response
+    
+    async def make_call(self, destination: str) -> Dict[str, Any]:
         """Fazer chamada SIP"""
         try:
             if not self.registered:
-                if not self.register():
-                    return {"success": False, "error": "Falha no registro SIP"}
-            
-            call_id = f"call_{int(time.time())}"
+                # Não registra inline: o registro segue em segundo plano
+                logger.warning(f"⚠️ Chamada sem registro SIP ativo (estado: {self.registration.state})")
             
-            # Mensagem SIP INVITE
-            invite_msg = f"""INVITE sip:{destination}@{self.sip_server} SIP/2.0
-Via: SIP/2.0/UDP {self.sip_server}:{self.sip_port}
-From: <sip:{self.caller_id}@{self.sip_server}>
-To: <sip:{destination}@{self.sip_server}>
-Call-ID: {call_id}@{self.sip_server}
-CSeq: 1 INVITE
-Contact: <sip:{self.username}@{self.sip_server}:{self.sip_port}>
-Content-Type: application/sdp
-Content-Length: 200
-
-v=0
-o=- {int(time.time())} {int(time.time())} IN IP4 {self.sip_server}
-s=AI Call
-c=IN IP4 {self.sip_server}
-t=0 0
-m=audio 8000 RTP/AVP 0 8
-a=rtpmap:0 PCMU/8000
-a=rtpmap:8 PCMA/8000
-
-"""
+            call_id = f"call_{uuid.uuid4().hex[:12]}"
+            local_host = self.transactions.local_host
+            sdp = "\r\n".join([
+                "v=0",
+                f"o=- {int(time.time())} {int(time.time())} IN IP4 {local_host}",
+                "s=AI Call",
+                f"c=IN IP4 {local_host}",
+                "t=0 0",
+                "m=audio 8000 RTP/AVP 0 8",
+                "a=rtpmap:0 PCMU/8000",
+                "a=rtpmap:8 PCMA/8000",
+                "",
+            ])
             
-            self.socket.sendto(invite_msg.encode(), (self.sip_server, self.sip_port))
+            request_uri = f"sip:{destination}@{self.sip_server}"
+            dialog = {
+                "request_uri": request_uri,
+                "from": f"<sip:{self.caller_id}@{self.sip_server}>;tag={generate_tag()}",
+                "to": f"<sip:{destination}@{self.sip_server}>",
+                "call_id": f"{call_id}@{self.sip_server}",
+                "cseq": self._next_cseq(),
+            }
+            self.dialogs[call_id] = dialog
             
-            # Aguardar resposta
-            response, addr = self.socket.recvfrom(2048)
-            response_str = response.decode()
+            # Aguardar o 180/183 ou a resposta final; o restante do INVITE
+            # segue em segundo plano sem bloquear o servidor
+            transaction, response = await self._send_invite(dialog, sdp)
+            if response.status_code in (401, 407) and self.auth.update(response):
+                # Nonce ausente ou expirado: repetir com o novo desafio
+                dialog["cseq"] = self._next_cseq()
+                transaction, response = await self._send_invite(dialog, sdp)
+            asyncio.create_task(self._follow_invite(call_id, transaction))
             
-            logger.info(f"📞 Resposta SIP: {response_str[:200]}...")
+            logger.info(f"📞 Resposta SIP: {response.start_line}")
             
-            if "100 Trying" in response_str or "180 Ringing" in response_str:
+            if response.status_code < 300:
                 return {
                     "success": True,
                     "call_id": call_id,
@@ -154,9 +223,10 @@ a=rtpmap:8 PCMA/8000
                     "message": f"Chamada para {destination} iniciada"
                 }
             else:
+                self.dialogs.pop(call_id, None)
                 return {
                     "success": False,
-                    "error": response_str,
+                    "error": response.start_line,
                     "message": "Falha ao iniciar chamada"
                 }
                 
@@ -168,83 +238,76 @@ a=rtpmap:8 PCMA/8000
                 "message": "Erro interno na chamada SIP"
             }
     
-    def hangup_call(self, call_id: str) -> bool:
-        """Encerrar chamada"""
+    async def _follow_invite(self, call_id: str, transaction):
+        """Aguarda a resposta final do INVITE e confirma o 2xx com ACK"""
         try:
-            # Mensagem SIP BYE
-            bye_msg = f"""BYE sip:{self.sip_server} SIP/2.0
-Via: SIP/2.0/UDP {self.sip_server}:{self.sip_port}
-From: <sip:{self.username}@{self.sip_server}>
-To: <sip:{self.username}@{self.sip_server}>
-Call-ID: {call_id}@{self.sip_server}
-CSeq: 2 BYE
-Content-Length: 0
-
-"""
-            
-            self.socket.sendto(bye_msg.encode(), (self.sip_server, self.sip_port))
-            logger.info(f"📴 Chamada {call_id} encerrada")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Erro ao encerrar chamada: {e}")
-            return False
-
-class GroqAI:
-    """Cliente para Groq AI"""
+            response = await transaction.final_response
+        except (SipTimeoutError, asyncio.CancelledError):
+            self.dialogs.pop(call_id, None)
+            return
+        
+        dialog = self.dialogs.get(call_id)
+        if dialog is None:
+            return
+        if response.status_code >= 300:
+            logger.info(f"📵 Chamada {call_id} recusada: {response.start_line}")
+            self.dialogs.pop(call_id, None)
+            return
+        
+        # 2xx: o To com tag passa a identificar o diálogo; ACK com branch novo
+        dialog["to"] = response.get("To", dialog["to"])
+        ack = build_request("ACK", dialog["request_uri"], [
+            ("Via", self.transactions.via()),
+            ("Max-Forwards", "70"),
+            ("From", dialog["from"]),
+            ("To", dialog["to"]),
+            ("Call-ID", dialog["call_id"]),
+            ("CSeq", f"{dialog['cseq']} ACK"),
+        ])
+        self.transactions.send_raw(ack.encode(), self.server_addr)
+        logger.info(f"✅ Chamada {call_id} atendida")
     
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://api.groq.com/openai/v1"
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+    def _build_bye(self, dialog: Dict[str, Any]):
+        headers = [
+            ("Via", self.transactions.via()),
+            ("Max-Forwards", "70"),
+            ("From", dialog["from"]),
+            ("To", dialog["to"]),
+            ("Call-ID", dialog["call_id"]),
+            ("CSeq", f"{self._next_cseq()} BYE"),
+        ]
+        headers.extend(self.auth.headers("BYE", dialog["request_uri"]))
+        return build_request("BYE", dialog["request_uri"], headers)
     
-    def generate_response(self, text: str, context: Dict = None) -> str:
-        """Gerar resposta usando Groq AI"""
+    async def hangup_call(self, call_id: str) -> bool:
+        """Encerrar chamada"""
         try:
-            messages = [
-                {
-                    "role": "system",
-                    "content": """Você é um assistente de IA para chamadas telefônicas. 
-                    Seja conciso, educado e útil. Responda em português brasileiro.
-                    Mantenha respostas curtas (máximo 2 frases) para chamadas telefônicas."""
-                },
-                {
-                    "role": "user", 
-                    "content": text
-                }
-            ]
-            
-            if context:
-                messages[0]["content"] += f"\nContexto da chamada: {json.dumps(context, ensure_ascii=False)}"
-            
-            payload = {
-                "model": "llama3-8b-8192",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 150,
-                "stream": False
+            dialog = self.dialogs.pop(call_id, None)
+            invite = dialog.get("invite") if dialog else None
+            if invite is not None and not invite.final_response.done():
+                # Ainda não atendida: CANCEL (o INVITE termina com 487), não BYE
+                self.transactions.cancel(invite)
+                logger.info(f"📴 Chamada {call_id} cancelada antes do atendimento")
+                return True
+            dialog = dialog or {
+                "request_uri": f"sip:{self.sip_server}",
+                "from": f"<sip:{self.username}@{self.sip_server}>;tag={generate_tag()}",
+                "to": f"<sip:{self.username}@{self.sip_server}>",
+                "call_id": f"{call_id}@{self.sip_server}",
             }
+            response = await self.transactions.request(self._build_bye(dialog), self.server_addr)
+            if response.status_code in (401, 407) and self.auth.update(response):
+                response = await self.transactions.request(self._build_bye(dialog), self.server_addr)
+            # 481: o diálogo já não existe do outro lado, a chamada está encerrada
+            if response.status_code < 300 or response.status_code == 481:
+                logger.info(f"📴 Chamada {call_id} encerrada")
+                return True
+            logger.error(f"❌ BYE recusado: {response.start_line}")
+            return False
             
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"].strip()
-            else:
-                logger.error(f"Erro Groq API: {response.status_code} - {response.text}")
-                return "Desculpe, não consegui processar sua solicitação no momento."
-                
         except Exception as e:
-            logger.error(f"Erro ao gerar resposta Groq: {e}")
-            return "Desculpe, ocorreu um erro técnico."
+            logger.error(f"❌ Erro ao encerrar chamada: {e}")
+            return False
 
 # Instância do cliente SIP
 sip_client = SimpleSIPClient(
@@ -263,11 +326,17 @@ async def lifespan(app: FastAPI):
     """Gerenciar ciclo de vida da aplicação"""
     # Startup
     logger.info("🚀 Iniciando Python SIP Server...")
-    if sip_client.connect():
-        logger.info("✅ Cliente SIP conectado")
+    await persistence.start()
+    await restore_calls()
+    if await sip_client.connect():
+        logger.info("✅ Cliente SIP conectado (registro em segundo plano)")
     yield
     # Shutdown
     logger.info("🛑 Encerrando Python SIP Server...")
+    await sip_client.close()
+    await groq_ai.aclose()
+    await persistence.aclose()
+    await ws_hub.aclose()
 
 # Criar aplicação FastAPI
 app = FastAPI(
@@ -296,7 +365,7 @@ async def root():
         "message": "Python SIP AI Voice Server",
         "version": "2.0.0",
         "status": "running",
-        "sip_connected": sip_client.socket is not None,
+        "sip_connected": sip_client.connected,
         "sip_registered": sip_client.registered,
         "active_calls": len(active_calls),
         "timestamp": datetime.now().isoformat()
@@ -307,9 +376,10 @@ async def health_check():
     """Verificação de saúde"""
     return {
         "status": "healthy",
-        "sip_connected": sip_client.socket is not None,
+        "sip_connected": sip_client.connected,
         "sip_registered": sip_client.registered,
         "active_calls": len(active_calls),
+        "websocket": ws_hub.status(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -320,7 +390,7 @@ async def make_outbound_call(call_request: CallRequest, background_tasks: Backgr
         logger.info(f"📞 Nova chamada sainte: {call_request.destination_number}")
         
         # Fazer chamada via cliente SIP Python
-        result = sip_client.make_call(call_request.destination_number)
+        result = await sip_client.make_call(call_request.destination_number)
         
         if result["success"]:
             # Registrar chamada ativa
@@ -331,6 +401,7 @@ async def make_outbound_call(call_request: CallRequest, background_tasks: Backgr
                 start_time=datetime.now().isoformat(),
                 ai_enabled=call_request.ai_enabled
             )
+            persist_call(result["call_id"])
             
             # Notificar WebSocket clients
             notification = {
@@ -393,11 +464,12 @@ async def hangup_call(call_id: str, background_tasks: BackgroundTasks):
     """Encerrar chamada"""
     try:
         if call_id in active_calls:
-            success = sip_client.hangup_call(call_id)
+            success = await sip_client.hangup_call(call_id)
             
             if success:
                 # Atualizar status
                 active_calls[call_id].status = "ended"
+                persist_call(call_id)
                 
                 # Notificar WebSocket clients
                 notification = {
@@ -425,34 +497,25 @@ async def hangup_call(call_id: str, background_tasks: BackgroundTasks):
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket para notificações em tempo real"""
-    await websocket.accept()
-    websocket_connections.append(websocket)
-    
-    try:
-        while True:
-            # Manter conexão viva
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        websocket_connections.remove(websocket)
+    # Cada cliente tem fila e tarefa de escrita próprias; assinaturas por ?topics= e ?call_id=
+    await ws_hub.serve(websocket)
 
 async def notify_websocket_clients(message: Dict[str, Any]):
-    """Notificar todos os clientes WebSocket"""
-    if websocket_connections:
-        for websocket in websocket_connections.copy():
-            try:
-                await websocket.send_json(message)
-            except:
-                websocket_connections.remove(websocket)
+    """Notificar os clientes WebSocket (só enfileira; um painel lento não atrasa os demais)"""
+    ws_hub.broadcast(message)
 
 @app.get("/sip/status")
 async def sip_status():
     """Status do cliente SIP"""
     return {
-        "connected": sip_client.socket is not None,
+        "connected": sip_client.connected,
         "registered": sip_client.registered,
         "server": f"{sip_client.sip_server}:{sip_client.sip_port}",
         "username": sip_client.username,
         "caller_id": sip_client.caller_id,
+        "registration": sip_client.registration.status(),
+        "active_dialogs": len(sip_client.dialogs),
+        "transactions": sip_client.transactions.metrics(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -460,7 +523,7 @@ async def sip_status():
 async def register_sip():
     """Registrar no servidor SIP"""
     try:
-        success = sip_client.register()
+        success = await sip_client.register()
         return {
             "success": success,
             "registered": sip_client.registered,
@@ -480,7 +543,7 @@ async def chat_with_ai(message: dict):
         if not user_message:
             raise HTTPException(status_code=400, detail="Mensagem não fornecida")
         
-        response = groq_ai.generate_response(user_message, context)
+        response = await groq_ai.generate_response(user_message, context)
         
         return {
             "success": True,
@@ -16,6 +16,9 @@ from dotenv import load_dotenv
 
 from livekit.api import LiveKitAPI, CreateRoomRequest
 from livekit.protocol import room as room_proto
+from agent_dispatch import is_dispatch_enabled, dispatch_agent, cancel_room_dispatch
+from call_history import CallHistoryStore, CALL_HISTORY_PAGE_SIZE
+from persistence import get_persistence_store
 
 load_dotenv()
 logger = logging.getLogger("real_sip_endpoints")
@@ -25,7 +28,19 @@ real_sip_router = APIRouter(prefix="/real-sip", tags=["Real SIP"])
 
 # Armazenamento para ligações reais ativas
 active_real_calls: Dict[str, Dict[str, Any]] = {}
-real_call_history: List[Dict[str, Any]] = []
+# Histórico ordenado por encerramento, indexado e limitado em memória
+real_call_history = CallHistoryStore(indexed_fields=("call_type", "status", "caller_number"), name="real_sip")
+# Ligações também gravadas no SQLite (escritor em segundo plano)
+persistence = get_persistence_store()
+
+@real_sip_router.on_event("startup")
+async def restore_real_calls():
+    """Recarrega ligações reais gravadas antes do último reinício"""
+    for call_info in await persistence.load_calls("real_sip", active=True):
+        active_real_calls[call_info["call_id"]] = call_info
+    for call_info in await persistence.load_calls("real_sip", active=False, limit=real_call_history.max_records):
+        real_call_history.append(call_info)
+    logger.info(f"💾 SIP real restaurado: {len(active_real_calls)} ativas, {len(real_call_history)} no histórico")
 
 # Modelos para ligações SIP reais
 class RealSipOutboundConfig(BaseModel):
@@ -62,6 +77,12 @@ def generate_real_call_id() -> str:
 async def start_real_sip_agent(call_id: str, room_name: str, config: Dict[str, Any]) -> Optional[int]:
     """Inicia agente para ligação SIP real"""
     try:
+        # Modo de despacho: a sala vai para um dispatch_worker.py em execução
+        if is_dispatch_enabled():
+            await dispatch_agent(room_name, "real_sip", {"call_id": call_id, **config})
+            logger.info(f"Agente SIP REAL despachado para call_id {call_id}")
+            return None
+
         command = [
             "python", 
             "real_sip_integration.py",
@@ -211,6 +232,7 @@ async def make_real_sip_call(
         }
         
         active_real_calls[call_id] = call_info
+        persistence.upsert_call("real_sip", call_info, active=True)
         
         # Log estruturado para ligação real
         real_call_log = {
@@ -320,6 +342,7 @@ async def handle_real_sip_inbound(
         }
         
         active_real_calls[call_id] = call_info
+        persistence.upsert_call("real_sip", call_info, active=True)
         
         # Log para chamada entrante real
         real_inbound_log = {
@@ -394,6 +417,9 @@ async def hangup_real_call(call_id: str):
         
         logger.info(f"📞 Encerrando ligação REAL: {call_id}")
         
+        if is_dispatch_enabled():
+            await cancel_room_dispatch(call_info["room_name"])
+
         # Encerrar processo do agente
         if call_info.get("agent_pid"):
             try:
@@ -414,6 +440,7 @@ async def hangup_real_call(call_id: str):
         
         real_call_history.append(call_info)
         del active_real_calls[call_id]
+        persistence.upsert_call("real_sip", call_info, active=False)
         
         # Log de encerramento da ligação real
         hangup_log = {
@@ -471,22 +498,29 @@ async def get_real_sip_status():
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
 @real_sip_router.get("/history")
-async def get_real_call_history():
-    """Histórico de ligações SIP REAIS"""
+async def get_real_call_history(
+    limit: int = CALL_HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    call_type: Optional[str] = None,
+    status: Optional[str] = None,
+    caller_number: Optional[str] = None,
+):
+    """Histórico de ligações SIP REAIS (mais recentes primeiro, paginado por cursor)"""
     try:
-        sorted_history = sorted(
-            real_call_history,
-            key=lambda x: x.get("start_time", ""),
-            reverse=True
+        history, next_cursor = real_call_history.page(
+            limit=limit, cursor=cursor, call_type=call_type, status=status, caller_number=caller_number
         )
         
         return {
             "success": True,
-            "total_real_calls": len(sorted_history),
-            "history": sorted_history[:50],  # Últimas 50 ligações reais
+            "total_real_calls": len(real_call_history),
+            "history": history,
+            "next_cursor": next_cursor,
             "real_calls_only": True
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"❌ Erro ao buscar histórico real: {e}")
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
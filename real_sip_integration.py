@@ -8,7 +8,7 @@ import json
 import logging
 import asyncio
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from dotenv import load_dotenv
 
 from livekit import agents
@@ -22,7 +22,13 @@ from livekit.agents.llm import (
 )
 from livekit.api import LiveKitAPI
 import assemblyai
-import groq
+from llm_gateway import get_llm_gateway
+from response_streaming import stream_llm_sentences, single_sentence
+from barge_in import BargeInController
+from conversation_history import ConversationHistory
+from intent_router import IntentRouter
+from response_cache import get_response_cache, prompt_namespace
+from prompt_builder import PromptBuilder
 
 load_dotenv()
 logging.basicConfig(
@@ -56,10 +62,41 @@ class RealSipAgent(Agent):
             stt=assemblyai.STT(),
         )
         
-        self.groq_client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.conversation_history = []
+        # Gateway assíncrono compartilhado (não bloqueia o event loop)
+        self.llm_gateway = get_llm_gateway()
+        # Histórico limitado por tokens; o que sai da janela vira resumo
+        self.conversation_history = ConversationHistory(token_budget=250, summarizer=self.llm_gateway, name="real_sip")
         self.call_start_time = datetime.now()
         self.sip_metadata = {}
+        self.streaming_enabled = os.getenv("GROQ_STREAMING", "true").lower() == "true"
+        self.barge_in = BargeInController("real_sip")
+        # Pedidos simples (hora, data, piada...) respondidos sem chamar o Groq
+        self.router = IntentRouter(name="real_sip")
+        # Respostas do LLM reaproveitadas quando a mesma pergunta se repete
+        self.response_cache = get_response_cache()
+        # Instruções fixas compiladas uma vez; o contexto da ligação vai no fim do prompt
+        self.prompt = PromptBuilder(
+            """Você está em uma ligação telefônica REAL (SIP).
+            
+            INSTRUÇÕES CRÍTICAS:
+            1. Respostas de 8-25 palavras (telefone real)
+            2. Seja claro e direto
+            3. Use linguagem natural
+            4. Confirme entendimento
+            5. Seja educado e profissional
+            
+            EXEMPLOS:
+            - "Entendi perfeitamente. Posso ajudá-lo com isso."
+            - "Claro! Vou processar essa informação agora."
+            - "Perfeito. Mais alguma coisa?"
+            """,
+            context_template="""CONTEXTO:
+            - Call ID: {call_id}
+            - Duração: {duration:.0f} segundos""",
+            name="real_sip",
+        )
+        # Compartilhado entre as ligações: a chave é o prompt estático + as últimas mensagens
+        self.cache_namespace = prompt_namespace("real_sip", self.prompt.system_message["content"])
         
         logger.info("Agente SIP Real inicializado")
 
@@ -73,74 +110,41 @@ class RealSipAgent(Agent):
         }
         logger.info(f"Metadados SIP Real: {self.sip_metadata}")
 
+    def update_conversation_history(self, user_message: str, ai_response: str):
+        """Registra a troca no histórico da ligação real"""
+        self.conversation_history.add("user", user_message)
+        if ai_response:
+            # Resposta vazia: o usuário interrompeu antes da primeira frase
+            self.conversation_history.add("assistant", ai_response)
+
+    def build_real_sip_messages(self, user_message: str) -> List[Dict[str, str]]:
+        """Monta as mensagens para a ligação SIP real"""
+        return self.prompt.build(
+            self.conversation_history,
+            user_message,
+            call_id=self.sip_metadata.get('call_id', 'unknown'),
+            duration=(datetime.now() - self.call_start_time).total_seconds(),
+        )
+
+    def cache_private_values(self) -> Tuple[Any, ...]:
+        """Dados desta ligação no prompt: respostas que os citem não vão ao cache compartilhado"""
+        return (self.sip_metadata.get('call_id'),)
+
     async def generate_real_sip_response(self, user_message: str) -> str:
         """Gera resposta otimizada para ligações SIP reais"""
         try:
-            call_duration = (datetime.now() - self.call_start_time).total_seconds()
-            
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""Você está em uma ligação telefônica REAL.
-                    
-                    CONTEXTO:
-                    - Call ID: {self.sip_metadata.get('call_id', 'unknown')}
-                    - Duração: {call_duration:.0f} segundos
-                    - Tipo: Ligação SIP real
-                    
-                    INSTRUÇÕES CRÍTICAS:
-                    1. Respostas de 8-25 palavras (telefone real)
-                    2. Seja claro e direto
-                    3. Use linguagem natural
-                    4. Confirme entendimento
-                    5. Seja educado e profissional
-                    
-                    EXEMPLOS:
-                    - "Entendi perfeitamente. Posso ajudá-lo com isso."
-                    - "Claro! Vou processar essa informação agora."
-                    - "Perfeito. Mais alguma coisa?"
-                    """
-                }
-            ]
-            
-            # Histórico recente
-            for msg in self.conversation_history[-4:]:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
-            
             # Groq otimizado para ligações reais
-            response = self.groq_client.chat.completions.create(
+            messages = self.build_real_sip_messages(user_message)
+            ai_response = await self.llm_gateway.complete(
                 model="llama3-8b-8192",
                 messages=messages,
                 max_tokens=60,  # Resposta muito curta para telefone
                 temperature=0.3,  # Mais consistente
-                stream=False
             )
-            
-            ai_response = response.choices[0].message.content.strip()
-            
-            # Atualizar histórico
-            self.conversation_history.append({
-                "role": "user",
-                "content": user_message,
-                "timestamp": datetime.now().isoformat()
-            })
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": ai_response,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            # Manter histórico pequeno
-            if len(self.conversation_history) > 8:
-                self.conversation_history = self.conversation_history[-8:]
+            self.response_cache.put(
+                user_message, ai_response, self.cache_namespace, self.conversation_history, messages,
+                private_values=self.cache_private_values(),
+            )
             
             logger.info(f"[REAL-SIP] User: {user_message}")
             logger.info(f"[REAL-SIP] AI: {ai_response}")
@@ -151,6 +155,37 @@ class RealSipAgent(Agent):
             logger.error(f"Erro na resposta SIP real: {e}")
             return "Desculpe, tive um problema. Pode repetir, por favor?"
 
+    async def generate_real_sip_response_stream(self, user_message: str) -> AsyncIterator[str]:
+        """Gera resposta em streaming para ligações reais, frase a frase"""
+        sentences = []
+        try:
+            messages = self.build_real_sip_messages(user_message)
+            async for sentence in stream_llm_sentences(
+                self.llm_gateway,
+                model="llama3-8b-8192",
+                messages=messages,
+                max_tokens=60,
+                temperature=0.3
+            ):
+                sentences.append(sentence)
+                yield sentence
+                
+        except Exception as e:
+            logger.error(f"Erro no streaming SIP real: {e}")
+            if not sentences:
+                yield "Desculpe, tive um problema. Pode repetir, por favor?"
+                return
+        else:
+            self.response_cache.put(
+                user_message, " ".join(sentences), self.cache_namespace, self.conversation_history, messages,
+                private_values=self.cache_private_values(),
+            )
+        
+        ai_response = " ".join(sentences)
+        
+        logger.info(f"[REAL-SIP] User: {user_message}")
+        logger.info(f"[REAL-SIP] AI: {ai_response}")
+
     async def on_user_turn_completed(self, chat_ctx: ChatContext, new_message: ChatMessage):
         """Processa fala do usuário em ligação SIP real"""
         user_transcript = new_message.text_content
@@ -166,8 +201,25 @@ class RealSipAgent(Agent):
             logger.info(f"[REAL-SIP] Chamada encerrada por tempo: {call_duration:.1f}s")
             raise StopResponse()
         
-        # Gerar resposta para ligação real
-        ai_response = await self.generate_real_sip_response(user_transcript)
+        # Gerar e falar a resposta (em streaming, já falada frase a frase);
+        # se o usuário voltar a falar, geração e reprodução são canceladas
+        local_response = await self.router.try_local(user_transcript)
+        if local_response is None:
+            # Pergunta repetida: resposta do cache, sem ida ao Groq
+            local_response = self.response_cache.get(user_transcript, self.cache_namespace, self.conversation_history)
+        if local_response is not None:
+            sentences = single_sentence(local_response)
+        elif self.streaming_enabled:
+            sentences = self.generate_real_sip_response_stream(user_transcript)
+        else:
+            sentences = single_sentence(self.generate_real_sip_response(user_transcript))
+        spoken = await self.barge_in.speak(chat_ctx, sentences)
+        ai_response = spoken.text
+        if spoken.interrupted:
+            logger.info(f"[REAL-SIP] Resposta interrompida pelo usuário após {spoken.sentences} frase(s)")
+        
+        # Histórico só com o que o usuário realmente ouviu
+        self.update_conversation_history(user_transcript, ai_response)
         
         # Log estruturado para ligação real
         real_sip_log = {
@@ -177,16 +229,14 @@ class RealSipAgent(Agent):
             "caller_id": participant_id,
             "user_message": user_transcript,
             "ai_response": ai_response,
+            "interrupted": spoken.interrupted,
             "call_duration": call_duration,
-            "conversation_turns": len(self.conversation_history) // 2,
+            "conversation_turns": self.conversation_history.message_count // 2,
             "call_type": "real_sip_call"
         }
         
         logger.info(f"[REAL-SIP-LOG] {json.dumps(real_sip_log, ensure_ascii=False)}")
         
-        # Responder na ligação real
-        await chat_ctx.respond(ai_response)
-        
         raise StopResponse()
 
 async def real_sip_entrypoint(ctx: JobContext):
@@ -208,6 +258,7 @@ async def real_sip_entrypoint(ctx: JobContext):
     
     # Iniciar sessão para ligação real
     session = AgentSession()
+    agent.barge_in.attach(session)
     await session.start(
         agent=agent,
         room=ctx.room,
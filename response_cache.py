@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Cache semântico de respostas do LLM
+Quem liga repete as mesmas perguntas; a resposta completa de cada pergunta
+fica guardada por namespace (agente + personalidade), com TTL e descarte
+LRU. A busca aceita a frase idêntica (após normalização) ou uma variação
+próxima (similaridade de trigramas de caracteres), devolvendo a resposta
+em microssegundos em vez de uma ida ao Groq. Cada entrada é ligada a um
+contexto curto e estável (as últimas mensagens da conversa), para que a
+mesma pergunta se repita entre ligações. Agentes cujo prompt leva dados da
+ligação (caller, Call ID) usam um namespace pelo prompt estático e não
+guardam respostas que citem esses dados
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from keyword_engine import normalize
+from conversation_history import estimate_tokens
+
+logger = logging.getLogger("response_cache")
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.85"))
+# Mensagens mais recentes da conversa que entram na chave (0 = só a pergunta)
+RESPONSE_CACHE_CONTEXT_MESSAGES = int(os.getenv("RESPONSE_CACHE_CONTEXT_MESSAGES", "2"))
+
+# Namespaces pouco usados saem por LRU acima desse número
+MAX_NAMESPACES = 1024
+
+# Respostas que envelhecem antes do TTL (hora, data, clima...) não entram no cache
+TIME_SENSITIVE_WORDS = frozenset({
+    "hoje", "amanha", "ontem", "agora", "hora", "horas", "horario", "data",
+    "semana", "tempo", "clima", "temperatura", "chover", "chuva", "previsao",
+})
+_CLOCK_OR_DATE = re.compile(r"\b\d{1,2}(:\d{2}|h\d{0,2}\b|/\d{1,2})")
+
+# Totais do processo (todos os agentes do worker)
+RESPONSE_CACHE_STATS = {
+    "lookups": 0,
+    "exact_hits": 0,
+    "near_hits": 0,
+    "stores": 0,
+    "evictions": 0,
+    "expired": 0,
+    "skipped_time_sensitive": 0,
+    "skipped_private": 0,
+    "tokens_saved": 0,
+    "lookup_ms": 0.0,
+}
+
+def cache_snapshot() -> Dict[str, Any]:
+    """Taxa de acerto, tokens economizados e custo médio da busca"""
+    lookups = RESPONSE_CACHE_STATS["lookups"]
+    hits = RESPONSE_CACHE_STATS["exact_hits"] + RESPONSE_CACHE_STATS["near_hits"]
+    return {
+        **RESPONSE_CACHE_STATS,
+        "lookup_ms": round(RESPONSE_CACHE_STATS["lookup_ms"], 3),
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "avg_lookup_us": round(RESPONSE_CACHE_STATS["lookup_ms"] * 1000 / lookups, 1) if lookups else 0.0,
+    }
+
+def _trigrams(normalized: str) -> FrozenSet[str]:
+    padded = f" {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def _digits(normalized: str) -> Tuple[str, ...]:
+    # Variações próximas só valem com os mesmos números ("pedido 123" != "pedido 124")
+    return tuple(word for word in normalized.split() if word.isdigit())
+
+def prompt_namespace(prefix: str, system_prompt: str) -> str:
+    """Namespace compartilhado pelas chamadas com o mesmo prompt estático"""
+    return f"{prefix}:{hashlib.blake2b(system_prompt.encode(), digest_size=6).hexdigest()}"
+
+def context_fingerprint(history: Optional[Any], messages: int = RESPONSE_CACHE_CONTEXT_MESSAGES) -> str:
+    """Impressão digital das últimas mensagens da conversa (sem resumo nem dados da ligação)"""
+    digest = hashlib.blake2b(digest_size=8)
+    if history is not None and messages > 0:
+        for record in list(history)[-messages:]:
+            digest.update(f"\x1e{record.role}\x1f{record.content}".encode())
+    return digest.hexdigest()
+
+def is_time_sensitive(normalized: str, response: str) -> bool:
+    """Pergunta ou resposta que depende do momento (hora, data, clima)"""
+    return not TIME_SENSITIVE_WORDS.isdisjoint(normalized.split()) or bool(_CLOCK_OR_DATE.search(response))
+
+def mentions_private(response: str, private_values: Iterable[str]) -> bool:
+    """Resposta que cita um dado da ligação (caller, Call ID) não serve a outra chamada"""
+    normalized = normalize(response)
+    for value in private_values:
+        value = normalize(str(value or ""))
+        if len(value) >= 3 and value in normalized:
+            return True
+    return False
+
+class CacheEntry:
+    """Uma resposta guardada"""
+
+    __slots__ = ("text", "trigrams", "digits", "response", "tokens", "created", "hits")
+
+    def __init__(self, text: str, response: str, tokens: int):
+        self.text = text
+        self.trigrams = _trigrams(text)
+        self.digits = _digits(text)
+        self.response = response
+        self.tokens = tokens
+        self.created = time.monotonic()
+        self.hits = 0
+
+class ResponseCache:
+    """Respostas por namespace com TTL, LRU e busca por similaridade"""
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.enabled = enabled
+        # namespace -> (contexto, texto normalizado) -> entrada; ordem = uso mais recente no fim
+        self._namespaces: "OrderedDict[str, OrderedDict[Tuple[str, str], CacheEntry]]" = OrderedDict()
+        # Jobs do worker de despacho rodam em threads e compartilham o cache
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._namespaces.values())
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created > self.ttl
+
+    def _near_match(
+        self, entries: "OrderedDict[Tuple[str, str], CacheEntry]", fingerprint: str, normalized: str, now: float
+    ) -> Optional[Tuple[Tuple[str, str], CacheEntry]]:
+        """Entrada mais parecida (coeficiente de Dice sobre trigramas) acima do limiar"""
+        trigrams, digits = _trigrams(normalized), _digits(normalized)
+        size = len(trigrams)
+        best, best_score = None, self.similarity
+        for key, entry in entries.items():
+            if key[0] != fingerprint or entry.digits != digits or self._expired(entry, now):
+                continue
+            total = size + len(entry.trigrams)
+            # Limite superior do Dice pelo tamanho: descarta sem calcular a interseção
+            if 2 * min(size, len(entry.trigrams)) / total < best_score:
+                continue
+            score = 2 * len(trigrams & entry.trigrams) / total
+            if score >= best_score:
+                best, best_score = (key, entry), score
+        return best
+
+    def get(self, text: str, namespace: str, history: Optional[Any] = None) -> Optional[str]:
+        """Resposta guardada para a frase (ou uma variação próxima); None se não houver"""
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        normalized = normalize(text)
+        fingerprint = context_fingerprint(history)
+
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if not entries:
+                return None
+            now = time.monotonic()
+            RESPONSE_CACHE_STATS["lookups"] += 1
+
+            key = (fingerprint, normalized)
+            entry = entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del entries[key]
+                RESPONSE_CACHE_STATS["expired"] += 1
+                entry = None
+            if entry is not None:
+                RESPONSE_CACHE_STATS["exact_hits"] += 1
+            else:
+                match = self._near_match(entries, fingerprint, normalized, now)
+                if match is not None:
+                    key, entry = match
+                    RESPONSE_CACHE_STATS["near_hits"] += 1
+
+            RESPONSE_CACHE_STATS["lookup_ms"] += (time.perf_counter() - started) * 1000
+            if entry is None:
+                return None
+
+            entries.move_to_end(key)
+            self._namespaces.move_to_end(namespace)
+            entry.hits += 1
+            RESPONSE_CACHE_STATS["tokens_saved"] += entry.tokens
+        logger.debug(f"Cache de respostas [{namespace}]: '{text}' ~ '{entry.text}'")
+        return entry.response
+
+    def put(
+        self,
+        text: str,
+        response: str,
+        namespace: str,
+        history: Optional[Any] = None,
+        messages: Optional[List[Dict[str, str]]] = None,
+        private_values: Iterable[str] = (),
+    ):
+        """Guarda uma resposta completa do LLM
+
+        messages estima os tokens que um acerto economiza; private_values são
+        os dados da ligação que impedem guardar a resposta que os cite
+        """
+        if not self.enabled or not response or not text.strip():
+            return
+        normalized = normalize(text)
+        if is_time_sensitive(normalized, response):
+            with self._lock:
+                RESPONSE_CACHE_STATS["skipped_time_sensitive"] += 1
+            return
+        if mentions_private(response, private_values):
+            with self._lock:
+                RESPONSE_CACHE_STATS["skipped_private"] += 1
+            return
+        tokens = estimate_tokens(response) + sum(estimate_tokens(message["content"]) for message in messages or [])
+        key = (context_fingerprint(history), normalized)
+        entry = CacheEntry(normalized, response, tokens)
+        with self._lock:
+            entries = self._namespaces.setdefault(namespace, OrderedDict())
+            self._namespaces.move_to_end(namespace)
+            entries[key] = entry
+            entries.move_to_end(key)
+            RESPONSE_CACHE_STATS["stores"] += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                RESPONSE_CACHE_STATS["evictions"] += 1
+            while len(self._namespaces) > MAX_NAMESPACES:
+                _, dropped = self._namespaces.popitem(last=False)
+                RESPONSE_CACHE_STATS["evictions"] += len(dropped)
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            if namespace is None:
+                self._namespaces.clear()
+            else:
+                self._namespaces.pop(namespace, None)
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Retorna o cache compartilhado pelo processo (todas as threads de job)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Streaming de respostas do Groq com entrega antecipada ao TTS
+Agrupa os deltas de tokens em frases para que a primeira frase seja falada
+enquanto o restante da resposta ainda está sendo gerado
+"""
+import re
+import time
+import inspect
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Union
+
+logger = logging.getLogger("response_streaming")
+
+# Fim de frase: pontuação seguida de espaço (evita cortar "3.5" ou "R$ 2.000")
+SENTENCE_BOUNDARY = re.compile(r'[.!?…]+["\')\]]*\s+')
+# Pontos de quebra secundários para frases muito longas
+SOFT_BOUNDARY = re.compile(r'[,;:]\s+')
+
+class SentenceChunker:
+    """Acumula deltas de tokens e libera frases completas"""
+
+    def __init__(self, min_chars: int = 12, max_chars: int = 180):
+        self.min_chars = min_chars  # Evita mandar "Oi." sozinho para o TTS
+        self.max_chars = max_chars  # Força a quebra em respostas sem pontuação
+        self.buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Adiciona um delta e retorna as frases que ficaram completas"""
+        self.buffer += delta
+        sentences = []
+
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            sentence = self.buffer[:cut].strip()
+            self.buffer = self.buffer[cut:]
+            if sentence:
+                sentences.append(sentence)
+
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Retorna o que sobrou no buffer ao fim do stream"""
+        remainder = self.buffer.strip()
+        self.buffer = ""
+        return remainder or None
+
+    def _find_cut(self) -> Optional[int]:
+        """Encontra a posição onde a próxima frase termina"""
+        for match in SENTENCE_BOUNDARY.finditer(self.buffer):
+            if match.end() >= self.min_chars:
+                return match.end()
+
+        if len(self.buffer) > self.max_chars:
+            soft_cuts = [m.end() for m in SOFT_BOUNDARY.finditer(self.buffer, 0, self.max_chars)]
+            if soft_cuts and soft_cuts[-1] >= self.min_chars:
+                return soft_cuts[-1]
+            space = self.buffer.rfind(" ", self.min_chars, self.max_chars)
+            return space + 1 if space != -1 else self.max_chars
+
+        return None
+
+async def stream_sentences(deltas: AsyncIterator[str], chunker: Optional[SentenceChunker] = None) -> AsyncIterator[str]:
+    """Converte deltas de tokens em frases prontas para o TTS"""
+    chunker = chunker or SentenceChunker()
+
+    try:
+        async for delta in deltas:
+            for sentence in chunker.feed(delta):
+                yield sentence
+    finally:
+        # Interrompido antes do fim: fecha a fonte (e a conexão com o LLM) na hora
+        if hasattr(deltas, "aclose"):
+            await deltas.aclose()
+
+    tail = chunker.flush()
+    if tail:
+        yield tail
+
+async def stream_llm_sentences(gateway: Any, **completion_kwargs) -> AsyncIterator[str]:
+    """Chama o LLM em streaming e entrega a resposta frase a frase"""
+    sentences = stream_sentences(gateway.stream(**completion_kwargs))
+    try:
+        async for sentence in sentences:
+            yield sentence
+    finally:
+        await sentences.aclose()
+
+async def single_sentence(response: Union[str, Awaitable[str]]) -> AsyncIterator[str]:
+    """Adapta uma resposta completa (sem streaming) ao fluxo de frases"""
+    text = response if isinstance(response, str) else await response
+    if text:
+        yield text
+
+async def play_sentence(chat_ctx: Any, sentence: str, on_playback: Optional[Callable[[Any], None]] = None):
+    """Envia a frase ao TTS e aguarda o fim da reprodução, quando o handle permitir"""
+    handle = chat_ctx.respond(sentence)
+    if inspect.isawaitable(handle):
+        handle = await handle
+    if handle is None:
+        return
+    if on_playback:
+        on_playback(handle)
+    wait_for_playout = getattr(handle, "wait_for_playout", None)
+    if wait_for_playout:
+        await wait_for_playout()
+
+async def speak_streamed(
+    chat_ctx: Any,
+    sentences: AsyncIterator[str],
+    spoken: Optional[List[str]] = None,
+    on_playback: Optional[Callable[[Any], None]] = None,
+) -> str:
+    """Envia cada frase ao TTS assim que fica pronta e devolve o texto completo
+
+    As frases entram em `spoken` só depois de reproduzidas; se a fala for
+    interrompida, a lista contém exatamente o que o usuário ouviu
+    """
+    spoken = [] if spoken is None else spoken
+    started = time.perf_counter()
+
+    async for sentence in sentences:
+        if not spoken:
+            logger.info(f"Primeira frase entregue ao TTS em {(time.perf_counter() - started) * 1000:.0f}ms")
+        await play_sentence(chat_ctx, sentence, on_playback)
+        spoken.append(sentence)
+
+    return " ".join(spoken)
@@ -16,6 +16,10 @@ from dotenv import load_dotenv
 
 from livekit.api import LiveKitAPI, CreateRoomRequest
 from livekit.protocol import room as room_proto
+from agent_dispatch import is_dispatch_enabled, dispatch_agent, cancel_room_dispatch
+from call_history import CallHistoryStore, CALL_HISTORY_PAGE_SIZE
+from sip_metrics import SipMetricsAggregator, expire_stale_call
+from persistence import get_persistence_store
 
 load_dotenv()
 logger = logging.getLogger("sip_endpoints")
@@ -25,7 +29,37 @@ sip_router = APIRouter(prefix="/sip", tags=["SIP"])
 
 # Armazenamento em memória para chamadas SIP ativas
 active_sip_calls: Dict[str, Dict[str, Any]] = {}
-sip_call_history: List[Dict[str, Any]] = []
+# Histórico ordenado por encerramento, indexado e limitado em memória
+sip_call_history = CallHistoryStore(indexed_fields=("trunk", "status", "caller_id"), name="sip")
+
+# Agregados lidos por /sip/metrics
+sip_metrics = SipMetricsAggregator()
+# Chamadas também gravadas no SQLite (escritor em segundo plano)
+persistence = get_persistence_store()
+
+@sip_router.on_event("startup")
+async def restore_sip_calls():
+    """Recarrega chamadas gravadas antes do último reinício (com contadores e histórico)"""
+    stale_calls = []
+    for call_info in await persistence.load_calls("sip", active=True):
+        sip_metrics.call_started(call_info)
+        # Agente morto ou max_duration vencido: a chamada não está mais em curso
+        if expire_stale_call(call_info):
+            stale_calls.append(call_info)
+        else:
+            active_sip_calls[call_info["call_id"]] = call_info
+    for call_info in await persistence.load_calls("sip", active=False, limit=sip_call_history.max_records):
+        sip_call_history.append(call_info)
+        sip_metrics.call_started(call_info)
+        sip_metrics.call_ended(call_info)
+    for call_info in stale_calls:
+        sip_call_history.append(call_info)
+        sip_metrics.call_ended(call_info)
+        persistence.upsert_call("sip", call_info, active=False)
+    logger.info(
+        f"💾 SIP restaurado: {len(active_sip_calls)} ativas, {len(sip_call_history)} no histórico "
+        f"({len(stale_calls)} ativas encerradas como falha)"
+    )
 
 # Modelos Pydantic para SIP
 class SipInboundConfig(BaseModel):
@@ -79,6 +113,13 @@ def create_sip_room_name(call_id: str) -> str:
 async def start_sip_agent(call_id: str, room_name: str, sip_config: Dict[str, Any]) -> Optional[int]:
     """Inicia agente SIP para uma chamada específica"""
     try:
+        # Modo de despacho: a sala vai para um dispatch_worker.py em execução
+        # (sem processo dedicado, portanto sem PID)
+        if is_dispatch_enabled():
+            await dispatch_agent(room_name, "sip", {"call_id": call_id, **sip_config})
+            logger.info(f"Agente SIP despachado para call_id {call_id}")
+            return None
+
         # Comando para iniciar agente SIP
         command = [
             "python", 
@@ -193,6 +234,8 @@ async def handle_sip_inbound(
         }
         
         active_sip_calls[call_id] = call_info
+        sip_metrics.call_started(call_info)
+        persistence.upsert_call("sip", call_info, active=True)
         
         # Log estruturado para SIP
         sip_log = {
@@ -297,6 +340,8 @@ async def handle_sip_outbound(
         }
         
         active_sip_calls[call_id] = call_info
+        sip_metrics.call_started(call_info)
+        persistence.upsert_call("sip", call_info, active=True)
         
         # Log estruturado
         sip_log = {
@@ -366,6 +411,9 @@ async def hangup_sip_call(call_id: str):
         
         call_info = active_sip_calls[call_id]
         
+        if is_dispatch_enabled():
+            await cancel_room_dispatch(call_info["room_name"])
+
         # Encerrar processo do agente se existir
         if call_info.get("agent_pid"):
             try:
@@ -386,6 +434,8 @@ async def hangup_sip_call(call_id: str):
         
         sip_call_history.append(call_info)
         del active_sip_calls[call_id]
+        sip_metrics.call_ended(call_info)
+        persistence.upsert_call("sip", call_info, active=False)
         
         # Log de encerramento
         sip_log = {
@@ -417,56 +467,10 @@ async def hangup_sip_call(call_id: str):
 async def get_sip_metrics():
     """Retorna métricas das chamadas SIP"""
     try:
-        total_calls = len(active_sip_calls) + len(sip_call_history)
-        active_calls = len(active_sip_calls)
-        completed_calls = len([c for c in sip_call_history if c["status"] == "completed"])
-        failed_calls = len([c for c in sip_call_history if c["status"] == "failed"])
-        
-        # Calcular duração média
-        durations = []
-        total_duration = 0
+        # Contadores mantidos a cada início/fim de chamada: leitura em tempo constante
+        metrics = SipMetrics(**sip_metrics.snapshot())
         
-        for call in sip_call_history:
-            if "total_duration" in call:
-                durations.append(call["total_duration"])
-                total_duration += call["total_duration"]
-        
-        # Adicionar duração das chamadas ativas
-        current_time = datetime.now()
-        for call in active_sip_calls.values():
-            start_time = datetime.fromisoformat(call["start_time"])
-            duration = int((current_time - start_time).total_seconds())
-            durations.append(duration)
-            total_duration += duration
-        
-        average_duration = sum(durations) / len(durations) if durations else 0
-        
-        # Chamadas por trunk
-        calls_by_trunk = {}
-        all_calls = list(active_sip_calls.values()) + sip_call_history
-        for call in all_calls:
-            trunk = call.get("trunk", "default")
-            calls_by_trunk[trunk] = calls_by_trunk.get(trunk, 0) + 1
-        
-        # Chamadas por hora (últimas 24h)
-        calls_by_hour = {}
-        for call in all_calls:
-            start_time = datetime.fromisoformat(call["start_time"])
-            hour_key = start_time.strftime("%H:00")
-            calls_by_hour[hour_key] = calls_by_hour.get(hour_key, 0) + 1
-        
-        metrics = SipMetrics(
-            total_calls=total_calls,
-            active_calls=active_calls,
-            completed_calls=completed_calls,
-            failed_calls=failed_calls,
-            average_duration=average_duration,
-            total_duration=total_duration,
-            calls_by_trunk=calls_by_trunk,
-            calls_by_hour=calls_by_hour
-        )
-        
-        logger.info(f"Métricas SIP: {total_calls} total, {active_calls} ativas")
+        logger.info(f"Métricas SIP: {metrics.total_calls} total, {metrics.active_calls} ativas")
         return metrics
         
     except Exception as e:
@@ -474,23 +478,29 @@ async def get_sip_metrics():
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
 @sip_router.get("/history")
-async def get_sip_call_history():
-    """Retorna histórico de chamadas SIP"""
+async def get_sip_call_history(
+    limit: int = CALL_HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    trunk: Optional[str] = None,
+    status: Optional[str] = None,
+    caller_id: Optional[str] = None,
+):
+    """Retorna histórico de chamadas SIP (mais recentes primeiro, paginado por cursor)"""
     try:
-        # Ordenar por data mais recente
-        sorted_history = sorted(
-            sip_call_history,
-            key=lambda x: x.get("start_time", ""),
-            reverse=True
+        history, next_cursor = sip_call_history.page(
+            limit=limit, cursor=cursor, trunk=trunk, status=status, caller_id=caller_id
         )
         
-        logger.info(f"Retornando histórico de {len(sorted_history)} chamadas SIP")
+        logger.info(f"Retornando {len(history)} de {len(sip_call_history)} chamadas SIP do histórico")
         return {
             "success": True,
-            "total_calls": len(sorted_history),
-            "history": sorted_history[:50]  # Últimas 50 chamadas
+            "total_calls": len(sip_call_history),
+            "history": history,
+            "next_cursor": next_cursor
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Erro ao buscar histórico SIP: {e}")
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Métricas agregadas das chamadas SIP
+Os contadores são atualizados a cada transição (início/encerramento), então
+/sip/metrics não percorre o histórico. Chamadas ativas restauradas após um
+reinício podem já não existir: expire_stale_call as encerra como falha para
+que não fiquem para sempre na duração das ativas
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+# Mesmo padrão de SipInboundConfig/SipOutboundConfig
+DEFAULT_MAX_DURATION = 1800
+
+class SipMetricsAggregator:
+    """Agregados das chamadas SIP atualizados em O(1) a cada transição de estado
+
+    /sip/metrics lê só estes contadores, sem percorrer o histórico
+    """
+
+    def __init__(self):
+        self.total_calls = 0
+        self.active_calls = 0
+        self.completed_calls = 0
+        self.failed_calls = 0
+        # Duração das chamadas ativas = ativas * agora - soma dos inícios
+        self.active_start_sum = 0.0
+        self.ended_duration_sum = 0
+        self.calls_by_trunk: Dict[str, int] = {}
+        self.calls_by_hour: Dict[str, int] = {}
+
+    def call_started(self, call_info: Dict[str, Any]):
+        start_time = datetime.fromisoformat(call_info["start_time"])
+        trunk = call_info.get("trunk", "default")
+        hour_key = start_time.strftime("%H:00")
+        self.total_calls += 1
+        self.active_calls += 1
+        self.active_start_sum += start_time.timestamp()
+        self.calls_by_trunk[trunk] = self.calls_by_trunk.get(trunk, 0) + 1
+        self.calls_by_hour[hour_key] = self.calls_by_hour.get(hour_key, 0) + 1
+
+    def call_ended(self, call_info: Dict[str, Any]):
+        """Chamada saiu das ativas com status final e total_duration definidos"""
+        self.active_calls -= 1
+        self.active_start_sum -= datetime.fromisoformat(call_info["start_time"]).timestamp()
+        self.ended_duration_sum += call_info.get("total_duration", 0)
+        if call_info["status"] == "completed":
+            self.completed_calls += 1
+        elif call_info["status"] == "failed":
+            self.failed_calls += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        active_duration = max(0, int(self.active_calls * datetime.now().timestamp() - self.active_start_sum))
+        total_duration = self.ended_duration_sum + active_duration
+        return {
+            "total_calls": self.total_calls,
+            "active_calls": self.active_calls,
+            "completed_calls": self.completed_calls,
+            "failed_calls": self.failed_calls,
+            "average_duration": total_duration / self.total_calls if self.total_calls else 0,
+            "total_duration": total_duration,
+            "calls_by_trunk": dict(self.calls_by_trunk),
+            "calls_by_hour": dict(self.calls_by_hour),
+        }
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Existe, mas pertence a outro usuário
+        return True
+    return True
+
+def expire_stale_call(call_info: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """
+    Encerra como falha uma chamada ativa restaurada que não pode mais estar em
+    curso: max_duration já passou ou o processo do agente não existe mais.
+    Define status, end_time, end_reason e total_duration e retorna True
+    """
+    now = now or datetime.now()
+    start_time = datetime.fromisoformat(call_info["start_time"])
+    max_duration = (call_info.get("config") or {}).get("max_duration", DEFAULT_MAX_DURATION)
+    deadline = start_time + timedelta(seconds=max_duration)
+    if deadline <= now:
+        end_time = deadline
+    elif call_info.get("agent_pid") and not _process_alive(call_info["agent_pid"]):
+        end_time = now
+    else:
+        return False
+    call_info["status"] = "failed"
+    call_info["end_reason"] = "stale_after_restart"
+    call_info["end_time"] = end_time.isoformat()
+    call_info["total_duration"] = int((end_time - start_time).total_seconds())
+    return True
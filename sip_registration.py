@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Registro SIP persistente
+Mantém o REGISTER em segundo plano sobre a camada de transações: responde ao
+desafio 401/407 com digest MD5, guarda nonce/nc por realm e tipo de desafio
+para reutilizar nas próximas requisições (INVITE, BYE) e renova o registro
+antes do Expires
+"""
+import re
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sip_transactions import SipMessage, SipTransactionLayer, SipTimeoutError, build_request, generate_tag
+
+logger = logging.getLogger("sip_registration")
+
+AUTH_PARAM = re.compile(r'(\w+)\s*=\s*(?:"([^"]*)"|([^,\s]+))')
+
+def _md5(value: str) -> str:
+    return hashlib.md5(value.encode()).hexdigest()
+
+class DigestChallenge:
+    """Um desafio digest (RFC 2617) guardado para reutilizar o nonce"""
+
+    def __init__(self, header_name: str, realm: str):
+        # Authorization (registrar, 401) ou Proxy-Authorization (proxy, 407)
+        self.header_name = header_name
+        self.realm = realm
+        self.nonce: Optional[str] = None
+        self.opaque: Optional[str] = None
+        self.algorithm = "MD5"
+        self.qop: Optional[str] = None
+        self.nonce_count = 0
+        self.cnonce = uuid.uuid4().hex[:16]
+
+    def update(self, params: Dict[str, str]):
+        if params.get("nonce") != self.nonce:
+            # Nonce novo: reinicia o contador
+            self.nonce_count = 0
+            self.cnonce = uuid.uuid4().hex[:16]
+        self.nonce = params.get("nonce")
+        self.opaque = params.get("opaque")
+        self.algorithm = params.get("algorithm", "MD5")
+        qop_options = [q.strip() for q in params.get("qop", "").split(",") if q.strip()]
+        self.qop = "auth" if "auth" in qop_options else None
+
+    def authorization(self, username: str, password: str, method: str, uri: str) -> str:
+        """Valor do cabeçalho de autorização para o próximo uso do nonce"""
+        self.nonce_count += 1
+        nc = f"{self.nonce_count:08x}"
+
+        ha1 = _md5(f"{username}:{self.realm}:{password}")
+        if self.algorithm.upper() == "MD5-SESS":
+            ha1 = _md5(f"{ha1}:{self.nonce}:{self.cnonce}")
+        ha2 = _md5(f"{method}:{uri}")
+        if self.qop:
+            response = _md5(f"{ha1}:{self.nonce}:{nc}:{self.cnonce}:{self.qop}:{ha2}")
+        else:
+            response = _md5(f"{ha1}:{self.nonce}:{ha2}")
+
+        parts = [
+            f'username="{username}"',
+            f'realm="{self.realm}"',
+            f'nonce="{self.nonce}"',
+            f'uri="{uri}"',
+            f'response="{response}"',
+            f"algorithm={self.algorithm}",
+        ]
+        if self.qop:
+            parts += [f"qop={self.qop}", f"nc={nc}", f'cnonce="{self.cnonce}"']
+        if self.opaque:
+            parts.append(f'opaque="{self.opaque}"')
+        return "Digest " + ", ".join(parts)
+
+class DigestAuth:
+    """Credenciais digest com um desafio guardado por tipo de cabeçalho e realm
+
+    Registrar (401/WWW-Authenticate) e proxy (407/Proxy-Authenticate) têm
+    nonces próprios: um desafio não sobrescreve o outro
+    """
+
+    def __init__(self, username: str, password: str):
+        self.username = username
+        self.password = password
+        self.challenges: Dict[Tuple[str, str], DigestChallenge] = {}
+
+    @property
+    def has_challenge(self) -> bool:
+        return bool(self.challenges)
+
+    @property
+    def nonce_count(self) -> int:
+        return sum(challenge.nonce_count for challenge in self.challenges.values())
+
+    def update(self, response: SipMessage) -> bool:
+        """Guarda o desafio de uma resposta 401/407; False se não houver"""
+        if response.status_code == 407:
+            header, header_name = response.get("Proxy-Authenticate"), "Proxy-Authorization"
+        else:
+            header, header_name = response.get("WWW-Authenticate"), "Authorization"
+        if not header or not header.lower().startswith("digest"):
+            return False
+
+        params = {key.lower(): quoted or unquoted
+                  for key, quoted, unquoted in AUTH_PARAM.findall(header[len("digest"):])}
+        key = (header_name, params.get("realm", ""))
+        challenge = self.challenges.get(key)
+        if challenge is None:
+            challenge = self.challenges[key] = DigestChallenge(*key)
+        challenge.update(params)
+        return True
+
+    def headers(self, method: str, uri: str) -> List[Tuple[str, str]]:
+        """Cabeçalhos de autorização (nome, valor) para cada desafio já recebido"""
+        return [
+            (challenge.header_name, challenge.authorization(self.username, self.password, method, uri))
+            for challenge in self.challenges.values()
+        ]
+
+class SipRegistrationManager:
+    """Mantém o registro SIP ativo em segundo plano"""
+
+    def __init__(
+        self,
+        transactions: SipTransactionLayer,
+        sip_server: str,
+        sip_port: int,
+        username: str,
+        auth: DigestAuth,
+        expires: int = 3600,
+        refresh_margin: float = 0.1,
+        retry_interval: float = 30.0,
+    ):
+        self.transactions = transactions
+        self.sip_server = sip_server
+        self.sip_port = sip_port
+        self.username = username
+        self.auth = auth
+        self.expires = expires
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+        # Call-ID e tag fixos durante toda a vida do registro (RFC 3261, 10.2)
+        self.call_id = f"{uuid.uuid4().hex}@{sip_server}"
+        self.from_tag = generate_tag()
+        self._cseq = 0
+
+        self.state = "unregistered"  # unregistered -> registering -> registered | failed
+        self.expires_at: Optional[float] = None
+        self.last_registered_at: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.refreshes = 0
+        self._registered_event = asyncio.Event()
+        self._refresh_now = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_registered(self) -> bool:
+        return self.state == "registered" and self.expires_at is not None and time.monotonic() < self.expires_at
+
+    @property
+    def server_addr(self):
+        return (self.sip_server, self.sip_port)
+
+    def start(self):
+        """Inicia o loop de registro/renovação"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, unregister: bool = True):
+        """Para a renovação e, opcionalmente, remove o registro (Expires: 0)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if unregister and self.is_registered and self.transactions.is_running:
+            try:
+                await asyncio.wait_for(self.register_once(expires=0), timeout=5)
+            except (asyncio.TimeoutError, SipTimeoutError):
+                pass
+        self.state = "unregistered"
+        self._registered_event.clear()
+
+    async def wait_registered(self, timeout: Optional[float] = None) -> bool:
+        try:
+            await asyncio.wait_for(self._registered_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def refresh(self):
+        """Antecipa a próxima renovação"""
+        self._refresh_now.set()
+
+    async def _run(self):
+        while True:
+            try:
+                ok = await self.register_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ok = self._fail(str(e) or type(e).__name__)
+
+            if ok:
+                ttl = max(self.expires_at - time.monotonic(), 1.0)
+                delay = ttl * (1 - self.refresh_margin)
+            else:
+                delay = self.retry_interval
+
+            self._refresh_now.clear()
+            try:
+                await asyncio.wait_for(self._refresh_now.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            if ok:
+                self.refreshes += 1
+
+    def _build_register(self, expires: int) -> SipMessage:
+        self._cseq += 1
+        uri = f"sip:{self.sip_server}"
+        aor = f"<sip:{self.username}@{self.sip_server}>"
+        contact = f"<sip:{self.username}@{self.transactions.local_host}:{self.transactions.local_port}>"
+        headers = [
+            ("Via", self.transactions.via()),
+            ("Max-Forwards", "70"),
+            ("From", f"{aor};tag={self.from_tag}"),
+            ("To", aor),
+            ("Call-ID", self.call_id),
+            ("CSeq", f"{self._cseq} REGISTER"),
+            ("Contact", contact),
+            ("Expires", str(expires)),
+        ]
+        headers.extend(self.auth.headers("REGISTER", uri))
+        return build_request("REGISTER", uri, headers)
+
+    async def register_once(self, expires: Optional[int] = None) -> bool:
+        """Um ciclo REGISTER, respondendo a até um desafio de autenticação"""
+        expires = self.expires if expires is None else expires
+        if self.state != "registered":
+            self.state = "registering"
+
+        response = await self.transactions.request(self._build_register(expires), self.server_addr)
+        if response.status_code in (401, 407):
+            # Nonce expirado ou primeiro registro: responder ao desafio
+            if not self.auth.update(response):
+                return self._fail(f"Desafio sem digest: {response.start_line}")
+            response = await self.transactions.request(self._build_register(expires), self.server_addr)
+
+        if response.status_code != 200:
+            return self._fail(response.start_line)
+
+        if expires == 0:
+            self.state = "unregistered"
+            self.expires_at = None
+            return True
+
+        granted = self._granted_expires(response, expires)
+        self.expires_at = time.monotonic() + granted
+        self.state = "registered"
+        self.last_error = None
+        self.last_registered_at = datetime.now().isoformat()
+        self._registered_event.set()
+        logger.info(f"✅ Registrado no SIP ({self.username}@{self.sip_server}) por {granted}s")
+        return True
+
+    def _fail(self, reason: str) -> bool:
+        self.state = "failed"
+        self.last_error = reason
+        self._registered_event.clear()
+        logger.error(f"❌ Falha no registro SIP: {reason}")
+        return False
+
+    def _granted_expires(self, response: SipMessage, requested: int) -> int:
+        """Expires concedido: parâmetro do Contact ou cabeçalho Expires"""
+        for contact in response.get_all("Contact"):
+            match = re.search(r";\s*expires=(\d+)", contact, re.IGNORECASE)
+            if match:
+                return int(match.group(1))
+        expires = response.get("Expires")
+        return int(expires) if expires and expires.isdigit() else requested
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "registered": self.is_registered,
+            "expires_in": round(self.expires_at - time.monotonic()) if self.expires_at else None,
+            "last_registered_at": self.last_registered_at,
+            "last_error": self.last_error,
+            "refreshes": self.refreshes,
+            "digest_cached": self.auth.has_challenge,
+            "nonce_count": self.auth.nonce_count,
+        }
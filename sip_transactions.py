@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Camada de transações SIP sobre asyncio (RFC 3261, seção 17)
+Um único socket UDP (DatagramProtocol) atende todas as transações cliente:
+as respostas são casadas pelo branch do Via + método do CSeq (conferindo o
+Call-ID) e as retransmissões seguem os timers A/B (INVITE) e E/F (demais).
+Um INVITE que só recebe provisórias (toca sem atender) é cancelado com CANCEL
+após INVITE_TIMEOUT e descartado se o 487 não chegar em 64*T1
+"""
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("sip_transactions")
+
+# Timers da RFC 3261 (segundos)
+T1 = 0.5
+T2 = 4.0
+T4 = 5.0
+TIMER_B = 64 * T1   # timeout de transação INVITE
+TIMER_F = 64 * T1   # timeout de transação não-INVITE
+TIMER_D = 32.0      # absorve retransmissões da resposta final do INVITE (UDP)
+TIMER_K = T4        # idem para não-INVITE
+# Timeout do usuário da transação: INVITE em "proceeding" (180/183) sem resposta final
+INVITE_TIMEOUT = float(os.getenv("SIP_INVITE_TIMEOUT", "120"))
+
+BRANCH_MAGIC = "z9hG4bK"
+
+# Formas compactas dos cabeçalhos (RFC 3261, seção 7.3.3)
+COMPACT_HEADERS = {
+    "v": "via", "f": "from", "t": "to", "i": "call-id",
+    "m": "contact", "l": "content-length", "c": "content-type",
+}
+
+class SipTimeoutError(Exception):
+    """Transação expirou (Timer B/F) sem resposta final"""
+
+class SipMessage:
+    """Requisição ou resposta SIP já decodificada"""
+
+    def __init__(self, start_line: str, headers: List[Tuple[str, str]], body: str = ""):
+        self.start_line = start_line
+        self.headers = headers
+        self.body = body
+
+    @property
+    def is_response(self) -> bool:
+        return self.start_line.startswith("SIP/2.0")
+
+    @property
+    def status_code(self) -> int:
+        return int(self.start_line.split(" ", 2)[1]) if self.is_response else 0
+
+    @property
+    def reason(self) -> str:
+        parts = self.start_line.split(" ", 2)
+        return parts[2] if self.is_response and len(parts) > 2 else ""
+
+    @property
+    def method(self) -> str:
+        """Método da requisição (ou do CSeq, para respostas)"""
+        if self.is_response:
+            return self.cseq[1]
+        return self.start_line.split(" ", 1)[0]
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """Primeiro valor do cabeçalho (sem diferenciar maiúsculas)"""
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def get_all(self, name: str) -> List[str]:
+        name = name.lower()
+        return [value for key, value in self.headers if key.lower() == name]
+
+    @property
+    def call_id(self) -> str:
+        return self.get("Call-ID", "")
+
+    @property
+    def cseq(self) -> Tuple[int, str]:
+        number, _, method = self.get("CSeq", "0 ").partition(" ")
+        return int(number or 0), method.strip().upper()
+
+    @property
+    def branch(self) -> str:
+        """Parâmetro branch do Via mais alto"""
+        via = self.get("Via", "")
+        for param in via.split(";")[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "branch":
+                return value
+        return ""
+
+    def encode(self) -> bytes:
+        lines = [self.start_line]
+        lines.extend(f"{key}: {value}" for key, value in self.headers if key.lower() != "content-length")
+        body = self.body.encode()
+        lines.append(f"Content-Length: {len(body)}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+    def __str__(self) -> str:
+        return self.encode().decode(errors="replace")
+
+def parse_sip_message(data: bytes) -> SipMessage:
+    """Decodifica um datagrama SIP"""
+    text = data.decode("utf-8", errors="replace")
+    head, _, body = text.replace("\r\n", "\n").partition("\n\n")
+    lines = head.split("\n")
+
+    headers: List[Tuple[str, str]] = []
+    for line in lines[1:]:
+        if line[:1] in (" ", "\t") and headers:
+            # Continuação de linha (folding)
+            key, value = headers[-1]
+            headers[-1] = (key, f"{value} {line.strip()}")
+            continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        key = key.strip()
+        key = COMPACT_HEADERS.get(key.lower(), key)
+        headers.append((key, value.strip()))
+
+    return SipMessage(lines[0].strip(), headers, body)
+
+def generate_branch() -> str:
+    return f"{BRANCH_MAGIC}{uuid.uuid4().hex[:16]}"
+
+def generate_tag() -> str:
+    return uuid.uuid4().hex[:10]
+
+def build_request(method: str, uri: str, headers: List[Tuple[str, str]], body: str = "") -> SipMessage:
+    return SipMessage(f"{method} {uri} SIP/2.0", list(headers), body)
+
+def build_response(request: SipMessage, status_code: int, reason: str) -> SipMessage:
+    """Resposta copiando Via/From/To/Call-ID/CSeq da requisição"""
+    headers = [(key, value) for key, value in request.headers
+               if key.lower() in ("via", "from", "to", "call-id", "cseq")]
+    return SipMessage(f"SIP/2.0 {status_code} {reason}", headers)
+
+class ClientTransaction:
+    """Transação cliente: retransmite a requisição até a resposta final"""
+
+    def __init__(self, layer: "SipTransactionLayer", request: SipMessage, addr: Tuple[str, int],
+                 on_provisional: Optional[Callable[[SipMessage], None]] = None):
+        loop = asyncio.get_running_loop()
+        self.layer = layer
+        self.request = request
+        self.addr = addr
+        self.method = request.method
+        self.key = (request.branch, self.method)
+        self.state = "calling" if self.method == "INVITE" else "trying"
+        self.on_provisional = on_provisional
+        self.first_response: asyncio.Future = loop.create_future()
+        self.final_response: asyncio.Future = loop.create_future()
+        self.provisional: List[SipMessage] = []
+        self.retransmissions = 0
+        self._retransmit_handle: Optional[asyncio.TimerHandle] = None
+        self._timeout_handle: Optional[asyncio.TimerHandle] = None
+        self._ack: Optional[bytes] = None
+        # CANCEL pedido antes da primeira provisória: enviado quando ela chegar
+        self.cancel_requested = False
+        self.cancel_transaction: Optional["ClientTransaction"] = None
+
+    @property
+    def is_invite(self) -> bool:
+        return self.method == "INVITE"
+
+    def start(self):
+        self.layer.send_raw(self.request.encode(), self.addr)
+        # Timer A/E começam em T1; Timer B/F limitam a transação em 64*T1
+        self._schedule_retransmit(T1)
+        loop = asyncio.get_running_loop()
+        self._timeout_handle = loop.call_later(TIMER_B if self.is_invite else TIMER_F, self._on_timeout)
+
+    def _schedule_retransmit(self, interval: float):
+        loop = asyncio.get_running_loop()
+        self._retransmit_handle = loop.call_later(interval, self._retransmit, interval)
+
+    def _retransmit(self, interval: float):
+        if self.state not in ("calling", "trying", "proceeding"):
+            return
+        self.layer.send_raw(self.request.encode(), self.addr)
+        self.retransmissions += 1
+        if self.is_invite:
+            # Timer A: dobra sem limite
+            next_interval = interval * 2
+        elif self.state == "proceeding":
+            # Timer E após resposta provisória: fixo em T2
+            next_interval = T2
+        else:
+            next_interval = min(interval * 2, T2)
+        self._schedule_retransmit(next_interval)
+
+    def _on_timeout(self):
+        if self.state in ("calling", "trying", "proceeding"):
+            logger.warning(f"Transação {self.method} {self.key[0]} expirou após {self.retransmissions} retransmissões")
+            self._cancel_timers()
+            self.state = "terminated"
+            error = SipTimeoutError(f"Sem resposta final para {self.method} em {self.addr[0]}:{self.addr[1]}")
+            for future in (self.first_response, self.final_response):
+                if not future.done():
+                    future.set_exception(error)
+                    # Marca como lida: quem aguarda só uma das duas não gera aviso
+                    future.exception()
+            self.layer.stats["timeouts"] += 1
+            self.layer.remove(self)
+
+    def _on_invite_timeout(self):
+        if self.state == "proceeding" and self.cancel_transaction is None:
+            logger.warning(f"INVITE {self.key[0]} sem resposta final após {INVITE_TIMEOUT:.0f}s: enviando CANCEL")
+            self.layer.stats["invite_timeouts"] += 1
+            self.layer.cancel(self)
+
+    def start_cancel_timeout(self):
+        """Após o CANCEL, o INVITE é descartado se a resposta final (487) não vier em 64*T1"""
+        if self._timeout_handle:
+            self._timeout_handle.cancel()
+        self._timeout_handle = asyncio.get_running_loop().call_later(TIMER_B, self._on_timeout)
+
+    def build_cancel(self) -> SipMessage:
+        """CANCEL do INVITE: mesmo Request-URI, Via (branch), From, To, Call-ID e número do CSeq"""
+        request_uri = self.request.start_line.split(" ")[1]
+        headers = [
+            ("Via", self.request.get("Via")),
+            ("Max-Forwards", "70"),
+            ("From", self.request.get("From")),
+            ("To", self.request.get("To")),
+            ("Call-ID", self.request.call_id),
+            ("CSeq", f"{self.request.cseq[0]} CANCEL"),
+        ]
+        headers.extend(("Route", route) for route in self.request.get_all("Route"))
+        return build_request("CANCEL", request_uri, headers)
+
+    def _cancel_timers(self):
+        for handle in (self._retransmit_handle, self._timeout_handle):
+            if handle:
+                handle.cancel()
+
+    def receive(self, response: SipMessage):
+        """Processa uma resposta casada com esta transação"""
+        if not self.first_response.done():
+            self.first_response.set_result(response)
+
+        code = response.status_code
+        if code < 200:
+            if self.state in ("calling", "trying"):
+                self.state = "proceeding"
+                if self.is_invite:
+                    # Timers A e B param na primeira resposta provisória; o limite passa a ser do TU
+                    self._cancel_timers()
+                    self._timeout_handle = asyncio.get_running_loop().call_later(INVITE_TIMEOUT, self._on_invite_timeout)
+                    if self.cancel_requested:
+                        self.layer.cancel(self)
+            self.provisional.append(response)
+            if self.on_provisional:
+                self.on_provisional(response)
+            return
+
+        if self.state == "completed":
+            # Retransmissão da resposta final: reenviar o ACK (INVITE)
+            if self._ack:
+                self.layer.send_raw(self._ack, self.addr)
+            return
+        if self.state == "terminated":
+            return
+
+        self._cancel_timers()
+        self.final_response.set_result(response)
+
+        if self.is_invite and code >= 300:
+            # ACK de respostas não-2xx é responsabilidade da transação
+            self._ack = self._build_ack(response).encode()
+            self.layer.send_raw(self._ack, self.addr)
+            self._complete(TIMER_D)
+        elif self.is_invite:
+            # 2xx encerra a transação; o ACK fica com o UAC (novo branch)
+            self.state = "terminated"
+            self.layer.remove(self)
+        else:
+            self._complete(TIMER_K)
+
+    def _complete(self, linger: float):
+        self.state = "completed"
+        asyncio.get_running_loop().call_later(linger, self._terminate)
+
+    def _terminate(self):
+        self.state = "terminated"
+        self.layer.remove(self)
+
+    def _build_ack(self, response: SipMessage) -> SipMessage:
+        request_uri = self.request.start_line.split(" ")[1]
+        headers = [
+            ("Via", self.request.get("Via")),
+            ("Max-Forwards", "70"),
+            ("From", self.request.get("From")),
+            ("To", response.get("To")),
+            ("Call-ID", self.request.call_id),
+            ("CSeq", f"{self.request.cseq[0]} ACK"),
+        ]
+        return build_request("ACK", request_uri, headers)
+
+class SipTransactionLayer(asyncio.DatagramProtocol):
+    """Socket UDP compartilhado por todas as transações SIP do processo"""
+
+    def __init__(self, request_handler: Optional[Callable[[SipMessage, Tuple[str, int]], Optional[SipMessage]]] = None):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.local_host = "0.0.0.0"
+        self.local_port = 0
+        self.request_handler = request_handler
+        self._transactions: Dict[Tuple[str, str], ClientTransaction] = {}
+        self.stats = {
+            "transactions": 0,
+            "timeouts": 0,
+            "retransmissions": 0,
+            "unmatched_responses": 0,
+            "malformed": 0,
+            "invite_timeouts": 0,
+            "cancels": 0,
+        }
+
+    async def start(self, local_addr: Tuple[str, int] = ("0.0.0.0", 0), remote_host: Optional[str] = None):
+        """Abre o socket UDP; remote_host ajuda a descobrir o IP local para o Via"""
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=local_addr)
+        if remote_host and self.local_host in ("0.0.0.0", ""):
+            self.local_host = self._discover_local_ip(remote_host)
+        logger.info(f"Camada de transações SIP escutando em {self.local_host}:{self.local_port}")
+
+    @staticmethod
+    def _discover_local_ip(remote_host: str) -> str:
+        # connect() em UDP não envia pacotes; só escolhe a interface de saída
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe.connect((remote_host, 9))
+            return probe.getsockname()[0]
+        except OSError:
+            return "127.0.0.1"
+        finally:
+            probe.close()
+
+    @property
+    def is_running(self) -> bool:
+        return self.transport is not None and not self.transport.is_closing()
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.transport = transport
+        self.local_host, self.local_port = transport.get_extra_info("sockname")[:2]
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.transport = None
+
+    def close(self):
+        for transaction in list(self._transactions.values()):
+            transaction._cancel_timers()
+            for future in (transaction.first_response, transaction.final_response):
+                if not future.done():
+                    future.cancel()
+        self._transactions.clear()
+        if self.transport:
+            self.transport.close()
+
+    def send_raw(self, data: bytes, addr: Tuple[str, int]):
+        if not self.transport:
+            raise ConnectionError("Camada de transações SIP não iniciada")
+        self.transport.sendto(data, addr)
+
+    def via(self, branch: Optional[str] = None) -> str:
+        return f"SIP/2.0/UDP {self.local_host}:{self.local_port};branch={branch or generate_branch()};rport"
+
+    def send_request(self, request: SipMessage, addr: Tuple[str, int],
+                     on_provisional: Optional[Callable[[SipMessage], None]] = None) -> ClientTransaction:
+        """Inicia uma transação cliente; a requisição deve ter Via com branch único"""
+        transaction = ClientTransaction(self, request, addr, on_provisional)
+        self._transactions[transaction.key] = transaction
+        self.stats["transactions"] += 1
+        transaction.start()
+        return transaction
+
+    async def request(self, request: SipMessage, addr: Tuple[str, int]) -> SipMessage:
+        """Envia a requisição e aguarda a resposta final (SipTimeoutError no Timer B/F)"""
+        transaction = self.send_request(request, addr)
+        return await transaction.final_response
+
+    def cancel(self, transaction: ClientTransaction) -> bool:
+        """Cancela um INVITE sem resposta final (RFC 3261, seção 9.1)
+
+        O CANCEL só sai depois de uma resposta provisória; antes disso fica
+        pendente. O INVITE termina com o 487 ou, sem ele, em 64*T1
+        """
+        if not transaction.is_invite or transaction.final_response.done() or transaction.state == "terminated":
+            return False
+        if transaction.cancel_transaction is not None:
+            return True
+        if transaction.state == "calling":
+            transaction.cancel_requested = True
+            return True
+        transaction.cancel_transaction = self.send_request(transaction.build_cancel(), transaction.addr)
+        # Resposta do CANCEL não interessa a ninguém: não deixa exceção sem leitura
+        transaction.cancel_transaction.final_response.add_done_callback(
+            lambda future: future.cancelled() or future.exception()
+        )
+        transaction.start_cancel_timeout()
+        self.stats["cancels"] += 1
+        return True
+
+    def remove(self, transaction: ClientTransaction):
+        if self._transactions.get(transaction.key) is transaction:
+            del self._transactions[transaction.key]
+            self.stats["retransmissions"] += transaction.retransmissions
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        if not data.strip():
+            return  # keep-alive (CRLF)
+        try:
+            message = parse_sip_message(data)
+            # Status e CSeq vêm da rede: inválidos descartam o datagrama aqui
+            key = self._response_key(message) if message.is_response else None
+        except (ValueError, IndexError) as e:
+            self.stats["malformed"] += 1
+            logger.debug(f"Datagrama SIP inválido de {addr}: {e}")
+            return
+
+        if message.is_response:
+            transaction = self._transactions.get(key)
+            if transaction is None or transaction.request.call_id != message.call_id:
+                self.stats["unmatched_responses"] += 1
+                logger.debug(f"Resposta sem transação: {message.start_line} ({message.call_id})")
+                return
+            transaction.receive(message)
+            return
+
+        self._handle_request(message, addr)
+
+    @staticmethod
+    def _response_key(response: SipMessage) -> Tuple[str, str]:
+        """Branch do Via + método do CSeq; ValueError se o status ou o CSeq forem inválidos"""
+        if not 100 <= response.status_code <= 699:
+            raise ValueError(f"Status fora do intervalo: {response.start_line}")
+        return (response.branch, response.method)
+
+    def _handle_request(self, request: SipMessage, addr: Tuple[str, int]):
+        if request.method == "ACK":
+            return
+        response = self.request_handler(request, addr) if self.request_handler else None
+        if response is None:
+            if request.method in ("OPTIONS", "BYE"):
+                response = build_response(request, 200, "OK")
+            else:
+                response = build_response(request, 501, "Not Implemented")
+        self.send_raw(response.encode(), addr)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._transactions)}
@@ -8,7 +8,7 @@ import json
 import logging
 import asyncio
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from dotenv import load_dotenv
 
 from livekit import agents
@@ -21,7 +21,13 @@ from livekit.agents.llm import (
     StopResponse,
 )
 import assemblyai
-import groq
+from llm_gateway import get_llm_gateway
+from response_streaming import stream_llm_sentences, single_sentence
+from barge_in import BargeInController
+from conversation_history import ConversationHistory
+from intent_router import IntentRouter, router_snapshot
+from response_cache import get_response_cache, cache_snapshot, prompt_namespace
+from prompt_builder import PromptBuilder, prompt_snapshot
 
 load_dotenv()
 logging.basicConfig(
@@ -59,10 +65,42 @@ class SipVoiceAgent(Agent):
             stt=assemblyai.STT(),
         )
         
-        # Cliente Groq para IA
-        self.groq_client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.conversation_history = []
-        self.max_history = 6  # Histórico otimizado para SIP
+        # Gateway assíncrono compartilhado (não bloqueia o event loop)
+        self.llm_gateway = get_llm_gateway()
+        # Histórico limitado por tokens; o que sai da janela vira resumo
+        self.conversation_history = ConversationHistory(token_budget=300, summarizer=self.llm_gateway, name="sip")
+        self.streaming_enabled = os.getenv("GROQ_STREAMING", "true").lower() == "true"
+        self.barge_in = BargeInController("sip")
+        # Pedidos simples (hora, data, piada...) respondidos sem chamar o Groq
+        self.router = IntentRouter(name="sip")
+        # Respostas do LLM reaproveitadas quando a mesma pergunta se repete
+        self.response_cache = get_response_cache()
+        # Instruções fixas compiladas uma vez; o contexto da chamada vai no fim do prompt
+        self.prompt = PromptBuilder(
+            """Você é um assistente de voz para chamadas telefônicas SIP.
+            
+            INSTRUÇÕES ESPECÍFICAS PARA SIP:
+            1. Respostas entre 8-35 palavras (otimizado para telefonia)
+            2. Use linguagem clara e natural
+            3. Evite termos técnicos
+            4. Seja direto e útil
+            5. Confirme informações importantes
+            6. Use pausas naturais na fala
+            
+            EXEMPLOS DE BOAS RESPOSTAS:
+            - "Entendi perfeitamente. Posso ajudá-lo com isso agora mesmo."
+            - "Claro! Vou processar essa informação para você."
+            - "Perfeito. Mais alguma coisa que posso esclarecer?"
+            """,
+            context_template="""CONTEXTO DA CHAMADA:
+            - Call ID: {call_id}
+            - Duração: {duration:.0f} segundos
+            - Caller: {caller_id}
+            - Trunk: {trunk}""",
+            name="sip",
+        )
+        # Compartilhado entre as ligações: a chave é o prompt estático + as últimas mensagens
+        self.cache_namespace = prompt_namespace("sip", self.prompt.system_message["content"])
         
         # Metadados da chamada SIP
         self.call_start_time = datetime.now()
@@ -101,77 +139,39 @@ class SipVoiceAgent(Agent):
 
     def update_conversation_history(self, message: str, is_user: bool = True):
         """Atualiza histórico otimizado para SIP"""
-        self.conversation_history.append({
-            "role": "user" if is_user else "assistant",
-            "content": message,
-            "timestamp": datetime.now().isoformat(),
-            "call_duration": (datetime.now() - self.call_start_time).total_seconds()
-        })
-        
-        # Manter histórico menor para SIP (melhor performance)
-        if len(self.conversation_history) > self.max_history * 2:
-            self.conversation_history = self.conversation_history[-self.max_history * 2:]
+        # Duração da ligação sai no export ("elapsed"), sem dict extra por mensagem
+        self.conversation_history.add("user" if is_user else "assistant", message)
+
+    def build_sip_messages(self, user_message: str) -> List[Dict[str, str]]:
+        """Monta as mensagens com o contexto da chamada SIP"""
+        return self.prompt.build(
+            self.conversation_history,
+            user_message,
+            call_id=self.sip_metadata.get('call_id', 'unknown'),
+            duration=(datetime.now() - self.call_start_time).total_seconds(),
+            caller_id=self.sip_metadata.get('caller_id', 'unknown'),
+            trunk=self.sip_metadata.get('trunk', 'default'),
+        )
+
+    def cache_private_values(self) -> Tuple[Any, ...]:
+        """Dados desta ligação no prompt: respostas que os citem não vão ao cache compartilhado"""
+        return (self.sip_metadata.get('call_id'), self.sip_metadata.get('caller_id'), self.sip_metadata.get('trunk'))
 
     async def generate_sip_response(self, user_message: str) -> str:
         """Gera resposta otimizada para SIP/telefonia"""
         try:
-            call_duration = (datetime.now() - self.call_start_time).total_seconds()
-            
-            # Contexto otimizado para SIP
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""Você é um assistente de voz para chamadas telefônicas SIP.
-                    
-                    CONTEXTO DA CHAMADA:
-                    - Call ID: {self.sip_metadata.get('call_id', 'unknown')}
-                    - Duração: {call_duration:.0f} segundos
-                    - Caller: {self.sip_metadata.get('caller_id', 'unknown')}
-                    - Trunk: {self.sip_metadata.get('trunk', 'default')}
-                    
-                    INSTRUÇÕES ESPECÍFICAS PARA SIP:
-                    1. Respostas entre 8-35 palavras (otimizado para telefonia)
-                    2. Use linguagem clara e natural
-                    3. Evite termos técnicos
-                    4. Seja direto e útil
-                    5. Confirme informações importantes
-                    6. Use pausas naturais na fala
-                    
-                    EXEMPLOS DE BOAS RESPOSTAS:
-                    - "Entendi perfeitamente. Posso ajudá-lo com isso agora mesmo."
-                    - "Claro! Vou processar essa informação para você."
-                    - "Perfeito. Mais alguma coisa que posso esclarecer?"
-                    """
-                }
-            ]
-            
-            # Adicionar histórico recente (otimizado para SIP)
-            for msg in self.conversation_history[-4:]:  # Últimas 2 trocas
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            # Mensagem atual
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
-            
             # Chamar Groq com configurações otimizadas para SIP
-            response = self.groq_client.chat.completions.create(
+            messages = self.build_sip_messages(user_message)
+            ai_response = await self.llm_gateway.complete(
                 model="llama3-8b-8192",  # Modelo rápido
                 messages=messages,
                 max_tokens=80,  # Resposta curta para SIP
                 temperature=0.5,  # Consistente e natural
-                stream=False
             )
-            
-            ai_response = response.choices[0].message.content.strip()
-            
-            # Atualizar histórico
-            self.update_conversation_history(user_message, is_user=True)
-            self.update_conversation_history(ai_response, is_user=False)
+            self.response_cache.put(
+                user_message, ai_response, self.cache_namespace, self.conversation_history, messages,
+                private_values=self.cache_private_values(),
+            )
             
             # Log específico para SIP
             logger.info(f"[SIP] User: {user_message}")
@@ -183,6 +183,38 @@ class SipVoiceAgent(Agent):
             logger.error(f"Erro ao gerar resposta SIP: {e}")
             return "Desculpe, tive um problema técnico. Pode repetir, por favor?"
 
+    async def generate_sip_response_stream(self, user_message: str) -> AsyncIterator[str]:
+        """Gera resposta SIP em streaming, entregando frase a frase ao TTS"""
+        sentences = []
+        try:
+            messages = self.build_sip_messages(user_message)
+            async for sentence in stream_llm_sentences(
+                self.llm_gateway,
+                model="llama3-8b-8192",
+                messages=messages,
+                max_tokens=80,
+                temperature=0.5
+            ):
+                sentences.append(sentence)
+                yield sentence
+                
+        except Exception as e:
+            logger.error(f"Erro no streaming SIP: {e}")
+            if not sentences:
+                yield "Desculpe, tive um problema técnico. Pode repetir, por favor?"
+                return
+        else:
+            self.response_cache.put(
+                user_message, " ".join(sentences), self.cache_namespace, self.conversation_history, messages,
+                private_values=self.cache_private_values(),
+            )
+        
+        ai_response = " ".join(sentences)
+        
+        # Log específico para SIP
+        logger.info(f"[SIP] User: {user_message}")
+        logger.info(f"[SIP] AI: {ai_response}")
+
     async def on_user_turn_completed(self, chat_ctx: ChatContext, new_message: ChatMessage):
         """Processa fala do usuário em chamada SIP"""
         user_transcript = new_message.text_content
@@ -199,8 +231,27 @@ class SipVoiceAgent(Agent):
             logger.info(f"[SIP] Chamada encerrada por tempo limite: {call_duration:.1f}s")
             raise StopResponse()
         
-        # Gerar resposta otimizada para SIP
-        ai_response = await self.generate_sip_response(user_transcript)
+        # Gerar e falar a resposta (em streaming, já falada frase a frase);
+        # se o usuário voltar a falar, geração e reprodução são canceladas
+        local_response = await self.router.try_local(user_transcript)
+        if local_response is None:
+            # Pergunta repetida: resposta do cache, sem ida ao Groq
+            local_response = self.response_cache.get(user_transcript, self.cache_namespace, self.conversation_history)
+        if local_response is not None:
+            sentences = single_sentence(local_response)
+        elif self.streaming_enabled:
+            sentences = self.generate_sip_response_stream(user_transcript)
+        else:
+            sentences = single_sentence(self.generate_sip_response(user_transcript))
+        spoken = await self.barge_in.speak(chat_ctx, sentences)
+        ai_response = spoken.text
+        if spoken.interrupted:
+            logger.info(f"[SIP] Resposta interrompida pelo usuário após {spoken.sentences} frase(s)")
+        
+        # Histórico só com o que o usuário realmente ouviu
+        self.update_conversation_history(user_transcript, is_user=True)
+        if ai_response:
+            self.update_conversation_history(ai_response, is_user=False)
         
         # Log estruturado para SIP
         sip_log = {
@@ -209,16 +260,14 @@ class SipVoiceAgent(Agent):
             "caller_id": participant_id,
             "user_message": user_transcript,
             "ai_response": ai_response,
+            "interrupted": spoken.interrupted,
             "call_duration": call_duration,
-            "conversation_turns": len(self.conversation_history) // 2,
+            "conversation_turns": self.conversation_history.message_count // 2,
             "sip_trunk": self.sip_metadata.get('trunk', 'default')
         }
         
         logger.info(f"[SIP-LOG] {json.dumps(sip_log, ensure_ascii=False)}")
         
-        # Enviar resposta
-        await chat_ctx.respond(ai_response)
-        
         raise StopResponse()
 
     async def on_sip_call_started(self, ctx: ChatContext):
@@ -241,8 +290,11 @@ class SipVoiceAgent(Agent):
             "event": "sip_call_ended",
             "call_metadata": self.sip_metadata,
             "total_duration": call_duration,
-            "total_turns": len(self.conversation_history) // 2,
-            "conversation_history": self.conversation_history,
+            "total_turns": self.conversation_history.message_count // 2,
+            "conversation_history": self.conversation_history.to_list(),
+            "intent_router": router_snapshot(),
+            "response_cache": cache_snapshot(),
+            "prompts": prompt_snapshot(),
             "sip_quality": "completed"
         }
         
@@ -274,6 +326,7 @@ async def sip_entrypoint(ctx: JobContext):
     
     # Iniciar sessão com configurações SIP
     session = AgentSession()
+    agent.barge_in.attach(session)
     await session.start(
         agent=agent,
         room=ctx.room,
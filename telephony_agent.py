@@ -8,7 +8,7 @@ import json
 import logging
 import asyncio
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from dotenv import load_dotenv
 
 from livekit import agents
@@ -21,7 +21,13 @@ from livekit.agents.llm import (
     StopResponse,
 )
 import assemblyai
-import groq
+from llm_gateway import get_llm_gateway
+from response_streaming import stream_llm_sentences, single_sentence
+from barge_in import BargeInController
+from conversation_history import ConversationHistory
+from intent_router import IntentRouter, router_snapshot
+from response_cache import get_response_cache, cache_snapshot, prompt_namespace
+from prompt_builder import PromptBuilder, prompt_snapshot
 
 load_dotenv()
 logging.basicConfig(
@@ -53,10 +59,34 @@ class TelephonyVoiceAgent(Agent):
             stt=assemblyai.STT(),
         )
         
-        # Inicializar cliente Groq
-        self.groq_client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.conversation_history = []
-        self.max_history = 8  # Histórico menor para telefonia
+        # Gateway assíncrono compartilhado (não bloqueia o event loop)
+        self.llm_gateway = get_llm_gateway()
+        # Histórico limitado por tokens; o que sai da janela vira resumo
+        self.conversation_history = ConversationHistory(token_budget=400, summarizer=self.llm_gateway, name="telephony")
+        self.streaming_enabled = os.getenv("GROQ_STREAMING", "true").lower() == "true"
+        self.barge_in = BargeInController("telephony")
+        # Pedidos simples (hora, data, piada...) respondidos sem chamar o Groq
+        self.router = IntentRouter(name="telephony")
+        # Respostas do LLM reaproveitadas quando a mesma pergunta se repete
+        self.response_cache = get_response_cache()
+        # Instruções fixas compiladas uma vez; o contexto da ligação vai no fim do prompt
+        self.prompt = PromptBuilder(
+            """Você é um assistente de voz para ligações telefônicas.
+            
+            INSTRUÇÕES ESPECÍFICAS:
+            1. Respostas entre 5-25 palavras (ideal para telefonia)
+            2. Use linguagem clara e natural
+            3. Evite jargões técnicos
+            4. Seja direto e útil
+            5. Confirme informações importantes""",
+            context_template="""CONTEXTO DA LIGAÇÃO:
+            - Tipo: {call_type}
+            - Duração: {duration:.0f} segundos
+            - Caller ID: {caller_id}""",
+            name="telephony",
+        )
+        # Compartilhado entre as ligações: a chave é o prompt estático + as últimas mensagens
+        self.cache_namespace = prompt_namespace("telephony", self.prompt.system_message["content"])
         self.call_start_time = datetime.now()
         self.call_metadata = {}
         
@@ -84,67 +114,38 @@ class TelephonyVoiceAgent(Agent):
 
     def update_conversation_history(self, message: str, is_user: bool = True):
         """Atualiza o histórico de conversa"""
-        self.conversation_history.append({
-            "role": "user" if is_user else "assistant",
-            "content": message,
-            "timestamp": datetime.now().isoformat(),
-            "call_duration": (datetime.now() - self.call_start_time).total_seconds()
-        })
-        
-        # Manter histórico menor para telefonia
-        if len(self.conversation_history) > self.max_history * 2:
-            self.conversation_history = self.conversation_history[-self.max_history * 2:]
+        # Duração da ligação sai no export ("elapsed"), sem dict extra por mensagem
+        self.conversation_history.add("user" if is_user else "assistant", message)
+
+    def build_telephony_messages(self, user_message: str) -> List[Dict[str, str]]:
+        """Monta as mensagens com o contexto da ligação"""
+        return self.prompt.build(
+            self.conversation_history,
+            user_message,
+            call_type=self.call_metadata.get('call_type', 'unknown'),
+            duration=(datetime.now() - self.call_start_time).total_seconds(),
+            caller_id=self.call_metadata.get('caller_id', 'unknown'),
+        )
+
+    def cache_private_values(self) -> Tuple[Any, ...]:
+        """Dados desta ligação no prompt: respostas que os citem não vão ao cache compartilhado"""
+        return (self.call_metadata.get('caller_id'),)
 
     async def generate_telephony_response(self, user_message: str) -> str:
         """Gera resposta otimizada para telefonia"""
         try:
-            # Preparar contexto específico para telefonia
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""Você é um assistente de voz para ligações telefônicas.
-                    
-                    CONTEXTO DA LIGAÇÃO:
-                    - Tipo: {self.call_metadata.get('call_type', 'unknown')}
-                    - Duração: {(datetime.now() - self.call_start_time).total_seconds():.0f} segundos
-                    - Caller ID: {self.call_metadata.get('caller_id', 'unknown')}
-                    
-                    INSTRUÇÕES ESPECÍFICAS:
-                    1. Respostas entre 5-25 palavras (ideal para telefonia)
-                    2. Use linguagem clara e natural
-                    3. Evite jargões técnicos
-                    4. Seja direto e útil
-                    5. Confirme informações importantes"""
-                }
-            ]
-            
-            # Adicionar histórico recente
-            for msg in self.conversation_history[-4:]:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            # Adicionar mensagem atual
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
-            
             # Chamar Groq com configurações otimizadas para telefonia
-            response = self.groq_client.chat.completions.create(
+            messages = self.build_telephony_messages(user_message)
+            ai_response = await self.llm_gateway.complete(
                 model="llama3-8b-8192",
                 messages=messages,
                 max_tokens=100,
-                temperature=0.6,
-                stream=False
+                temperature=0.6
+            )
+            self.response_cache.put(
+                user_message, ai_response, self.cache_namespace, self.conversation_history, messages,
+                private_values=self.cache_private_values(),
             )
-            
-            ai_response = response.choices[0].message.content.strip()
-            
-            # Atualizar histórico
-            self.update_conversation_history(user_message, is_user=True)
-            self.update_conversation_history(ai_response, is_user=False)
             
             logger.info(f"[CALL] User: {user_message}")
             logger.info(f"[CALL] AI: {ai_response}")
@@ -155,6 +156,37 @@ class TelephonyVoiceAgent(Agent):
             logger.error(f"Erro ao gerar resposta para telefonia: {e}")
             return "Desculpe, tive um problema técnico. Pode repetir?"
 
+    async def generate_telephony_response_stream(self, user_message: str) -> AsyncIterator[str]:
+        """Gera resposta em streaming, entregando frase a frase ao TTS"""
+        sentences = []
+        try:
+            messages = self.build_telephony_messages(user_message)
+            async for sentence in stream_llm_sentences(
+                self.llm_gateway,
+                model="llama3-8b-8192",
+                messages=messages,
+                max_tokens=100,
+                temperature=0.6
+            ):
+                sentences.append(sentence)
+                yield sentence
+                
+        except Exception as e:
+            logger.error(f"Erro no streaming para telefonia: {e}")
+            if not sentences:
+                yield "Desculpe, tive um problema técnico. Pode repetir?"
+                return
+        else:
+            self.response_cache.put(
+                user_message, " ".join(sentences), self.cache_namespace, self.conversation_history, messages,
+                private_values=self.cache_private_values(),
+            )
+        
+        ai_response = " ".join(sentences)
+        
+        logger.info(f"[CALL] User: {user_message}")
+        logger.info(f"[CALL] AI: {ai_response}")
+
     async def on_user_turn_completed(self, chat_ctx: ChatContext, new_message: ChatMessage):
         """Processa quando o usuário termina de falar na ligação"""
         user_transcript = new_message.text_content
@@ -170,8 +202,27 @@ class TelephonyVoiceAgent(Agent):
             logger.info(f"[TELEPHONY] Ligação encerrada por tempo limite: {call_duration:.1f}s")
             raise StopResponse()
         
-        # Gerar resposta otimizada para telefonia
-        ai_response = await self.generate_telephony_response(user_transcript)
+        # Gerar e falar a resposta (em streaming, já falada frase a frase);
+        # se o usuário voltar a falar, geração e reprodução são canceladas
+        local_response = await self.router.try_local(user_transcript)
+        if local_response is None:
+            # Pergunta repetida: resposta do cache, sem ida ao Groq
+            local_response = self.response_cache.get(user_transcript, self.cache_namespace, self.conversation_history)
+        if local_response is not None:
+            sentences = single_sentence(local_response)
+        elif self.streaming_enabled:
+            sentences = self.generate_telephony_response_stream(user_transcript)
+        else:
+            sentences = single_sentence(self.generate_telephony_response(user_transcript))
+        spoken = await self.barge_in.speak(chat_ctx, sentences)
+        ai_response = spoken.text
+        if spoken.interrupted:
+            logger.info(f"[TELEPHONY] Resposta interrompida pelo usuário após {spoken.sentences} frase(s)")
+        
+        # Histórico só com o que o usuário realmente ouviu
+        self.update_conversation_history(user_transcript, is_user=True)
+        if ai_response:
+            self.update_conversation_history(ai_response, is_user=False)
         
         # Log estruturado para telefonia
         call_log = {
@@ -180,15 +231,13 @@ class TelephonyVoiceAgent(Agent):
             "caller_id": participant_id,
             "user_message": user_transcript,
             "ai_response": ai_response,
+            "interrupted": spoken.interrupted,
             "call_duration": call_duration,
-            "conversation_turns": len(self.conversation_history) // 2
+            "conversation_turns": self.conversation_history.message_count // 2
         }
         
         logger.info(f"[TELEPHONY_LOG] {json.dumps(call_log, ensure_ascii=False)}")
         
-        # Enviar resposta
-        await chat_ctx.respond(ai_response)
-        
         raise StopResponse()
 
     async def on_call_started(self, ctx: ChatContext):
@@ -211,8 +260,11 @@ class TelephonyVoiceAgent(Agent):
             "event": "call_ended",
             "call_metadata": self.call_metadata,
             "total_duration": call_duration,
-            "total_turns": len(self.conversation_history) // 2,
-            "conversation_history": self.conversation_history
+            "total_turns": self.conversation_history.message_count // 2,
+            "conversation_history": self.conversation_history.to_list(),
+            "intent_router": router_snapshot(),
+            "response_cache": cache_snapshot(),
+            "prompts": prompt_snapshot()
         }
         
         logger.info(f"[TELEPHONY_END] {json.dumps(final_log, ensure_ascii=False)}")
@@ -239,6 +291,7 @@ async def telephony_entrypoint(ctx: JobContext):
     
     # Iniciar sessão
     session = AgentSession()
+    agent.barge_in.attach(session)
     await session.start(
         agent=agent,
         room=ctx.room,
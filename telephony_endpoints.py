@@ -2,10 +2,27 @@
 # Adicione este código ao final do api_server.py antes de "if __name__ == "__main__":"
 
 import asyncio
+from agent_dispatch import is_dispatch_enabled, dispatch_agent, cancel_room_dispatch
+from persistence import get_persistence_store
+from call_history import CALL_HISTORY_MAX_RECORDS
 
-# Estado global para ligações
+# Estado global para ligações (espelhado no SQLite e restaurado na subida)
 active_calls: Dict[str, Dict[str, Any]] = {}
+# Últimas CALL_HISTORY_MAX_RECORDS ligações encerradas
 call_logs: List[Dict[str, Any]] = []
+telephony_persistence = get_persistence_store()
+
+def persist_call(call_id: str):
+    """Enfileira o estado atual da ligação ativa para gravação (não bloqueia)"""
+    if call_id in active_calls:
+        telephony_persistence.upsert_call("telephony", active_calls[call_id], active=True)
+
+@app.on_event("startup")
+async def restore_telephony_calls():
+    """Recarrega ligações ativas e encerradas gravadas antes do último reinício"""
+    for call_data in await telephony_persistence.load_calls("telephony", active=True):
+        active_calls[call_data["call_id"]] = call_data
+    call_logs.extend(await telephony_persistence.load_calls("telephony", active=False, limit=CALL_HISTORY_MAX_RECORDS))
 
 @app.post("/telephony/inbound")
 async def handle_inbound_call(call_config: TelephonyCallConfig, background_tasks: BackgroundTasks):
@@ -28,6 +45,7 @@ async def handle_inbound_call(call_config: TelephonyCallConfig, background_tasks
         }
         
         active_calls[call_id] = call_data
+        persist_call(call_id)
         
         # Criar sala específica para a ligação
         room_name = f"call_{call_id}"
@@ -75,6 +93,7 @@ async def make_outbound_call(call_request: OutboundCallRequest, background_tasks
         }
         
         active_calls[call_id] = call_data
+        persist_call(call_id)
         
         # Criar sala para ligação sainte
         room_name = f"outbound_call_{call_id}"
@@ -130,6 +149,9 @@ async def hangup_call(call_id: str):
         call_data["status"] = "ended"
         call_data["end_time"] = datetime.now().isoformat()
         
+        if call_data.get("room_name"):
+            await cancel_room_dispatch(call_data["room_name"])
+        
         # Calcular duração
         start_time = datetime.fromisoformat(call_data["start_time"])
         duration = (datetime.now() - start_time).total_seconds()
@@ -137,7 +159,9 @@ async def hangup_call(call_id: str):
         
         # Mover para logs
         call_logs.append(call_data)
+        del call_logs[:-CALL_HISTORY_MAX_RECORDS]
         del active_calls[call_id]
+        telephony_persistence.upsert_call("telephony", call_data, active=False)
         
         logger.info(f"Ligação encerrada: {call_id} (duração: {duration:.1f}s)")
         
@@ -189,6 +213,15 @@ async def start_telephony_agent(call_id: str, agent_config: AgentConfig):
     try:
         active_calls[call_id]["status"] = "connected"
         
+        # Modo de despacho: a sala vai para um dispatch_worker.py em execução
+        if is_dispatch_enabled():
+            await dispatch_agent(agent_config.room_name, "telephony", {"call_id": call_id})
+            active_calls[call_id]["agent_id"] = f"telephony_{call_id}"
+            active_calls[call_id]["room_name"] = agent_config.room_name
+            persist_call(call_id)
+            logger.info(f"Agente de telephony despachado para ligação {call_id}")
+            return
+
         # Usar telephony_agent.py em vez do agente padrão
         script_to_run = "telephony_agent.py"
         
@@ -211,12 +244,14 @@ async def start_telephony_agent(call_id: str, agent_config: AgentConfig):
         
         active_calls[call_id]["process"] = process
         active_calls[call_id]["agent_id"] = f"telephony_{call_id}"
+        persist_call(call_id)
         
         logger.info(f"Agente de telephony iniciado para ligação {call_id}")
         
     except Exception as e:
         logger.error(f"Erro ao iniciar agente de telephony para {call_id}: {e}")
         active_calls[call_id]["status"] = "failed"
+        persist_call(call_id)
 
 async def initiate_outbound_call(call_id: str, call_request: OutboundCallRequest, agent_config: AgentConfig):
     """Inicia processo de ligação sainte"""
@@ -224,6 +259,7 @@ async def initiate_outbound_call(call_id: str, call_request: OutboundCallRequest
         # Aqui você integraria com Twilio ou outro provider
         # Por enquanto, simular o processo
         active_calls[call_id]["status"] = "ringing"
+        persist_call(call_id)
         
         # Simular delay de conexão
         await asyncio.sleep(2)
@@ -236,3 +272,4 @@ async def initiate_outbound_call(call_id: str, call_request: OutboundCallRequest
     except Exception as e:
         logger.error(f"Erro na ligação sainte {call_id}: {e}")
         active_calls[call_id]["status"] = "failed"
+        persist_call(call_id)
@@ -0,0 +1,73 @@
+"""
+Stub UDP de servidor SIP (registrar/proxy) para os testes da camada de transações
+Os módulos do AGI (asterisk/agi-bin) também ficam importáveis pelos testes
+"""
+import os
+import sys
+import asyncio
+import time
+from typing import Callable, List, Optional, Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "asterisk", "agi-bin"))
+
+import sip_transactions
+from sip_transactions import SipMessage, SipTransactionLayer, build_response, parse_sip_message
+
+# Recebe (requisição, número da recepção) e devolve as respostas a enviar (ou nenhuma)
+Responder = Callable[[SipMessage, int], List[SipMessage]]
+
+class SipStub(asyncio.DatagramProtocol):
+    """Servidor SIP local: registra cada datagrama recebido e responde via responder"""
+
+    def __init__(self, responder: Optional[Responder] = None):
+        self.responder = responder or (lambda request, count: [])
+        self.received: List[Tuple[float, SipMessage]] = []
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.transport = transport
+
+    @property
+    def addr(self) -> Tuple[str, int]:
+        return self.transport.get_extra_info("sockname")[:2]
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        request = parse_sip_message(data)
+        self.received.append((time.monotonic(), request))
+        for response in self.responder(request, len(self.received)):
+            self.send(response, addr)
+
+    def send(self, message: SipMessage, addr: Tuple[str, int]):
+        self.transport.sendto(message.encode(), addr)
+
+    def requests(self, method: str) -> List[SipMessage]:
+        return [message for _, message in self.received if message.method == method]
+
+def respond(request: SipMessage, status_code: int, reason: str, *headers: Tuple[str, str]) -> SipMessage:
+    response = build_response(request, status_code, reason)
+    response.headers.extend(headers)
+    return response
+
+@pytest.fixture
+def fast_timers(monkeypatch):
+    """Timers da RFC 3261 em escala de milissegundos"""
+    monkeypatch.setattr(sip_transactions, "T1", 0.02)
+    monkeypatch.setattr(sip_transactions, "T2", 0.08)
+    monkeypatch.setattr(sip_transactions, "TIMER_B", 0.5)
+    monkeypatch.setattr(sip_transactions, "TIMER_F", 0.5)
+    monkeypatch.setattr(sip_transactions, "TIMER_D", 0.05)
+    monkeypatch.setattr(sip_transactions, "TIMER_K", 0.05)
+    monkeypatch.setattr(sip_transactions, "INVITE_TIMEOUT", 0.15)
+
+async def start_pair(responder: Optional[Responder] = None) -> Tuple[SipStub, SipTransactionLayer]:
+    """Stub escutando em 127.0.0.1 e uma camada de transações apontada para ele"""
+    loop = asyncio.get_running_loop()
+    stub = SipStub(responder)
+    await loop.create_datagram_endpoint(lambda: stub, local_addr=("127.0.0.1", 0))
+    layer = SipTransactionLayer()
+    await layer.start(local_addr=("127.0.0.1", 0))
+    return stub, layer
@@ -0,0 +1,65 @@
+"""
+Servidor local com o protocolo de tempo real da AssemblyAI (SessionBegins,
+audio_data, FinalTranscript, terminate_session, SessionTerminated)
+
+Cada quadro de "áudio" carrega uma palavra em ASCII; um quadro só de zeros é
+silêncio e, depois de alguma fala, fecha a frase com um FinalTranscript.
+Aponte ASSEMBLYAI_REALTIME_URL (ou o parâmetro url) para FakeRealtimeSTT.url
+"""
+import json
+import base64
+from typing import List, Optional
+
+import websockets
+
+def word_frame(word: str, size: int) -> bytes:
+    return word.encode().ljust(size, b" ")
+
+def silence_frame(size: int) -> bytes:
+    return bytes(size)
+
+class FakeRealtimeSTT:
+    def __init__(self):
+        self.server = None
+        self.configs: List[dict] = []
+        self.frames_received = 0
+        self.terminated = False
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"ws://{host}:{port}"
+
+    async def start(self) -> "FakeRealtimeSTT":
+        self.server = await websockets.serve(self.handle, "127.0.0.1", 0)
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, ws, path: Optional[str] = None):
+        await ws.send(json.dumps({"message_type": "SessionBegins", "session_id": "fake"}))
+        words: List[str] = []
+
+        async def final():
+            if words:
+                await ws.send(json.dumps({"message_type": "FinalTranscript", "text": " ".join(words)}))
+                words.clear()
+
+        async for raw in ws:
+            message = json.loads(raw)
+            if "audio_data" in message:
+                self.frames_received += 1
+                frame = base64.b64decode(message["audio_data"])
+                if frame.strip(b"\x00"):
+                    words.append(frame.strip(b" \x00").decode())
+                else:
+                    await final()
+            elif message.get("terminate_session"):
+                self.terminated = True
+                await final()
+                await ws.send(json.dumps({"message_type": "SessionTerminated"}))
+                return
+            else:
+                self.configs.append(message)
@@ -0,0 +1,47 @@
+import pytest
+
+from arithmetic import (
+    CalculationError, calculate, evaluate, format_number, has_binary_operation, spoken_to_expression
+)
+
+@pytest.mark.parametrize("text, expression", [
+    ("quanto é doze vezes sete", "12*7"),
+    ("vinte e três mais dezenove", "23+19"),
+    ("dois mil e quinhentos dividido por cinco", "2500/5"),
+    ("três vírgula cinco mais um", "3.5+1"),
+    ("dez por cento de duzentos", "10/100*200"),
+    ("cinco ao quadrado", "5**2"),
+    ("12 × 3", "12*3"),
+])
+def test_spoken_phrase_becomes_expression(text, expression):
+    assert spoken_to_expression(text) == (expression, 0)
+
+def test_unknown_words_are_counted():
+    assert spoken_to_expression("quanto é dois mais dois na lua")[1] == 2
+    assert calculate("quanto é dois mais dois na lua") is None
+
+@pytest.mark.parametrize("expression, value", [("12*7", 84), ("7/2", 3.5), ("-3+1", -2), ("2**10", 1024)])
+def test_evaluate(expression, value):
+    assert evaluate(expression) == value
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os')", "(1).real", "[1,2]", "9**9**9", "1/0", "10**40", "x+1", "1+" * 150 + "1",
+])
+def test_rejected_expressions(expression):
+    with pytest.raises(CalculationError):
+        evaluate(expression)
+
+@pytest.mark.parametrize("expression, binary", [
+    ("+1", False), ("-5", False), ("5", False), ("-5+2", True), ("2*(3+4)", True), ("+", False),
+])
+def test_has_binary_operation(expression, binary):
+    assert has_binary_operation(expression) is binary
+
+@pytest.mark.parametrize("value, spoken", [(84, "84"), (20.0, "20"), (3.14159, "3,1416"), (-0.5, "-0,5")])
+def test_format_number(value, spoken):
+    assert format_number(value) == spoken
+
+def test_calculate():
+    assert calculate("quanto é doze vezes sete") == ("12*7", 84)
+    assert calculate("mais um") is None
+    assert calculate("dez dividido por zero") is None
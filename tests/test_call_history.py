@@ -0,0 +1,71 @@
+import pytest
+
+from call_history import CallHistoryStore, SequenceList
+
+def store_with(count: int, **kwargs) -> CallHistoryStore:
+    store = CallHistoryStore(**kwargs)
+    for number in range(count):
+        store.append({
+            "call_id": f"call_{number}",
+            "trunk": "a" if number % 2 else "b",
+            "status": "failed" if number % 3 == 0 else "completed",
+            "caller_id": "5511988887777",
+        })
+    return store
+
+def call_ids(records):
+    return [int(record["call_id"].split("_")[1]) for record in records]
+
+def test_sequence_list_compacts():
+    sequences = SequenceList()
+    for seq in range(200):
+        sequences.append(seq)
+    for _ in range(150):
+        sequences.popleft()
+    assert len(sequences) == 50
+    assert sequences.first() == 150
+    assert 149 not in sequences and 150 in sequences
+    assert list(sequences.newest_before(153)) == [152, 151, 150]
+
+def test_pages_newest_first_with_cursor():
+    store = store_with(7)
+    records, cursor = store.page(limit=3)
+    assert call_ids(records) == [6, 5, 4]
+    records, cursor = store.page(limit=3, cursor=cursor)
+    assert call_ids(records) == [3, 2, 1]
+    records, cursor = store.page(limit=3, cursor=cursor)
+    assert (call_ids(records), cursor) == ([0], None)
+
+def test_filters_combine_indexes():
+    store = store_with(12)
+    records, _ = store.page(trunk="a", status="failed")
+    assert call_ids(records) == [9, 3]
+    records, cursor = store.page(limit=2, trunk="b")
+    assert call_ids(records) == [10, 8]
+    assert call_ids(store.page(limit=2, trunk="b", cursor=cursor)[0]) == [6, 4]
+    assert store.page(trunk="desconhecido") == ([], None)
+    # None é ignorado (parâmetro de query não informado)
+    assert len(store.page(limit=500, status=None)[0]) == 12
+
+def test_oldest_records_are_evicted():
+    evicted = []
+    store = store_with(10, max_records=4, on_evict=evicted.append)
+    assert len(store) == 4
+    assert call_ids(evicted) == [0, 1, 2, 3, 4, 5]
+    assert call_ids(store.page()[0]) == [9, 8, 7, 6]
+    assert call_ids(store.page(trunk="a")[0]) == [9, 7]
+    assert store.status()["total_appended"] == 10
+
+def test_failing_on_evict_does_not_break_append():
+    def broken(record):
+        raise RuntimeError("fila cheia")
+
+    store = store_with(3, max_records=1, on_evict=broken)
+    assert call_ids(store.page()[0]) == [2]
+
+def test_invalid_filter_and_cursor():
+    store = store_with(3)
+    with pytest.raises(ValueError):
+        store.page(destination="123")
+    with pytest.raises(ValueError):
+        store.page(cursor="abc")
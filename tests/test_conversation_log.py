@@ -0,0 +1,55 @@
+import pytest
+
+from conversation_log import ConversationLog
+
+def conversation(number: int, message: str, participant_id: str = "ana", response: str = "Certo.") -> dict:
+    return {"id": f"conv_{number}", "participant_id": participant_id, "message": message, "agent_response": response}
+
+def ids(records):
+    return [record["id"] for record in records]
+
+@pytest.fixture
+def log():
+    log = ConversationLog(max_entries=100)
+    log.extend([
+        conversation(1, "Quero uma pizza de calabresa"),
+        conversation(2, "Qual o horário de funcionamento?", participant_id="bruno"),
+        conversation(3, "Mais uma PIZZA, por favor", response="Pizza anotada."),
+        conversation(4, "Cancelar a pizza", participant_id="bruno"),
+    ])
+    return log
+
+def test_search_requires_every_word(log):
+    assert ids(log.search("pizza")[0]) == ["conv_4", "conv_3", "conv_1"]
+    assert ids(log.search("pizza calabresa")[0]) == ["conv_1"]
+    assert log.search("pizza sushi") == ([], None)
+
+def test_search_ignores_accents_and_includes_response(log):
+    assert ids(log.search("HORARIO")[0]) == ["conv_2"]
+    assert ids(log.search("anotada")[0]) == ["conv_3"]
+
+def test_search_by_participant_with_cursor(log):
+    records, cursor = log.search(participant_id="ana", limit=1)
+    assert ids(records) == ["conv_3"]
+    assert log.search(participant_id="ana", limit=1, cursor=cursor) == (
+        [log.latest(4)[0]], None
+    )
+    assert ids(log.search("pizza", participant_id="bruno")[0]) == ["conv_4"]
+
+def test_empty_search_is_rejected(log):
+    with pytest.raises(ValueError):
+        log.search("  ")
+    with pytest.raises(ValueError):
+        log.search("pizza", cursor="x")
+
+def test_oldest_conversations_leave_the_index():
+    log = ConversationLog(max_entries=2)
+    for number in range(5):
+        log.append(conversation(number, f"pedido {number}", participant_id=f"p{number}"))
+    assert ids(log.latest()) == ["conv_3", "conv_4"]
+    assert log.search("pedido 1") == ([], None)
+    assert ids(log.search("pedido")[0]) == ["conv_4", "conv_3"]
+    status = log.status()
+    assert (status["stored"], status["total_appended"], status["participants"]) == (2, 5, 2)
+    # "pedido", "3", "4" e "certo"
+    assert status["indexed_terms"] == 4
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from intent_router import IntentRouter
+
+@pytest.fixture
+def router():
+    return IntentRouter(name="test")
+
+@pytest.mark.parametrize("text", ["mais um", "menos de cinco", "mais 5 minutos", "quero mais dois"])
+def test_unary_sign_is_not_a_calculation(router, text):
+    decision = router.classify(text)
+    assert not (decision.intent == "calculator" and decision.confidence == 1.0)
+    assert not decision.local
+    assert asyncio.run(router.try_local(text)) is None
+
+@pytest.mark.parametrize("text, answer", [
+    ("quanto é doze vezes sete", "O resultado é 84."),
+    ("menos cinco mais dois", "O resultado é -3."),
+    ("dez por cento de duzentos", "O resultado é 20."),
+])
+def test_spoken_calculation_answered_locally(router, text, answer):
+    decision = router.classify(text)
+    assert (decision.intent, decision.confidence, decision.local) == ("calculator", 1.0, True)
+    assert asyncio.run(router.try_local(text)) == answer
+
+@pytest.mark.parametrize("text", ["que horas vocês abrem", "vocês fecham que horas hoje"])
+def test_business_hours_go_to_llm(router, text):
+    assert not router.classify(text).local
@@ -0,0 +1,50 @@
+import json
+import os
+
+from keyword_engine import KeywordAutomaton, KeywordEngine, normalize
+
+def test_normalize():
+    assert normalize("  Olá,   Você está BEM? ") == "ola voce esta bem"
+
+def test_automaton_matches_whole_words_only():
+    automaton = KeywordAutomaton({"intent": {"greeting": ["oi"], "time": ["que horas", "horas"]}})
+    hits = automaton.search(normalize("Oi! Que horas são? Oitenta"))
+    assert ("intent", "greeting", "oi") in hits
+    # "que horas" e o sufixo "horas" no mesmo ponto
+    assert ("intent", "time", "que horas") in hits
+    assert ("intent", "time", "horas") in hits
+    assert len(hits) == 3
+
+def test_labels_follow_priority_order():
+    engine = KeywordEngine(config_path="")
+    matches = engine.match("Tchau, olá, que horas são?")
+    assert list(matches.labels("intent")) == ["greeting", "farewell", "time"]
+    assert matches.first("intent") == "greeting"
+    assert matches.count("intent", "time") == 2
+    assert matches.first("moderation") is None
+
+def test_accents_are_ignored():
+    engine = KeywordEngine(config_path="")
+    assert engine.match("quero uma PROMOCAO").first("moderation") == "spam"
+    assert engine.match("nao gosto disso").labels("sentiment") == {"positive": ["gosto"], "negative": ["não gosto"]}
+
+def test_repeated_text_reuses_matches():
+    engine = KeywordEngine(config_path="")
+    assert engine.match("bom dia") is engine.match("bom dia")
+    assert engine.match("bom dia") is not engine.match("boa noite")
+
+def test_config_overrides_and_reloads(tmp_path):
+    config = tmp_path / "keywords.json"
+    config.write_text(json.dumps({"intent": {"greeting": ["e aí"]}, "product": {"pizza": ["calabresa"]}}))
+    engine = KeywordEngine(config_path=str(config), reload_interval=0)
+    # O JSON substitui a lista do rótulo e acrescenta conjuntos
+    assert engine.match("oi").first("intent") is None
+    assert engine.match("e aí, tudo bem").first("intent") == "greeting"
+    assert engine.match("uma calabresa").first("product") == "pizza"
+
+    config.write_text(json.dumps({"product": {"pizza": ["mussarela"]}}))
+    os.utime(config, (engine._config_mtime + 10, engine._config_mtime + 10))
+    assert engine.maybe_reload()
+    assert engine.match("uma calabresa").first("product") is None
+    assert engine.match("uma mussarela").first("product") == "pizza"
+    assert not engine.maybe_reload()
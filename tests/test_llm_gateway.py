@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+import llm_gateway
+from llm_gateway import close_llm_gateway, gateway_metrics, get_llm_gateway
+
+def run_in_thread(coro_factory):
+    """Executa a corrotina em outra thread com o seu próprio event loop (como um job THREAD)"""
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", asyncio.run(coro_factory())))
+    thread.start()
+    thread.join()
+    return result["value"]
+
+def test_one_gateway_per_event_loop():
+    async def job():
+        first, second = get_llm_gateway(), get_llm_gateway()
+        assert first is second
+        await close_llm_gateway()
+        return first
+
+    a, b = run_in_thread(job), run_in_thread(job)
+    assert a is not b
+    # Fora de um loop: gateway único do processo
+    assert get_llm_gateway() is get_llm_gateway()
+
+def test_closed_gateway_metrics_are_kept():
+    before = gateway_metrics().get("requests", 0)
+
+    async def job():
+        get_llm_gateway().metrics["requests"] += 3
+        await close_llm_gateway()
+
+    run_in_thread(job)
+    assert gateway_metrics()["requests"] == before + 3
+    # O gateway do job fechado sai do registro
+    assert not llm_gateway._gateways
@@ -0,0 +1,107 @@
+import asyncio
+
+from persistence import PersistenceStore
+
+def ended_call(number: int) -> dict:
+    return {
+        "call_id": f"call_{number:03d}",
+        "status": "completed",
+        "caller_id": "5511988887777",
+        "start_time": f"2024-01-01T10:{number:02d}:00",
+        "end_time": f"2024-01-01T10:{number:02d}:30",
+    }
+
+def new_store(tmp_path, **kwargs) -> PersistenceStore:
+    return PersistenceStore(path=str(tmp_path / "test.db"), enabled=True, flush_interval=0.001, **kwargs)
+
+def test_calls_survive_restart(tmp_path):
+    async def scenario():
+        store = new_store(tmp_path)
+        await store.start()
+        active = {"call_id": "active_1", "status": "active", "start_time": "2024-01-01T11:00:00", "process": object()}
+        store.upsert_call("sip", active, active=True)
+        store.upsert_call("sip", ended_call(1), active=False)
+        await store.aclose()
+
+        store = new_store(tmp_path)
+        [restored] = await store.load_calls("sip", active=True)
+        # Campos transitórios (Popen) não vão para o banco
+        assert "process" not in restored
+        assert [call["call_id"] for call in await store.load_calls("sip", active=False)] == ["call_001"]
+        assert await store.load_calls("real_sip", active=False) == []
+        await store.aclose()
+
+    asyncio.run(scenario())
+
+def test_load_ended_calls_returns_most_recent(tmp_path):
+    async def scenario():
+        store = new_store(tmp_path)
+        await store.start()
+        for number in range(10):
+            store.upsert_call("sip", ended_call(number), active=False)
+        await store.aclose()
+
+        store = new_store(tmp_path)
+        calls = await store.load_calls("sip", active=False, limit=3)
+        # As mais recentes, em ordem de encerramento
+        assert [call["call_id"] for call in calls] == ["call_007", "call_008", "call_009"]
+        await store.aclose()
+
+    asyncio.run(scenario())
+
+def test_writer_prunes_ended_calls_beyond_retention(tmp_path):
+    async def scenario():
+        store = new_store(tmp_path, call_retention=5)
+        await store.start()
+        store.upsert_call("sip", {"call_id": "active_1", "status": "active", "start_time": "2024-01-01"}, active=True)
+        for number in range(12):
+            store.upsert_call("sip", ended_call(number), active=False)
+            store.upsert_call("telephony", ended_call(number), active=False)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+
+        count = lambda sql: store._conn.execute(sql).fetchone()[0]
+        assert count("SELECT COUNT(*) FROM calls WHERE source = 'sip' AND active = 0") == 5
+        assert count("SELECT COUNT(*) FROM calls WHERE source = 'telephony' AND active = 0") == 5
+        # Ativas nunca são apagadas
+        assert count("SELECT COUNT(*) FROM calls WHERE active = 1") == 1
+        assert store.stats["pruned"] == 14
+        calls = await store.load_calls("sip", active=False)
+        assert [call["call_id"] for call in calls] == [f"call_{number:03d}" for number in range(7, 12)]
+        await store.aclose()
+
+    asyncio.run(scenario())
+
+def test_startup_prunes_existing_database(tmp_path):
+    async def scenario():
+        store = new_store(tmp_path)
+        await store.start()
+        for number in range(8):
+            store.upsert_call("real_sip", ended_call(number), active=False)
+        await store.aclose()
+
+        store = new_store(tmp_path, call_retention=2)
+        calls = await store.load_calls("real_sip", active=False, limit=100)
+        assert [call["call_id"] for call in calls] == ["call_006", "call_007"]
+        await store.aclose()
+
+    asyncio.run(scenario())
+
+def test_repeated_updates_are_coalesced(tmp_path):
+    async def scenario():
+        store = new_store(tmp_path)
+        await store.start()
+        call = {"call_id": "active_1", "status": "connecting", "start_time": "2024-01-01"}
+        for status in ("connecting", "ringing", "active"):
+            call["status"] = status
+            store.upsert_call("sip", dict(call), active=True)
+        await store.aclose()
+        assert store.stats["coalesced"] == 2
+        assert store.stats["written"] == 1
+
+        store = new_store(tmp_path)
+        [restored] = await store.load_calls("sip", active=True)
+        assert restored["status"] == "active"
+        await store.aclose()
+
+    asyncio.run(scenario())
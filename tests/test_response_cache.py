@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from conversation_history import ConversationHistory
+from response_cache import ResponseCache, context_fingerprint, prompt_namespace
+
+GREETING = "Olá! Como posso ajudar?"
+NAMESPACE = prompt_namespace("sip", "Você é um assistente de voz.")
+
+@pytest.fixture
+def cache():
+    return ResponseCache(max_entries=16, ttl=60, similarity=0.85, enabled=True)
+
+def new_call() -> ConversationHistory:
+    history = ConversationHistory(token_budget=1000, name="test")
+    history.add("assistant", GREETING)
+    return history
+
+def test_repeated_question_hits_across_calls(cache):
+    first, second = new_call(), new_call()
+    cache.put("qual o endereço da loja", "Rua A, número 10.", NAMESPACE, first)
+    # Outra ligação, mesmo prompt estático e mesma última mensagem
+    assert cache.get("qual o endereço da loja", NAMESPACE, second) == "Rua A, número 10."
+    assert cache.get("qual é o endereço da loja", NAMESPACE, second) == "Rua A, número 10."
+
+def test_key_uses_only_recent_messages(cache):
+    history = new_call()
+    for turn in range(5):
+        history.add("user", f"pergunta {turn}")
+        history.add("assistant", f"resposta {turn}")
+    history.add("user", "quero pizza")
+    history.add("assistant", "Qual sabor?")
+    cache.put("calabresa", "Anotado: calabresa.", NAMESPACE, history)
+
+    other = new_call()
+    other.add("user", "quero pizza")
+    other.add("assistant", "Qual sabor?")
+    assert context_fingerprint(history) == context_fingerprint(other)
+    assert cache.get("calabresa", NAMESPACE, other) == "Anotado: calabresa."
+
+    # Contexto recente diferente não reaproveita a resposta
+    assert cache.get("calabresa", NAMESPACE, new_call()) is None
+
+def test_response_with_call_data_is_not_stored(cache):
+    history = new_call()
+    cache.put("qual meu número", "Seu número é 5511988887777.", NAMESPACE, history,
+              private_values=("5511988887777", "sip_20240101"))
+    assert cache.get("qual meu número", NAMESPACE, history) is None
+
+def test_time_sensitive_answer_is_not_stored(cache):
+    history = new_call()
+    cache.put("que horas são", "São 14:30.", NAMESPACE, history)
+    assert cache.get("que horas são", NAMESPACE, history) is None
+
+def test_near_match_requires_same_numbers(cache):
+    history = new_call()
+    cache.put("status do pedido 123", "O pedido 123 saiu para entrega.", NAMESPACE, history)
+    assert cache.get("status do pedido 124", NAMESPACE, history) is None
+    assert cache.get("status do pedido 123", NAMESPACE, history) is not None
+
+def test_namespaces_are_isolated_by_prompt(cache):
+    history = new_call()
+    cache.put("qual o endereço da loja", "Rua A, número 10.", NAMESPACE, history)
+    other = prompt_namespace("sip", "Outro prompt.")
+    assert other != NAMESPACE
+    assert cache.get("qual o endereço da loja", other, history) is None
+
+def test_concurrent_threads_share_the_cache(cache):
+    """Jobs do worker de despacho (threads) usam o mesmo cache sem corromper as listas"""
+    errors = []
+
+    def job(worker: int):
+        history = new_call()
+        try:
+            for turn in range(200):
+                question = f"pergunta numero {turn % 20} do cliente"
+                if cache.get(question, NAMESPACE, history) is None:
+                    cache.put(question, f"resposta {turn % 20}", NAMESPACE, history)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=job, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(cache) <= cache.max_entries
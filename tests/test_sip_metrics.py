@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from sip_metrics import SipMetricsAggregator, expire_stale_call
+
+def call(start: datetime, **fields) -> dict:
+    return {"call_id": f"sip_{start:%H%M%S}", "status": "active", "trunk": "default",
+            "start_time": start.isoformat(), **fields}
+
+@pytest.fixture
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_counters_follow_transitions():
+    metrics = SipMetricsAggregator()
+    now = datetime.now()
+    first, second = call(now - timedelta(seconds=60), trunk="a"), call(now - timedelta(seconds=30), trunk="b")
+    metrics.call_started(first)
+    metrics.call_started(second)
+    first.update(status="completed", total_duration=60)
+    metrics.call_ended(first)
+
+    snapshot = metrics.snapshot()
+    assert (snapshot["total_calls"], snapshot["active_calls"], snapshot["completed_calls"]) == (2, 1, 1)
+    assert snapshot["calls_by_trunk"] == {"a": 1, "b": 1}
+    # 60s encerrados + ~30s da ativa
+    assert 89 <= snapshot["total_duration"] <= 92
+
+def test_call_past_max_duration_expires_at_deadline():
+    now = datetime.now()
+    stale = call(now - timedelta(hours=5), config={"max_duration": 600})
+    assert expire_stale_call(stale, now)
+    assert stale["status"] == "failed"
+    assert stale["end_reason"] == "stale_after_restart"
+    assert stale["total_duration"] == 600
+
+def test_call_with_dead_agent_expires_now(dead_pid):
+    now = datetime.now()
+    stale = call(now - timedelta(seconds=90), agent_pid=dead_pid)
+    assert expire_stale_call(stale, now)
+    assert stale["total_duration"] == 90
+    assert stale["end_time"] == now.isoformat()
+
+def test_live_call_is_kept():
+    now = datetime.now()
+    live = call(now - timedelta(seconds=90), agent_pid=os.getpid())
+    assert not expire_stale_call(live, now)
+    assert live["status"] == "active"
+    # Despacho (sem agent_pid) dentro do max_duration também segue ativa
+    assert not expire_stale_call(call(now - timedelta(seconds=90)), now)
+
+def test_expired_restore_stops_growing_duration():
+    """Ativa restaurada e encerrada não entra mais na duração das ativas"""
+    metrics = SipMetricsAggregator()
+    restored = call(datetime.now() - timedelta(days=3))
+    metrics.call_started(restored)
+    assert expire_stale_call(restored)
+    metrics.call_ended(restored)
+
+    snapshot = metrics.snapshot()
+    assert (snapshot["active_calls"], snapshot["failed_calls"]) == (0, 1)
+    assert snapshot["total_duration"] == 1800
+    assert snapshot["average_duration"] == 1800
+    assert metrics.active_start_sum == 0
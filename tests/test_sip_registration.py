@@ -0,0 +1,63 @@
+import asyncio
+import hashlib
+
+from sip_registration import AUTH_PARAM, DigestAuth, SipRegistrationManager
+from conftest import respond, start_pair
+
+USERNAME, PASSWORD, REALM, NONCE = "1000", "secret", "stub.local", "nonce-1"
+
+def md5(value: str) -> str:
+    return hashlib.md5(value.encode()).hexdigest()
+
+def valid_digest(request) -> bool:
+    """Confere o Authorization como um registrar faria (qop=auth)"""
+    header = request.get("Authorization")
+    if not header:
+        return False
+    params = {key: quoted or plain for key, quoted, plain in AUTH_PARAM.findall(header[len("Digest"):])}
+    ha1 = md5(f"{USERNAME}:{REALM}:{PASSWORD}")
+    ha2 = md5(f"REGISTER:{params['uri']}")
+    expected = md5(f"{ha1}:{NONCE}:{params['nc']}:{params['cnonce']}:auth:{ha2}")
+    return params["nonce"] == NONCE and params["response"] == expected
+
+def registrar(request, count):
+    if not valid_digest(request):
+        return [respond(request, 401, "Unauthorized",
+                        ("WWW-Authenticate", f'Digest realm="{REALM}", nonce="{NONCE}", qop="auth"'))]
+    return [respond(request, 200, "OK", ("Contact", f"{request.get('Contact')};expires=120"))]
+
+def test_register_answers_401_and_reuses_nonce(fast_timers):
+    async def scenario():
+        stub, layer = await start_pair(registrar)
+        host, port = stub.addr
+        manager = SipRegistrationManager(layer, host, port, USERNAME, DigestAuth(USERNAME, PASSWORD))
+        try:
+            assert await manager.register_once()
+            assert manager.is_registered
+            assert manager.status()["expires_in"] <= 120
+            # Primeiro REGISTER desafiado, segundo com o digest
+            assert len(stub.requests("REGISTER")) == 2
+
+            # Renovação reaproveita o nonce: sem novo 401
+            assert await manager.register_once()
+            registers = stub.requests("REGISTER")
+            assert len(registers) == 3
+            assert "nc=00000002" in registers[-1].get("Authorization")
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+def test_register_fails_on_rejected_credentials(fast_timers):
+    async def scenario():
+        stub, layer = await start_pair(registrar)
+        host, port = stub.addr
+        manager = SipRegistrationManager(layer, host, port, USERNAME, DigestAuth(USERNAME, "wrong"))
+        try:
+            assert not await manager.register_once()
+            assert manager.state == "failed"
+            assert "401" in manager.last_error
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
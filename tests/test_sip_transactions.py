@@ -0,0 +1,202 @@
+import asyncio
+
+import pytest
+
+import sip_transactions
+from sip_transactions import SipMessage, SipTimeoutError, build_request
+from conftest import respond, start_pair
+
+def make_request(layer, method: str, cseq: int = 1, call_id: str = "test-call@127.0.0.1") -> SipMessage:
+    return build_request(method, "sip:100@127.0.0.1", [
+        ("Via", layer.via()),
+        ("Max-Forwards", "70"),
+        ("From", "<sip:agent@127.0.0.1>;tag=abc"),
+        ("To", "<sip:100@127.0.0.1>"),
+        ("Call-ID", call_id),
+        ("CSeq", f"{cseq} {method}"),
+    ])
+
+def gaps(stub, method: str):
+    times = [at for at, message in stub.received if message.method == method]
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+def test_response_matched_by_branch_and_cseq(fast_timers):
+    async def scenario():
+        stub, layer = await start_pair(lambda request, count: [respond(request, 200, "OK")])
+        try:
+            response = await layer.request(make_request(layer, "OPTIONS"), stub.addr)
+            assert response.status_code == 200
+            assert response.cseq == (1, "OPTIONS")
+            assert layer.stats["unmatched_responses"] == 0
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+def test_response_with_other_cseq_method_or_call_id_is_ignored(fast_timers):
+    def responder(request, count):
+        wrong_method = respond(request, 200, "OK")
+        wrong_method.headers = [(k, "1 REGISTER" if k == "CSeq" else v) for k, v in wrong_method.headers]
+        wrong_call = respond(request, 200, "OK")
+        wrong_call.headers = [(k, "other@127.0.0.1" if k == "Call-ID" else v) for k, v in wrong_call.headers]
+        return [wrong_method, wrong_call] if count == 1 else [respond(request, 200, "OK")]
+
+    async def scenario():
+        stub, layer = await start_pair(responder)
+        try:
+            response = await layer.request(make_request(layer, "OPTIONS"), stub.addr)
+            # Só a retransmissão recebeu a resposta certa
+            assert response.status_code == 200
+            assert len(stub.requests("OPTIONS")) == 2
+            assert layer.stats["unmatched_responses"] == 2
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+def test_malformed_cseq_is_dropped(fast_timers):
+    def responder(request, count):
+        if count > 1:
+            return [respond(request, 200, "OK")]
+        broken = respond(request, 200, "OK")
+        broken.headers = [(k, "abc OPTIONS" if k == "CSeq" else v) for k, v in broken.headers]
+        return [broken]
+
+    async def scenario():
+        stub, layer = await start_pair(responder)
+        try:
+            response = await layer.request(make_request(layer, "OPTIONS"), stub.addr)
+            assert response.cseq == (1, "OPTIONS")
+            assert layer.stats["malformed"] == 1
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+def test_timer_e_doubles_up_to_t2(fast_timers):
+    async def scenario():
+        stub, layer = await start_pair(
+            lambda request, count: [respond(request, 200, "OK")] if count == 6 else []
+        )
+        try:
+            response = await layer.request(make_request(layer, "REGISTER"), stub.addr)
+            assert response.status_code == 200
+            intervals = gaps(stub, "REGISTER")
+            assert len(intervals) == 5
+            # T1, 2*T1, 4*T1 = T2, depois fixo em T2
+            assert intervals[1] > intervals[0] * 1.5
+            assert intervals[2] > intervals[1] * 1.5
+            assert max(intervals) < sip_transactions.T2 * 1.6
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+def test_timer_a_doubles_invite_until_provisional(fast_timers):
+    async def scenario():
+        stub, layer = await start_pair(
+            lambda request, count: [respond(request, 100, "Trying")] if count == 5 else []
+        )
+        try:
+            transaction = layer.send_request(make_request(layer, "INVITE"), stub.addr)
+            first = await transaction.first_response
+            assert first.status_code == 100
+            intervals = gaps(stub, "INVITE")
+            # Timer A dobra sem o teto T2
+            assert intervals[3] > sip_transactions.T2 * 1.5
+            # A resposta provisória para as retransmissões
+            await asyncio.sleep(0.3)
+            assert len(stub.requests("INVITE")) == 5
+            assert transaction.state == "proceeding"
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("method", ["OPTIONS", "INVITE"])
+def test_timer_b_f_timeout(fast_timers, method):
+    async def scenario():
+        stub, layer = await start_pair()
+        try:
+            with pytest.raises(SipTimeoutError):
+                await layer.request(make_request(layer, method), stub.addr)
+            assert layer.stats["timeouts"] == 1
+            assert layer.metrics()["in_flight"] == 0
+            assert len(stub.requests(method)) > 1
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+def ringing_forever(answer_cancel_with_487: bool):
+    """Stub que só responde 180 ao INVITE; o CANCEL recebe 200 (e, opcionalmente, o 487)"""
+    invites = []
+
+    def responder(request, count):
+        if request.method == "INVITE":
+            invites.append(request)
+            return [respond(request, 180, "Ringing")]
+        if request.method == "CANCEL":
+            responses = [respond(request, 200, "OK")]
+            if answer_cancel_with_487:
+                responses.append(respond(invites[0], 487, "Request Terminated"))
+            return responses
+        return []
+    return responder
+
+def test_invite_without_final_response_is_cancelled(fast_timers):
+    async def scenario():
+        stub, layer = await start_pair(ringing_forever(answer_cancel_with_487=True))
+        try:
+            invite = make_request(layer, "INVITE")
+            transaction = layer.send_request(invite, stub.addr)
+            response = await asyncio.wait_for(transaction.final_response, 2)
+            assert response.status_code == 487
+            cancel = stub.requests("CANCEL")[0]
+            # Mesmo branch e número do CSeq do INVITE cancelado
+            assert cancel.branch == invite.branch
+            assert cancel.cseq == (1, "CANCEL")
+            assert layer.stats["invite_timeouts"] == 1
+            assert layer.stats["cancels"] == 1
+            await asyncio.sleep(0.1)
+            assert len(stub.requests("ACK")) == 1
+            assert layer.metrics()["in_flight"] == 0
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+def test_cancelled_invite_without_487_is_dropped(fast_timers):
+    async def scenario():
+        stub, layer = await start_pair(ringing_forever(answer_cancel_with_487=False))
+        try:
+            transaction = layer.send_request(make_request(layer, "INVITE"), stub.addr)
+            with pytest.raises(SipTimeoutError):
+                await asyncio.wait_for(transaction.final_response, 2)
+            assert len(stub.requests("CANCEL")) == 1
+            assert transaction.state == "terminated"
+            await asyncio.sleep(0.1)
+            assert layer.metrics()["in_flight"] == 0
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
+
+def test_cancel_waits_for_provisional(fast_timers):
+    async def scenario():
+        stub, layer = await start_pair(
+            lambda request, count: [respond(request, 180, "Ringing")] if count == 3 else []
+        )
+        try:
+            transaction = layer.send_request(make_request(layer, "INVITE"), stub.addr)
+            assert layer.cancel(transaction)
+            await asyncio.sleep(0.01)
+            # Sem provisória ainda: o CANCEL fica pendente
+            assert not stub.requests("CANCEL")
+            await transaction.first_response
+            await asyncio.sleep(0.02)
+            assert len(stub.requests("CANCEL")) == 1
+        finally:
+            layer.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from streaming_stt import (
+    BYTES_PER_MS, WAV_HEADER_SIZE, AssemblyAIRealtimeSTT, StreamingSTT, transcribe_while_recording
+)
+from fake_realtime_stt import FakeRealtimeSTT, silence_frame, word_frame
+
+FRAME_MS = 10
+FRAME_SIZE = FRAME_MS * BYTES_PER_MS
+
+def fake_record(path: str, frames, stopped: asyncio.Event, max_silence: float = 3.0):
+    """Imita o RECORD FILE: grava os quadros e depois silêncio até o '#' ou o timeout"""
+    async def record():
+        with open(path, "wb") as f:
+            f.write(bytes(WAV_HEADER_SIZE))
+            for frame in frames:
+                f.write(frame)
+                f.flush()
+                await asyncio.sleep(0.005)
+            deadline = time.monotonic() + max_silence
+            while not stopped.is_set():
+                if time.monotonic() >= deadline:
+                    return "200 result=0 (timeout)"
+                f.write(silence_frame(FRAME_SIZE))
+                f.flush()
+                await asyncio.sleep(0.01)
+        return "200 result=35 (dtmf)"
+    return record()
+
+def test_streaming_stt_is_abstract():
+    with pytest.raises(TypeError):
+        StreamingSTT()
+
+def test_pause_mid_sentence_does_not_truncate(tmp_path):
+    """Sem stop_recording o áudio segue até a gravação terminar: as duas frases chegam"""
+    frames = [word_frame("quero", FRAME_SIZE), silence_frame(FRAME_SIZE),
+              word_frame("pizza", FRAME_SIZE), silence_frame(FRAME_SIZE)]
+
+    async def scenario():
+        server = await FakeRealtimeSTT().start()
+        try:
+            stt = AssemblyAIRealtimeSTT("", url=server.url)
+            audio_file = str(tmp_path / "turn.wav")
+            result, text = await transcribe_while_recording(
+                stt, fake_record(audio_file, frames, asyncio.Event(), max_silence=0.2), audio_file, FRAME_MS
+            )
+            assert "timeout" in result
+            assert text == "quero pizza"
+            assert server.terminated
+            assert server.configs == [{"end_utterance_silence_threshold": stt.end_utterance_silence_ms}]
+        finally:
+            await server.close()
+
+    asyncio.run(scenario())
+
+def test_endpoint_stops_recording(tmp_path):
+    """O fim de fala do STT encerra a gravação uma única vez, sem esperar o silêncio"""
+    frames = [word_frame("quero", FRAME_SIZE), word_frame("pizza", FRAME_SIZE), silence_frame(FRAME_SIZE)]
+
+    async def scenario():
+        server = await FakeRealtimeSTT().start()
+        stopped = asyncio.Event()
+        stops = []
+
+        async def stop_recording():
+            stops.append(time.monotonic())
+            stopped.set()
+
+        try:
+            stt = AssemblyAIRealtimeSTT("", url=server.url)
+            audio_file = str(tmp_path / "turn.wav")
+            started = time.monotonic()
+            result, text = await transcribe_while_recording(
+                stt, fake_record(audio_file, frames, stopped), audio_file, FRAME_MS, stop_recording=stop_recording
+            )
+            assert "dtmf" in result
+            assert text == "quero pizza"
+            assert len(stops) == 1
+            assert time.monotonic() - started < 1.5
+        finally:
+            await server.close()
+
+    asyncio.run(scenario())
+
+def test_failed_stop_falls_back_to_silence(tmp_path):
+    frames = [word_frame("oi", FRAME_SIZE), silence_frame(FRAME_SIZE)]
+
+    async def scenario():
+        server = await FakeRealtimeSTT().start()
+
+        async def stop_recording():
+            raise ConnectionError("AMI indisponível")
+
+        try:
+            stt = AssemblyAIRealtimeSTT("", url=server.url)
+            audio_file = str(tmp_path / "turn.wav")
+            result, text = await transcribe_while_recording(
+                stt, fake_record(audio_file, frames, asyncio.Event(), max_silence=0.2), audio_file, FRAME_MS,
+                stop_recording=stop_recording
+            )
+            assert "timeout" in result
+            assert text == "oi"
+        finally:
+            await server.close()
+
+    asyncio.run(scenario())
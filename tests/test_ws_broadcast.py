@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from ws_broadcast import BroadcastHub
+
+class FakeWebSocket:
+    """Só o que o hub usa do WebSocket do Starlette"""
+
+    def __init__(self, query_params=None, send_delay: float = 0.0):
+        self.query_params = query_params or {}
+        self.send_delay = send_delay
+        self.sent = []
+        self.accepted = False
+        self.closed = False
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(json.loads(text))
+
+    async def close(self):
+        self.closed = True
+
+def test_events_filtered_by_topic_and_call():
+    async def scenario():
+        hub = BroadcastHub(queue_size=10)
+        everything, sip_only = FakeWebSocket(), FakeWebSocket({"topics": "sip_call"})
+        one_call = FakeWebSocket({"call_id": "c1,c2"})
+        for websocket in (everything, sip_only, one_call):
+            await hub.connect(websocket)
+
+        assert hub.broadcast({"type": "sip_call", "call_id": "c1"}) == 3
+        assert hub.broadcast({"type": "agent_started"}) == 1
+        assert hub.broadcast({"type": "sip_call", "call_id": "c9"}) == 2
+        await asyncio.sleep(0.01)
+        assert len(everything.sent) == 3
+        assert [event["call_id"] for event in sip_only.sent] == ["c1", "c9"]
+        assert one_call.sent == [{"type": "sip_call", "call_id": "c1"}]
+        await hub.aclose()
+        assert everything.closed and not hub.clients
+
+    asyncio.run(scenario())
+
+def test_subscriptions_change_at_runtime():
+    async def scenario():
+        hub = BroadcastHub()
+        client = await hub.connect(FakeWebSocket())
+        client.subscribe(topics=["sip_call"])
+        assert not client.wants("agent_started", None)
+        client.unsubscribe(topics="sip_call")
+        assert client.wants("agent_started", None)
+        await hub.aclose()
+
+    asyncio.run(scenario())
+
+def test_slow_client_drops_oldest_without_delaying_others():
+    async def scenario():
+        hub = BroadcastHub(queue_size=2, slow_client_policy="drop_oldest")
+        fast, slow = FakeWebSocket(), FakeWebSocket(send_delay=10)
+        await hub.connect(fast)
+        slow_client = await hub.connect(slow)
+        await asyncio.sleep(0)
+        for number in range(5):
+            hub.broadcast({"type": "tick", "n": number})
+            # Tempo para o painel rápido esvaziar a fila entre eventos
+            await asyncio.sleep(0.005)
+        assert [event["n"] for event in fast.sent] == [0, 1, 2, 3, 4]
+        # O primeiro está em envio; da fila sobram os dois mais recentes
+        assert slow_client.dropped == 2
+        assert [json.loads(text)["n"] for text in list(slow_client.queue._queue)] == [3, 4]
+        await hub.aclose()
+
+    asyncio.run(scenario())
+
+def test_slow_client_disconnected_by_policy():
+    async def scenario():
+        hub = BroadcastHub(queue_size=1, slow_client_policy="disconnect")
+        slow = FakeWebSocket(send_delay=10)
+        await hub.connect(slow)
+        await asyncio.sleep(0)
+        for number in range(3):
+            hub.broadcast({"type": "tick", "n": number})
+        await asyncio.sleep(0.01)
+        assert not hub.clients
+        assert slow.closed
+
+    asyncio.run(scenario())
+
+def test_stuck_send_times_out():
+    async def scenario():
+        hub = BroadcastHub(send_timeout=0.02)
+        stuck = FakeWebSocket(send_delay=10)
+        await hub.connect(stuck)
+        hub.broadcast({"type": "tick"})
+        await asyncio.sleep(0.1)
+        assert not hub.clients
+        assert stuck.closed
+
+    asyncio.run(scenario())
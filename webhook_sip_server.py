@@ -6,17 +6,18 @@ Usando APIs externas para SIP + Groq AI
 """
 
 import os
-import json
 import asyncio
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Request
+from typing import Dict, Optional, Any
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import requests
+from groq_ai import GroqAI
+from ws_broadcast import get_broadcast_hub
+from contextlib import asynccontextmanager
 import uuid
 
 # Configurar logging
@@ -45,7 +46,7 @@ class WebhookData(BaseModel):
 
 # Gerenciador de chamadas ativas
 active_calls: Dict[str, CallStatus] = {}
-websocket_connections: List[WebSocket] = []
+ws_hub = get_broadcast_hub()
 
 class SIPWebhookManager:
     """Gerenciador de webhooks SIP"""
@@ -100,74 +101,24 @@ class SIPWebhookManager:
             logger.error(f"❌ Erro ao encerrar chamada: {e}")
             return False
 
-class GroqAI:
-    """Cliente para Groq AI"""
-    
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://api.groq.com/openai/v1"
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-    
-    def generate_response(self, text: str, context: Dict = None) -> str:
-        """Gerar resposta usando Groq AI"""
-        try:
-            if not self.api_key:
-                return "IA não configurada. Configure GROQ_API_KEY."
-            
-            messages = [
-                {
-                    "role": "system",
-                    "content": """Você é um assistente de IA para chamadas telefônicas. 
-                    Seja conciso, educado e útil. Responda em português brasileiro.
-                    Mantenha respostas curtas (máximo 2 frases) para chamadas telefônicas."""
-                },
-                {
-                    "role": "user", 
-                    "content": text
-                }
-            ]
-            
-            if context:
-                messages[0]["content"] += f"\nContexto da chamada: {json.dumps(context, ensure_ascii=False)}"
-            
-            payload = {
-                "model": "llama3-8b-8192",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 150,
-                "stream": False
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"].strip()
-            else:
-                logger.error(f"Erro Groq API: {response.status_code} - {response.text}")
-                return "Desculpe, não consegui processar sua solicitação no momento."
-                
-        except Exception as e:
-            logger.error(f"Erro ao gerar resposta Groq: {e}")
-            return "Desculpe, ocorreu um erro técnico."
-
 # Instâncias
 sip_manager = SIPWebhookManager()
 groq_ai = GroqAI(os.getenv("GROQ_API_KEY", ""))
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Gerenciar ciclo de vida da aplicação"""
+    yield
+    # Shutdown: fechar o pool de conexões do Groq
+    await groq_ai.aclose()
+    await ws_hub.aclose()
+
 # Criar aplicação FastAPI
 app = FastAPI(
     title="Webhook SIP AI Voice Server",
     description="Sistema SIP via Webhooks + IA (Railway compatível)",
-    version="3.0.0"
+    version="3.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -208,6 +159,7 @@ async def health_check():
         "sip_ready": True,
         "ai_ready": bool(os.getenv("GROQ_API_KEY")),
         "active_calls": len(active_calls),
+        "websocket": ws_hub.status(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -365,24 +317,12 @@ async def sip_webhook(request: Request):
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket para notificações em tempo real"""
-    await websocket.accept()
-    websocket_connections.append(websocket)
-    
-    try:
-        while True:
-            # Manter conexão viva
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        websocket_connections.remove(websocket)
+    # Cada cliente tem fila e tarefa de escrita próprias; assinaturas por ?topics= e ?call_id=
+    await ws_hub.serve(websocket)
 
 async def notify_websocket_clients(message: Dict[str, Any]):
-    """Notificar todos os clientes WebSocket"""
-    if websocket_connections:
-        for websocket in websocket_connections.copy():
-            try:
-                await websocket.send_json(message)
-            except:
-                websocket_connections.remove(websocket)
+    """Notificar os clientes WebSocket (só enfileira; um painel lento não atrasa os demais)"""
+    ws_hub.broadcast(message)
 
 @app.get("/sip/config")
 async def sip_config():
@@ -406,7 +346,7 @@ async def chat_with_ai(message: dict):
         if not user_message:
             raise HTTPException(status_code=400, detail="Mensagem não fornecida")
         
-        response = groq_ai.generate_response(user_message, context)
+        response = await groq_ai.generate_response(user_message, context)
         
         return {
             "success": True,
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Difusão de eventos para os painéis via WebSocket
+Cada evento é serializado em JSON uma única vez e apenas enfileirado para
+cada cliente; uma tarefa de escrita por cliente envia a sua fila. Um painel
+lento não atrasa os demais: com a fila cheia o evento mais antigo é
+descartado (ou o cliente é desconectado, conforme a política). Clientes
+podem assinar só alguns tipos de evento (tópicos) ou algumas chamadas
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger("ws_broadcast")
+
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "100"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# "drop_oldest" descarta o evento mais antigo da fila cheia; "disconnect" derruba o cliente lento
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest").lower()
+
+# Totais do processo
+WS_BROADCAST_STATS = {
+    "events": 0,
+    "deliveries": 0,
+    "sent": 0,
+    "dropped": 0,
+    "slow_disconnects": 0,
+    "send_errors": 0,
+    "fanout_ms": 0.0,
+}
+
+def _names(value: Any) -> Set[str]:
+    """Lista ou texto separado por vírgulas -> conjunto de nomes"""
+    if not value:
+        return set()
+    if isinstance(value, str):
+        value = value.split(",")
+    return {str(item).strip() for item in value if str(item).strip()}
+
+class WebSocketClient:
+    """Um painel conectado: fila própria, tarefa de escrita e assinaturas"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max(1, queue_size))
+        # Vazios = recebe tudo
+        self.topics: Set[str] = set()
+        self.call_ids: Set[str] = set()
+        self.dropped = 0
+        self.closed = False
+        self.writer: Optional[asyncio.Task] = None
+
+    def wants(self, topic: str, call_id: Optional[str]) -> bool:
+        if self.topics and topic not in self.topics:
+            return False
+        if self.call_ids and call_id not in self.call_ids:
+            return False
+        return True
+
+    def subscribe(self, topics: Iterable[str] = (), call_ids: Iterable[str] = ()):
+        self.topics |= _names(topics)
+        self.call_ids |= _names(call_ids)
+
+    def unsubscribe(self, topics: Iterable[str] = (), call_ids: Iterable[str] = ()):
+        self.topics -= _names(topics)
+        self.call_ids -= _names(call_ids)
+
+class BroadcastHub:
+    """Clientes WebSocket do processo e a difusão de eventos entre eles"""
+
+    def __init__(
+        self,
+        queue_size: int = WS_CLIENT_QUEUE_SIZE,
+        send_timeout: float = WS_SEND_TIMEOUT,
+        slow_client_policy: str = WS_SLOW_CLIENT_POLICY,
+    ):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_client_policy = slow_client_policy
+        self.clients: Set[WebSocketClient] = set()
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    async def connect(self, websocket: WebSocket) -> WebSocketClient:
+        """Aceita a conexão; assinaturas iniciais vêm de ?topics=a,b&call_id=x,y"""
+        await websocket.accept()
+        client = WebSocketClient(websocket, self.queue_size)
+        client.subscribe(websocket.query_params.get("topics"), websocket.query_params.get("call_id"))
+        client.writer = asyncio.create_task(self._write(client))
+        self.clients.add(client)
+        logger.info(f"🔌 Painel WebSocket conectado ({len(self.clients)} clientes)")
+        return client
+
+    def _detach(self, client: WebSocketClient):
+        """Tira o cliente da difusão e para sua escrita (síncrono)"""
+        client.closed = True
+        self.clients.discard(client)
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    async def _close(self, client: WebSocketClient):
+        try:
+            await client.websocket.close()
+        except Exception:
+            # Conexão já encerrada pelo outro lado
+            pass
+        logger.info(f"🔌 Painel WebSocket desconectado ({len(self.clients)} clientes)")
+
+    async def disconnect(self, client: WebSocketClient):
+        if client.closed:
+            return
+        self._detach(client)
+        await self._close(client)
+
+    async def serve(self, websocket: WebSocket):
+        """Atende um endpoint /ws até o cliente sair
+
+        Mensagens do cliente: {"action": "subscribe"|"unsubscribe", "topics": [...], "call_ids": [...]}
+        """
+        client = await self.connect(websocket)
+        try:
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    command = json.loads(text)
+                except ValueError:
+                    # Keep-alive ou texto livre: ignorado
+                    continue
+                if not isinstance(command, dict):
+                    continue
+                if command.get("action") == "subscribe":
+                    client.subscribe(command.get("topics"), command.get("call_ids"))
+                elif command.get("action") == "unsubscribe":
+                    client.unsubscribe(command.get("topics"), command.get("call_ids"))
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.warning(f"Erro na conexão WebSocket: {e}")
+        finally:
+            await self.disconnect(client)
+
+    def broadcast(self, message: Dict[str, Any]) -> int:
+        """Enfileira o evento para os clientes interessados (não bloqueia); devolve quantos"""
+        started = time.perf_counter()
+        WS_BROADCAST_STATS["events"] += 1
+        topic = str(message.get("type", ""))
+        call_id = message.get("call_id")
+        call_id = str(call_id) if call_id is not None else None
+        # Mesmo formato do WebSocket.send_json, serializado uma única vez
+        text = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+        delivered = 0
+        for client in list(self.clients):
+            if not client.wants(topic, call_id):
+                continue
+            if client.queue.full():
+                if self.slow_client_policy == "disconnect":
+                    WS_BROADCAST_STATS["slow_disconnects"] += 1
+                    logger.warning("🐢 Painel WebSocket lento desconectado (fila cheia)")
+                    self._detach(client)
+                    asyncio.create_task(self._close(client))
+                    continue
+                client.queue.get_nowait()
+                client.dropped += 1
+                WS_BROADCAST_STATS["dropped"] += 1
+            client.queue.put_nowait(text)
+            delivered += 1
+
+        WS_BROADCAST_STATS["deliveries"] += delivered
+        WS_BROADCAST_STATS["fanout_ms"] += (time.perf_counter() - started) * 1000
+        return delivered
+
+    async def _write(self, client: WebSocketClient):
+        """Envia a fila do cliente; um envio travado além do timeout derruba só ele"""
+        try:
+            while True:
+                text = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(text), self.send_timeout)
+                WS_BROADCAST_STATS["sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            WS_BROADCAST_STATS["send_errors"] += 1
+            logger.info(f"Falha ao enviar para painel WebSocket: {e!r}")
+            await self.disconnect(client)
+
+    async def aclose(self):
+        """Desconecta todos os clientes (shutdown)"""
+        for client in list(self.clients):
+            await self.disconnect(client)
+
+    def status(self) -> Dict[str, Any]:
+        events = WS_BROADCAST_STATS["events"]
+        return {
+            "clients": len(self.clients),
+            "queued": sum(client.queue.qsize() for client in self.clients),
+            "slow_client_policy": self.slow_client_policy,
+            **WS_BROADCAST_STATS,
+            "fanout_ms": round(WS_BROADCAST_STATS["fanout_ms"], 3),
+            "avg_fanout_us": round(WS_BROADCAST_STATS["fanout_ms"] * 1000 / events, 1) if events else 0.0,
+        }
+
+_hub: Optional[BroadcastHub] = None
+
+def get_broadcast_hub() -> BroadcastHub:
+    """Retorna o hub compartilhado pelo processo"""
+    global _hub
+    if _hub is None:
+        _hub = BroadcastHub()
+    return _hub